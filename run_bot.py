@@ -1,5 +1,8 @@
+import asyncio
 import logging
 from src.botservice import BotService
+from src.async_botservice import AsyncBotService
+from src.config import BOT_ASYNC_MODE
 
 def main():
     # Configure logging
@@ -9,6 +12,10 @@ def main():
     )
     logger = logging.getLogger(__name__)
 
+    if BOT_ASYNC_MODE:
+        run_async(logger)
+        return
+
     # Create and start the bot service
     bot_service = BotService()
 
@@ -26,5 +33,17 @@ def main():
         bot_service.stop()
         logger.info("Bot service has been stopped.")
 
+def run_async(logger):
+    # All I/O shares one event loop; sync-only plugins run in an executor
+    bot_service = AsyncBotService()
+    try:
+        logger.info("Starting the bot service in async mode...")
+        logger.info("Bot is now running. Press CTRL+C to stop.")
+        asyncio.run(bot_service.run_forever())
+    except KeyboardInterrupt:
+        logger.info("Received interrupt. Shutting down...")
+    finally:
+        logger.info("Bot service has been stopped.")
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
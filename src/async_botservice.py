@@ -0,0 +1,176 @@
+import asyncio
+import logging
+import time
+from src.async_mattermost_client import AsyncMattermostClient
+from src.botservice import STREAM_PLACEHOLDER
+from src.openai_client import AdmissionDenied, StreamInterrupted, request_context
+from src.command_handler import CommandHandler
+from src.dispatcher import AsyncEventDispatcher
+from src.events import event_post
+from src.outbox import AsyncOutbox
+from src.plugins import get_plugins
+from src.config import (
+    BOT_WORKER_THREADS,
+    BOT_EVENT_QUEUE_SIZE,
+    BOT_STREAM_RESPONSES,
+    BOT_STREAM_UPDATE_INTERVAL,
+    BOT_STREAM_MIN_CHARS
+)
+
+logger = logging.getLogger(__name__)
+
+class AsyncBotService:
+    """
+    asyncio version of `BotService`. The Mattermost client, the OpenAI calls and
+    the plugins all run on one event loop; sync-only plugins run in an executor.
+    """
+
+    def __init__(self):
+        self.mm_client = AsyncMattermostClient()
+        self.command_handler = CommandHandler()
+        self.plugins = get_plugins()
+        for plugin in self.plugins.values():
+            plugin.async_mm_client = self.mm_client
+        for plugin in self.command_handler.plugins.values():
+            plugin.async_mm_client = self.mm_client
+        # Handle events concurrently, in order per channel/thread
+        self.dispatcher = AsyncEventDispatcher(
+            self.handle_message,
+            self.get_event_key,
+            max_concurrency=BOT_WORKER_THREADS,
+            max_queue_size=BOT_EVENT_QUEUE_SIZE
+        )
+        # Replies are queued and delivered in the background
+        self.outbox = AsyncOutbox(self.mm_client)
+
+    async def start(self):
+        logger.info("Starting AsyncBotService...")
+        self.outbox.start()
+        # Listen first, so posts arriving while connecting aren't missed
+        self.mm_client.add_message_listener(self.dispatcher.dispatch)
+        await self.mm_client.connect()
+        logger.info("AsyncBotService started successfully.")
+
+    def get_event_key(self, event_data):
+        """
+        Returns the key used to order events: the thread root if the post is a
+        reply, otherwise its channel.
+        """
+        post = event_post(event_data)
+        if post is None:
+            return None
+        return post.root_id or post.channel_id
+
+    async def handle_message(self, event_data):
+        post = event_post(event_data)
+        if post is not None:
+            channel_id = post.channel_id
+            user_id = post.user_id
+            message = post.message.strip()
+            file_ids = post.file_ids
+
+            # Ignore messages from the bot itself
+            if user_id == self.mm_client.bot_id:
+                return
+
+            # OpenAI calls made for this message are rate limited for its user and channel
+            with request_context(user_id, channel_id):
+                try:
+                    # Check if the message is a command
+                    if message.startswith('/'):
+                        await self.handle_command(channel_id, user_id, message, file_ids)
+                    else:
+                        await self.handle_chat(channel_id, user_id, message)
+                except AdmissionDenied as e:
+                    logger.warning(f"Refused message of user {user_id} in channel {channel_id}: rate limited")
+                    await self.outbox.post(channel_id, str(e))
+
+    async def handle_command(self, channel_id, user_id, message, file_ids):
+        command, *args = message[1:].split()
+
+        # Pass every attached file to the command, in attachment order
+        args.extend(file_ids)
+
+        response = await self.command_handler.execute_async(command, args, channel_id, user_id)
+        await self.post_response(channel_id, response)
+
+    async def post_response(self, channel_id, response):
+        """
+        Queues the reply of a plugin in the outbox.
+        :param response: The message, a (message, file_ids) tuple, or None if
+            the plugin has nothing (more) to post.
+        """
+        if isinstance(response, tuple):
+            message, file_ids = response
+            await self.outbox.post(channel_id, message, file_ids=file_ids)
+        elif response:
+            await self.outbox.post(channel_id, response)
+
+    async def handle_chat(self, channel_id, user_id, message):
+        chat_plugin = self.plugins.get('chat')
+        if chat_plugin and BOT_STREAM_RESPONSES:
+            await self.stream_response(channel_id, chat_plugin.execute_stream_async([message], channel_id, user_id))
+        elif chat_plugin:
+            response = await chat_plugin.execute_async([message], channel_id, user_id)
+            if response:
+                await self.outbox.post(channel_id, response)
+        else:
+            logger.warning("Chat plugin not found. Unable to process chat message.")
+
+    async def stream_response(self, channel_id, chunks):
+        """
+        Async version of `BotService.stream_response`.
+        :param chunks: Async iterable of reply text chunks.
+        """
+        started = time.monotonic()
+        post = await self.mm_client.post_message(channel_id, STREAM_PLACEHOLDER)
+        post_id = post.get('id') if post else None
+
+        text = ""
+        posted_text = ""
+        last_update = started
+        try:
+            async for chunk in chunks:
+                text += chunk
+                now = time.monotonic()
+                if (post_id and text.strip()
+                        and now - last_update >= BOT_STREAM_UPDATE_INTERVAL
+                        and len(text) - len(posted_text) >= BOT_STREAM_MIN_CHARS):
+                    if not posted_text:
+                        logger.info(f"First streamed update posted after {now - started:.2f}s")
+                    await self.mm_client.patch_post(post_id, text)
+                    posted_text = text
+                    last_update = now
+        except (AdmissionDenied, StreamInterrupted) as e:
+            # Replace the placeholder, or the incomplete reply, with the reason
+            text = str(e)
+
+        text = text.strip()
+        if not text:
+            return
+        if post_id:
+            if text != posted_text:
+                await self.mm_client.patch_post(post_id, text)
+        else:
+            # The placeholder could not be posted, fall back to a single post
+            await self.outbox.post(channel_id, text)
+        logger.debug(f"Streamed reply completed in {time.monotonic() - started:.2f}s")
+
+    async def stop(self):
+        logger.info("Stopping AsyncBotService...")
+        # Stop taking new events, but keep the HTTP session open until the
+        # last handled messages and their replies are through
+        await self.mm_client.disconnect()
+        await self.dispatcher.stop(timeout=30)
+        await self.outbox.stop(timeout=30)
+        for plugin in self.plugins.values():
+            plugin.cleanup()
+        await self.mm_client.close()
+        logger.info("AsyncBotService stopped successfully.")
+
+    async def run_forever(self):
+        await self.start()
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await self.stop()
@@ -0,0 +1,449 @@
+import asyncio
+import inspect
+import json
+import logging
+import uuid
+from collections import namedtuple
+import aiohttp
+from .config import (
+    MATTERMOST_URL,
+    MATTERMOST_TOKEN,
+    MATTERMOST_BOTNAME,
+    MATTERMOST_POOL_SIZE,
+    MATTERMOST_CONNECT_TIMEOUT,
+    MATTERMOST_READ_TIMEOUT,
+    MATTERMOST_RECONNECT_BASE_DELAY,
+    MATTERMOST_RECONNECT_MAX_DELAY,
+    MATTERMOST_READY_TIMEOUT,
+    MATTERMOST_CATCH_UP_MAX_AGE
+)
+from .multipart import encode_form, aiter_parts
+from .resilience import create_resilience, classify_status, parse_retry_after, Outcome, RequestRejected
+from .metadata_cache import create_metadata_cache
+from .events import wanted_frame
+from .reconnect import ReconnectBackoff, EventTracker, missed_post_events
+
+logger = logging.getLogger(__name__)
+
+# Status, headers and body of a REST response: decoded JSON for 2xx, text otherwise
+RestResponse = namedtuple('RestResponse', ['status', 'headers', 'body'])
+
+# Retries and circuit breakers of the REST calls
+resilience = create_resilience("Mattermost")
+# Users and file infos, kept fresh by WebSocket events
+metadata_cache = create_metadata_cache()
+
+def classify_response(response, error, idempotent):
+    """
+    Classifies the outcome of a REST request for `resilience`. Requests that
+    failed without a response are only sent again if they are idempotent.
+    """
+    if error is not None:
+        if isinstance(error, (aiohttp.ClientConnectionError, asyncio.TimeoutError)):
+            return Outcome(idempotent, True, None)
+        return Outcome(False, False, None)
+    status = response.status
+    retry_after = parse_retry_after(response.headers.get('Retry-After')) if status == 429 or status >= 500 else None
+    return classify_status(status, retry_after, idempotent)
+
+class AsyncMattermostClient:
+    """
+    asyncio counterpart of `MattermostClient`, built on aiohttp.
+
+    All REST calls and the WebSocket connection share one `aiohttp.ClientSession`,
+    which is created on first use inside the running event loop.
+    """
+
+    def __init__(self):
+        self.url = MATTERMOST_URL.rstrip('/')
+        self.token = MATTERMOST_TOKEN
+        self.botname = MATTERMOST_BOTNAME
+        self.headers = {
+            'Authorization': f'Bearer {self.token}',
+            'Content-Type': 'application/json'
+        }
+        self.bot_id = None
+        self.session = None
+        self.ws_task = None
+        self.catch_up_task = None
+        self.ready = asyncio.Event()
+        self.backoff = ReconnectBackoff(MATTERMOST_RECONNECT_BASE_DELAY, MATTERMOST_RECONNECT_MAX_DELAY)
+        self.tracker = EventTracker()
+        self.catch_up_since = None
+        self.message_listeners = []
+
+    def get_session(self):
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=MATTERMOST_POOL_SIZE),
+                timeout=aiohttp.ClientTimeout(sock_connect=MATTERMOST_CONNECT_TIMEOUT, sock_read=MATTERMOST_READ_TIMEOUT)
+            )
+        return self.session
+
+    async def connect(self, timeout=MATTERMOST_READY_TIMEOUT):
+        """
+        Starts listening and waits up to `timeout` seconds for the WebSocket
+        to be ready. If it isn't, the listener keeps trying.
+        :return: True if the connection is ready.
+        """
+        # Get bot ID first
+        me = await self.get_me()
+        self.bot_id = me.get('id') if me else None
+        if not self.bot_id:
+            logger.error("Failed to get bot ID. Check your token and permissions.")
+            return False
+        self.ws_task = asyncio.create_task(self.listen())
+        try:
+            await asyncio.wait_for(self.ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"WebSocket not ready after {timeout} seconds, still trying in the background.")
+            return False
+        logger.info("AsyncMattermostClient connected.")
+        return True
+
+    async def listen(self):
+        """
+        Reads events from the Mattermost WebSocket until the client is closed,
+        reconnecting with capped exponential backoff if the connection drops.
+        `ready` is set while a connection is up. After a reconnect, posts
+        created while disconnected are fetched and handled like live events;
+        events seen twice, by `seq` or post ID, are handled once.
+        """
+        api_url = self.url.replace('https', 'wss').replace('http', 'ws') + '/api/v4/websocket'
+        while True:
+            try:
+                logger.info(f"Connecting to Mattermost WebSocket at {api_url}")
+                async with self.get_session().ws_connect(
+                    api_url,
+                    headers={'Authorization': f'Bearer {self.token}'},
+                    heartbeat=30
+                ) as ws:
+                    logger.info("WebSocket connection opened.")
+                    self.catch_up_since = self.tracker.catch_up_since(MATTERMOST_CATCH_UP_MAX_AGE)
+                    self.tracker.connection_opened()
+                    async for msg in ws:
+                        if msg.type == aiohttp.WSMsgType.TEXT:
+                            await self.on_message(msg.data)
+                        elif msg.type == aiohttp.WSMsgType.ERROR:
+                            logger.error(f"WebSocket encountered error: {ws.exception()}")
+                            break
+                logger.info("WebSocket connection closed.")
+            except asyncio.CancelledError:
+                self.ready.clear()
+                raise
+            except Exception as e:
+                logger.error(f"WebSocket encountered error: {e}")
+            self.ready.clear()
+            delay = self.backoff.next_delay()
+            logger.info(f"Attempting to reconnect in {delay:.1f} seconds...")
+            await asyncio.sleep(delay)
+
+    async def on_message(self, message):
+        # Skip typing, status, reaction... events and the bot's own posts without decoding them
+        if not wanted_frame(message, self.bot_id):
+            return
+        try:
+            event_data = json.loads(message)
+        except json.JSONDecodeError as e:
+            logger.error(f"Failed to decode WebSocket message: {e}")
+            return
+        logger.debug(f"Received WebSocket event: {event_data.get('event')} (seq {event_data.get('seq')})")
+        if event_data.get('event') == 'hello':
+            self.on_ready()
+        await self.deliver(event_data)
+
+    def on_ready(self):
+        self.backoff.reset()
+        self.ready.set()
+        since, self.catch_up_since = self.catch_up_since, None
+        if since is not None:
+            # Keep reading live events while catching up
+            self.catch_up_task = asyncio.create_task(self.catch_up(since))
+
+    async def catch_up(self, since):
+        """
+        Handles the posts created since `since` (milliseconds since the epoch).
+        """
+        try:
+            events = await self.get_missed_post_events(since)
+        except Exception as e:
+            logger.error(f"Failed to fetch the posts missed while disconnected: {e}")
+            return
+        logger.info(f"Catching up on {len(events)} posts missed while disconnected.")
+        for event_data in events:
+            await self.deliver(event_data)
+
+    async def deliver(self, event_data):
+        """
+        Handles an event unless it was already handled.
+        """
+        if self.tracker.is_duplicate(event_data):
+            logger.debug(f"Ignoring duplicate WebSocket event: {event_data.get('event')} {event_data.get('seq')}")
+            return
+        await self.handle_websocket_event(event_data)
+
+    async def handle_websocket_event(self, event_data):
+        """
+        Handles incoming WebSocket events and notifies listeners based on event type.
+        :param event_data: The JSON-decoded event data from WebSocket.
+        """
+        event = event_data.get('event')
+        if event == 'posted':
+            await self.notify_listeners(event_data)
+        else:
+            metadata_cache.handle_event(event_data)
+
+    async def notify_listeners(self, data):
+        for listener in self.message_listeners:
+            result = listener(data)
+            if inspect.isawaitable(result):
+                await result
+
+    def add_message_listener(self, callback):
+        """
+        Adds a listener for incoming messages. The callback may be a plain
+        function or a coroutine function.
+        :param callback: Function to handle incoming messages.
+        """
+        self.message_listeners.append(callback)
+
+    async def request(self, method, path, endpoint, idempotent=False, retry=True, **kwargs):
+        """
+        Sends a REST request with retries and the endpoint's circuit breaker.
+        :param endpoint: Name of the endpoint, e.g. "POST /posts".
+        :param idempotent: Whether the request may be sent again after an error
+            that leaves it unknown whether it was processed.
+        :param retry: False to only apply the circuit breaker.
+        :return: `RestResponse` of the last attempt. Its error is raised
+            instead, and `CircuitOpenError` while the endpoint is failing.
+        """
+        async def attempt():
+            async with self.get_session().request(method, f"{self.url}{path}", headers=self.headers, **kwargs) as response:
+                body = await response.json() if response.status < 300 else await response.text()
+                return RestResponse(response.status, response.headers, body)
+
+        return await resilience.async_call(
+            endpoint, attempt, lambda response, error: classify_response(response, error, idempotent), retry
+        )
+
+    async def post_message(self, channel_id, message, root_id=None, file_ids=None, props=None, pending_post_id=None,
+                           retry=True, raise_errors=False):
+        """
+        Sends a message to a specified Mattermost channel.
+        :param channel_id: ID of the channel.
+        :param message: The message text.
+        :param root_id: (Optional) ID of the root post for threaded messages.
+        :param file_ids: (Optional) List of file IDs to attach.
+        :param props: (Optional) Additional properties for the post.
+        :param pending_post_id: (Optional) Client-side ID of the post. Mattermost
+            creates one post per ID, so sending the post again with the same ID
+            can't duplicate it. A new ID is used if not given.
+        :param retry: False to send the post once, for callers that retry themselves.
+        :param raise_errors: Raise `RequestRejected` with the status instead of
+            returning None if Mattermost rejects the post.
+        :return: JSON response from Mattermost.
+        """
+        payload = {
+            'channel_id': channel_id,
+            'message': message,
+            'pending_post_id': pending_post_id or uuid.uuid4().hex
+        }
+        if root_id:
+            payload['root_id'] = root_id
+        if file_ids:
+            payload['file_ids'] = file_ids
+        if props:
+            payload['props'] = props
+
+        logger.debug(f"Sending payload: {json.dumps(payload, indent=2)}")
+        # The pending post ID makes the request safe to retry
+        response = await self.request('POST', "/api/v4/posts", "POST /posts", idempotent=True, retry=retry, json=payload)
+        if response.status == 201:
+            logger.debug(f"Message posted successfully to channel {channel_id}.")
+            return response.body
+        if raise_errors:
+            raise RequestRejected("Mattermost", response.status, response.body,
+                                  parse_retry_after(response.headers.get('Retry-After')))
+        logger.error(f"Failed to post message: {response.status} - {response.body}")
+        return None
+
+    async def patch_post(self, post_id, message):
+        """
+        Updates the message of an existing post.
+        :param post_id: ID of the post to update.
+        :param message: The new message text.
+        :return: JSON response from Mattermost.
+        """
+        response = await self.request(
+            'PUT', f"/api/v4/posts/{post_id}/patch", "PUT /posts/patch", idempotent=True, json={'message': message}
+        )
+        if response.status == 200:
+            logger.debug(f"Post {post_id} updated successfully.")
+            return response.body
+        logger.error(f"Failed to update post {post_id}: {response.status} - {response.body}")
+        return None
+
+    async def get_json(self, path, description, endpoint):
+        response = await self.request('GET', path, endpoint, idempotent=True)
+        if response.status == 200:
+            return response.body
+        logger.error(f"Failed to get {description}: {response.status} - {response.body}")
+        return None
+
+    async def get_missed_post_events(self, since):
+        """
+        Async version of `MattermostClient.get_missed_post_events`.
+        """
+        channels = await self.get_json(f"/api/v4/users/{self.bot_id}/channels", "the channels of the bot", "GET /users/channels")
+        events = []
+        for channel in channels or []:
+            # Skip channels without new posts
+            if channel.get('last_post_at', 0) < since:
+                continue
+            posts = await self.get_json(
+                f"/api/v4/channels/{channel['id']}/posts?since={since}", f"the posts of channel {channel['id']}", "GET /channels/posts"
+            )
+            if posts is not None:
+                events.extend(missed_post_events(channel, posts, since, self.bot_id))
+        return events
+
+    async def get_user(self, user_id):
+        """
+        Retrieves user information by user ID, from the metadata cache if possible.
+        :param user_id: The Mattermost user ID.
+        :return: JSON response with user details.
+        """
+        return await metadata_cache.get_or_load_async('user', user_id, lambda: self.get_json(
+            f"/api/v4/users/{user_id}", f"user {user_id}", "GET /users/id"
+        ))
+
+    async def get_me(self):
+        """
+        Retrieves information about the bot itself, from the metadata cache if possible.
+        :return: JSON response with bot user details.
+        """
+        return await metadata_cache.get_or_load_async('me', self.token, lambda: self.get_json(
+            "/api/v4/users/me", "bot user info", "GET /users/me"
+        ))
+
+    async def get_file_info(self, file_id):
+        """
+        Retrieves the metadata of a file, from the metadata cache if possible.
+        """
+        return await metadata_cache.get_or_load_async('file_info', file_id, lambda: self.get_json(
+            f"/api/v4/files/{file_id}/info", "file info", "GET /files/info"
+        ))
+
+    async def iter_file(self, file_id, chunk_size=64 * 1024):
+        """
+        Streams the content of a file from Mattermost in chunks.
+        Raises `aiohttp.ClientResponseError` if the download fails.
+        """
+        async with self.get_session().get(f"{self.url}/api/v4/files/{file_id}", headers=self.headers) as response:
+            response.raise_for_status()
+            async for chunk in response.content.iter_chunked(chunk_size):
+                yield chunk
+
+    async def upload_file(self, channel_id, file_bytes, filename, mime_type='application/octet-stream'):
+        """
+        Uploads a file to a specified Mattermost channel.
+
+        :param channel_id: ID of the channel where the file will be uploaded.
+        :param file_bytes: Binary content of the file.
+        :param filename: Name of the file.
+        :param mime_type: MIME type of the file.
+        :return: file_id if successful, None otherwise.
+        """
+        file_ids = await self.upload_files(channel_id, [(filename, file_bytes, mime_type)])
+        return file_ids[0] if file_ids else None
+
+    async def upload_files(self, channel_id, files):
+        """
+        Uploads several files to a specified Mattermost channel in one multipart request.
+
+        :param channel_id: ID of the channel where the files will be uploaded.
+        :param files: List of (filename, file_bytes, mime_type) tuples.
+        :return: List of file_ids in the order of `files` if successful, None otherwise.
+        """
+        form = aiohttp.FormData()
+        form.add_field('channel_id', channel_id)
+        for filename, file_bytes, mime_type in files:
+            form.add_field('files', file_bytes, filename=filename, content_type=mime_type)
+        filenames = ", ".join(filename for filename, _, _ in files)
+
+        logger.debug(f"Uploading files {filenames} to channel {channel_id}.")
+        try:
+            async with self.get_session().post(
+                f"{self.url}/api/v4/files",
+                headers={'Authorization': f'Bearer {self.token}'},
+                data=form
+            ) as response:
+                if response.status == 201:
+                    json_response = await response.json()
+                    file_ids = [file_info.get('id') for file_info in json_response.get('file_infos')]
+                    logger.debug(f"Files uploaded successfully with IDs: {file_ids}")
+                    return file_ids
+                logger.error(f"Failed to upload files: {response.status} - {await response.text()}")
+                return None
+        except Exception as e:
+            logger.error(f"Exception during file upload: {e}")
+            return None
+
+    async def upload_streams(self, channel_id, files):
+        """
+        Async version of `MattermostClient.upload_streams`. The chunks of each
+        file may be an async iterable, such as an aiohttp response body.
+        """
+        content_type, parts, length = encode_form(
+            [('channel_id', channel_id)],
+            [('files', filename, chunks, mime_type, size) for filename, chunks, mime_type, size in files]
+        )
+        headers = {
+            'Authorization': f'Bearer {self.token}',
+            'Content-Type': content_type
+        }
+        if length is not None:
+            headers['Content-Length'] = str(length)
+        filenames = ", ".join(filename for filename, _, _, _ in files)
+
+        logger.debug(f"Streaming files {filenames} to channel {channel_id}.")
+        try:
+            async with self.get_session().post(
+                f"{self.url}/api/v4/files",
+                headers=headers,
+                data=aiter_parts(parts)
+            ) as response:
+                if response.status == 201:
+                    json_response = await response.json()
+                    file_ids = [file_info.get('id') for file_info in json_response.get('file_infos')]
+                    logger.debug(f"Files uploaded successfully with IDs: {file_ids}")
+                    return file_ids
+                logger.error(f"Failed to upload files: {response.status} - {await response.text()}")
+                return None
+        except Exception as e:
+            logger.error(f"Exception during file upload: {e}")
+            return None
+
+    async def disconnect(self):
+        """
+        Stops the WebSocket listener. The HTTP session stays open, so replies
+        still being sent can finish.
+        """
+        for task in (self.ws_task, self.catch_up_task):
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self.ws_task = None
+        self.catch_up_task = None
+
+    async def close(self):
+        """
+        Stops the WebSocket listener and closes the HTTP session.
+        """
+        await self.disconnect()
+        if self.session:
+            await self.session.close()
+        logger.info("AsyncMattermostClient closed.")
@@ -0,0 +1,261 @@
+import logging
+import string
+import tempfile
+import threading
+import time
+import wave
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# NumPy sample types of the PCM sample widths the wave module can read
+SAMPLE_DTYPES = {1: np.uint8, 2: np.int16, 4: np.int32}
+
+# Chunks are cut at the quietest 20 ms frame in the last seconds before the
+# target chunk length, so cuts fall between words where possible
+SILENCE_FRAME_SECONDS = 0.02
+SILENCE_SEARCH_SECONDS = 15
+
+# Speech recognition works on 16 kHz mono audio
+TARGET_SAMPLE_RATE = 16000
+# Length of the low-pass filter applied before downsampling, and the number of
+# output frames resampled at once
+LOWPASS_TAPS = 63
+RESAMPLE_BLOCK_FRAMES = 16000 * 30
+
+# Largest number of words looked at when removing text repeated by overlapping chunks
+MAX_OVERLAP_WORDS = 30
+
+def open_wav(source):
+    """
+    Opens a PCM WAV file for reading.
+
+    :param source: Path or seekable binary file object.
+    :return: A `wave.Wave_read`, or None if the audio is not a PCM WAV file
+        with a sample width we can process.
+    """
+    try:
+        if not isinstance(source, str):
+            source.seek(0)
+        wav = wave.open(source, 'rb')
+    except (wave.Error, EOFError):
+        return None
+    if wav.getsampwidth() not in SAMPLE_DTYPES:
+        wav.close()
+        return None
+    return wav
+
+def read_samples(wav, start, end):
+    """
+    Reads frames [start, end) of a WAV file as an array of shape (frames, channels).
+    """
+    wav.setpos(start)
+    data = wav.readframes(end - start)
+    samples = np.frombuffer(data, dtype=SAMPLE_DTYPES[wav.getsampwidth()])
+    return samples.reshape(-1, wav.getnchannels())
+
+def quietest_frame(samples, rate):
+    """
+    Returns the offset of the middle of the 20 ms frame with the lowest energy.
+    """
+    mono = samples.astype(np.float32).mean(axis=1)
+    mono -= mono.mean()  # 8-bit samples are unsigned
+    frame = max(1, int(rate * SILENCE_FRAME_SECONDS))
+    count = len(mono) // frame
+    if count == 0:
+        return len(mono) // 2
+    energy = np.square(mono[:count * frame]).reshape(count, frame).mean(axis=1)
+    return int(np.argmin(energy)) * frame + frame // 2
+
+def plan_chunks(wav, max_frames, overlap_frames):
+    """
+    Splits a WAV file into chunks of at most `max_frames` frames, plus
+    `overlap_frames` taken from the end of the previous chunk. Each cut is
+    placed at the quietest point shortly before the chunk length is reached.
+    Only the audio around the cuts is read.
+
+    :return: List of (start, end) frame ranges.
+    """
+    total = wav.getnframes()
+    rate = wav.getframerate()
+    search = min(int(rate * SILENCE_SEARCH_SECONDS), max_frames // 2)
+    cuts = [0]
+    while total - cuts[-1] > max_frames:
+        target = cuts[-1] + max_frames
+        window_start = target - search
+        cuts.append(window_start + quietest_frame(read_samples(wav, window_start, target), rate))
+    cuts.append(total)
+    return [(max(0, start - overlap_frames), end) for start, end in zip(cuts, cuts[1:])]
+
+class WavChunk:
+    """
+    A range of frames of a WAV recording, written out as a standalone WAV
+    file only when `read` is called, so a long recording is never copied
+    into memory as a whole. The chunks of one recording share a lock, since
+    they read from the same source.
+    """
+
+    __slots__ = ('source', 'lock', 'name', 'start', 'end')
+
+    def __init__(self, source, lock, name, start, end):
+        self.source = source
+        self.lock = lock
+        self.name = name
+        self.start = start
+        self.end = end
+
+    def read(self, max_memory=0, dir=None):
+        """
+        Writes the chunk to a temporary file, kept in memory up to
+        `max_memory` bytes. The caller closes the file.
+        :return: Tuple of (filename, file object positioned at the start).
+        """
+        output = tempfile.SpooledTemporaryFile(max_size=max_memory, dir=dir)
+        try:
+            with self.lock:
+                wav = open_wav(self.source)
+                if wav is None:
+                    raise ValueError(f"{self.name}: the source audio can no longer be read")
+                try:
+                    wav.setpos(self.start)
+                    with wave.open(output, 'wb') as out:
+                        out.setnchannels(wav.getnchannels())
+                        out.setsampwidth(wav.getsampwidth())
+                        out.setframerate(wav.getframerate())
+                        for block_start in range(self.start, self.end, RESAMPLE_BLOCK_FRAMES):
+                            out.writeframes(wav.readframes(min(RESAMPLE_BLOCK_FRAMES, self.end - block_start)))
+                finally:
+                    wav.close()
+        except BaseException:
+            output.close()
+            raise
+        output.seek(0)
+        return (self.name, output)
+
+def split_audio(source, name, chunk_seconds, overlap_seconds, max_chunk_bytes):
+    """
+    Splits a PCM WAV recording into overlapping chunks that are at most
+    `chunk_seconds` long and at most `max_chunk_bytes` in size.
+
+    :param source: Path or seekable binary file object. It must stay open
+        until the chunks have been read.
+    :param name: File name of the audio, used to name the chunks.
+    :return: List of `WavChunk`, or None if the audio is not a WAV file or
+        fits in a single chunk.
+    """
+    wav = open_wav(source)
+    if wav is None:
+        return None
+    try:
+        rate = wav.getframerate()
+        frame_bytes = wav.getnchannels() * wav.getsampwidth()
+        overlap_frames = int(rate * overlap_seconds)
+        # Leave room for the overlap and the WAV header
+        max_frames = min(int(rate * chunk_seconds), (max_chunk_bytes - 1024) // frame_bytes - overlap_frames)
+        if max_frames <= 0 or wav.getnframes() <= max_frames:
+            return None
+        ranges = plan_chunks(wav, max_frames, overlap_frames)
+        base = name.rsplit('.', 1)[0] or "audio"
+        lock = threading.Lock()
+        chunks = [WavChunk(source, lock, f"{base}_part{index + 1}.wav", start, end) for index, (start, end) in enumerate(ranges)]
+        logger.debug(f"Split {name} into {len(chunks)} chunks of up to {max_frames / rate:.0f}s.")
+        return chunks
+    finally:
+        wav.close()
+
+def lowpass_taps(ratio):
+    """
+    Windowed-sinc low-pass filter that removes what can't be represented
+    after downsampling by `ratio`, to avoid aliasing.
+    """
+    cutoff = 0.5 / ratio * 0.9
+    n = np.arange(LOWPASS_TAPS) - (LOWPASS_TAPS - 1) / 2
+    taps = np.sinc(2 * cutoff * n) * np.hamming(LOWPASS_TAPS)
+    return (taps / taps.sum()).astype(np.float32)
+
+def to_mono_float(samples, sample_width):
+    """
+    Converts PCM samples of shape (frames, channels) to mono floats in [-1, 1].
+    """
+    if sample_width == 1:
+        floats = (samples.astype(np.float32) - 128) / 128
+    else:
+        floats = samples.astype(np.float32) / float(2 ** (8 * sample_width - 1))
+    return floats.mean(axis=1)
+
+def preprocess_audio(source, output, target_rate=TARGET_SAMPLE_RATE):
+    """
+    Downmixes a PCM WAV recording to mono, resamples it to at most
+    `target_rate` and writes it to `output` as 16-bit PCM WAV. The audio is
+    processed in blocks, so long recordings are never fully decoded in memory.
+
+    :param source: Path or seekable binary file object.
+    :param output: Binary file object the processed WAV is written to.
+    :return: Dictionary with the input and output size in bytes and the
+        seconds spent, or None if the audio is not a WAV file or is already
+        16-bit mono at or below `target_rate`.
+    """
+    started = time.monotonic()
+    wav = open_wav(source)
+    if wav is None:
+        return None
+    try:
+        channels, width, rate, total = wav.getnchannels(), wav.getsampwidth(), wav.getframerate(), wav.getnframes()
+        if channels == 1 and width == 2 and rate <= target_rate:
+            return None
+        out_rate = min(rate, target_rate)
+        ratio = rate / out_rate
+        taps = lowpass_taps(ratio) if ratio > 1 else None
+        half = LOWPASS_TAPS // 2
+        out_total = int(total / ratio)
+
+        with wave.open(output, 'wb') as out:
+            out.setnchannels(1)
+            out.setsampwidth(2)
+            out.setframerate(out_rate)
+            for block_start in range(0, out_total, RESAMPLE_BLOCK_FRAMES):
+                positions = np.arange(block_start, min(out_total, block_start + RESAMPLE_BLOCK_FRAMES)) * ratio
+                # Read the input frames of this block plus the filter's context on both sides
+                start = max(0, int(positions[0]) - half)
+                end = min(total, int(positions[-1]) + 2 + half)
+                mono = to_mono_float(read_samples(wav, start, end), width)
+                if taps is not None:
+                    mono = np.convolve(mono, taps, mode='same')
+                resampled = np.interp(positions - start, np.arange(len(mono)), mono)
+                out.writeframes((np.clip(resampled, -1, 1) * 32767).astype('<i2').tobytes())
+
+        input_bytes = total * channels * width
+        output_bytes = out_total * 2
+        return {
+            'input_bytes': input_bytes,
+            'output_bytes': output_bytes,
+            'seconds': time.monotonic() - started,
+        }
+    finally:
+        wav.close()
+
+def normalize_word(word):
+    return word.strip(string.punctuation).lower()
+
+def overlapping_words(previous, following):
+    """
+    Returns how many leading words of `following` repeat the trailing words of `previous`.
+    """
+    longest = min(MAX_OVERLAP_WORDS, len(previous), len(following))
+    tail = [normalize_word(word) for word in previous[-longest:]] if longest else []
+    head = [normalize_word(word) for word in following[:longest]]
+    for size in range(longest, 0, -1):
+        if tail[-size:] == head[:size]:
+            return size
+    return 0
+
+def stitch_transcripts(parts):
+    """
+    Joins the transcripts of consecutive overlapping chunks, dropping the
+    words that were transcribed twice because of the overlap.
+    """
+    words = []
+    for part in parts:
+        following = part.split()
+        words.extend(following[overlapping_words(words, following):])
+    return " ".join(words)
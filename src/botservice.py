@@ -1,67 +1,167 @@
 import logging
-import json
+import time
 from src.mattermost_client import MattermostClient
+from src.openai_client import AdmissionDenied, StreamInterrupted, request_context
 from src.command_handler import CommandHandler
+from src.dispatcher import EventDispatcher
+from src.events import event_post
+from src.outbox import Outbox
 from src.plugins import get_plugins
+from src.config import (
+    BOT_WORKER_THREADS,
+    BOT_EVENT_QUEUE_SIZE,
+    BOT_STREAM_RESPONSES,
+    BOT_STREAM_UPDATE_INTERVAL,
+    BOT_STREAM_MIN_CHARS
+)
 
 logger = logging.getLogger(__name__)
 
+# Shown while a streamed reply is waiting for its first tokens
+STREAM_PLACEHOLDER = "..."
+
 class BotService:
     def __init__(self):
         self.mm_client = MattermostClient()
         self.command_handler = CommandHandler()
         self.plugins = get_plugins()
+        # Handle events off the WebSocket thread, in order per channel/thread
+        self.dispatcher = EventDispatcher(
+            self.handle_message,
+            self.get_event_key,
+            num_workers=BOT_WORKER_THREADS,
+            max_queue_size=BOT_EVENT_QUEUE_SIZE
+        )
+        # Replies are queued and delivered in the background
+        self.outbox = Outbox(self.mm_client)
 
     def start(self):
         logger.info("Starting BotService...")
+        self.outbox.start()
+        self.dispatcher.start()
+        # Listen first, so posts arriving while connecting aren't missed
+        self.mm_client.add_message_listener(self.dispatcher.dispatch)
         self.mm_client.connect()
-        self.mm_client.add_message_listener(self.handle_message)
         logger.info("BotService started successfully.")
 
+    def get_event_key(self, event_data):
+        """
+        Returns the key used to order events: the thread root if the post is a
+        reply, otherwise its channel.
+        """
+        post = event_post(event_data)
+        if post is None:
+            return None
+        return post.root_id or post.channel_id
+
     def handle_message(self, event_data):
-        post = event_data.get('data', {}).get('post')
-        if post:
-            post_data = json.loads(post)
-            channel_id = post_data.get('channel_id')
-            user_id = post_data.get('user_id')
-            message = post_data.get('message', '').strip()
-            file_ids = post_data.get('file_ids', [])
+        post = event_post(event_data)
+        if post is not None:
+            channel_id = post.channel_id
+            user_id = post.user_id
+            message = post.message.strip()
+            file_ids = post.file_ids
 
             # Ignore messages from the bot itself
             if user_id == self.mm_client.bot_id:
                 return
 
-            # Check if the message is a command
-            if message.startswith('/'):
-                self.handle_command(channel_id, user_id, message, file_ids)
-            else:
-                self.handle_chat(channel_id, user_id, message)
+            # OpenAI calls made for this message are rate limited for its user and channel
+            with request_context(user_id, channel_id):
+                try:
+                    # Check if the message is a command
+                    if message.startswith('/'):
+                        self.handle_command(channel_id, user_id, message, file_ids)
+                    else:
+                        self.handle_chat(channel_id, user_id, message)
+                except AdmissionDenied as e:
+                    logger.warning(f"Refused message of user {user_id} in channel {channel_id}: rate limited")
+                    self.outbox.post(channel_id, str(e))
 
     def handle_command(self, channel_id, user_id, message, file_ids):
         command, *args = message[1:].split()
 
-        # If there are file_ids, append the first one to args
-        if file_ids:
-            args.append(file_ids[0])
+        # Pass every attached file to the command, in attachment order
+        args.extend(file_ids)
 
         response = self.command_handler.execute(command, args, channel_id, user_id)
-        if response:
-            self.mm_client.post_message(channel_id, response)
+        self.post_response(channel_id, response)
+
+    def post_response(self, channel_id, response):
+        """
+        Queues the reply of a plugin in the outbox.
+        :param response: The message, a (message, file_ids) tuple, or None if
+            the plugin has nothing (more) to post.
+        """
+        if isinstance(response, tuple):
+            message, file_ids = response
+            self.outbox.post(channel_id, message, file_ids=file_ids)
+        elif response:
+            self.outbox.post(channel_id, response)
 
     def handle_chat(self, channel_id, user_id, message):
         chat_plugin = self.plugins.get('chat')
-        if chat_plugin:
+        if chat_plugin and BOT_STREAM_RESPONSES:
+            self.stream_response(channel_id, chat_plugin.execute_stream([message], channel_id, user_id))
+        elif chat_plugin:
             response = chat_plugin.execute([message], channel_id, user_id)
             if response:
-                self.mm_client.post_message(channel_id, response)
+                self.outbox.post(channel_id, response)
         else:
             logger.warning("Chat plugin not found. Unable to process chat message.")
 
+    def stream_response(self, channel_id, chunks):
+        """
+        Posts a placeholder right away and edits it as chunks arrive. Edits are
+        throttled to at most one per BOT_STREAM_UPDATE_INTERVAL seconds and only
+        once at least BOT_STREAM_MIN_CHARS new characters are available.
+        :param channel_id: ID of the channel.
+        :param chunks: Iterable of reply text chunks.
+        """
+        started = time.monotonic()
+        post = self.mm_client.post_message(channel_id, STREAM_PLACEHOLDER)
+        post_id = post.get('id') if post else None
+
+        text = ""
+        posted_text = ""
+        last_update = started
+        try:
+            for chunk in chunks:
+                text += chunk
+                now = time.monotonic()
+                if (post_id and text.strip()
+                        and now - last_update >= BOT_STREAM_UPDATE_INTERVAL
+                        and len(text) - len(posted_text) >= BOT_STREAM_MIN_CHARS):
+                    if not posted_text:
+                        logger.info(f"First streamed update posted after {now - started:.2f}s")
+                    self.mm_client.patch_post(post_id, text)
+                    posted_text = text
+                    last_update = now
+        except (AdmissionDenied, StreamInterrupted) as e:
+            # Replace the placeholder, or the incomplete reply, with the reason
+            text = str(e)
+
+        text = text.strip()
+        if not text:
+            return
+        if post_id:
+            if text != posted_text:
+                self.mm_client.patch_post(post_id, text)
+        else:
+            # The placeholder could not be posted, fall back to a single post
+            self.outbox.post(channel_id, text)
+        logger.debug(f"Streamed reply completed in {time.monotonic() - started:.2f}s")
+
     def stop(self):
         logger.info("Stopping BotService...")
-        self.mm_client.close()
+        # Stop taking new events, then finish the last handled messages and
+        # deliver their replies before closing the client
+        self.mm_client.disconnect()
+        self.dispatcher.stop(timeout=30)
+        self.outbox.stop(timeout=30)
         for plugin in self.plugins.values():
             plugin.cleanup()
+        self.mm_client.close()
         logger.info("BotService stopped successfully.")
 
 if __name__ == "__main__":
@@ -71,7 +171,6 @@ if __name__ == "__main__":
 
     # Keep the service running
     try:
-        import time
         while True:
             time.sleep(1)
     except KeyboardInterrupt:
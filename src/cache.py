@@ -0,0 +1,288 @@
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+class TTLCache:
+    """
+    Thread-safe in-memory cache with least-recently-used eviction.
+
+    Holds at most `max_entries` values. Entries older than `ttl` seconds are
+    treated as missing; a `ttl` of None keeps them until they are evicted.
+    """
+
+    def __init__(self, max_entries=1000, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        # key -> (value, expires_at), least recently used first
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[1] is not None and entry[1] <= time.monotonic():
+                del self.entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value):
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self.lock:
+            self.entries[key] = (value, expires_at)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def invalidate_matching(self, predicate):
+        """
+        Removes the entries for which `predicate(key, value)` is true.
+        """
+        with self.lock:
+            for key in [key for key, (value, _) in self.entries.items() if predicate(key, value)]:
+                del self.entries[key]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+    def __len__(self):
+        with self.lock:
+            return len(self.entries)
+
+class DiskCache:
+    """
+    Thread-safe on-disk cache of byte strings with least-recently-used eviction.
+
+    Each value is stored in its own file, named by the SHA-256 of its key, so
+    the cache survives restarts. The files are kept under `max_bytes` in total.
+    Entries older than `ttl` seconds, counted from when they were written, are
+    treated as missing.
+    """
+
+    def __init__(self, directory, max_bytes=100 * 1024 * 1024, ttl=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        # file name -> (size, written_at), least recently used first
+        self.index = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self):
+        # Rebuild the index from the files left by a previous run, oldest first
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.startswith('.'):
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.name, stat.st_size))
+        for written_at, name, size in sorted(files):
+            self.index[name] = (size, written_at)
+            self.total_bytes += size
+        with self.lock:
+            self._enforce_quota()
+
+    def filename(self, key):
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, self.filename(key))
+
+    def get(self, key):
+        """
+        Returns the cached bytes for a key, or None.
+        """
+        name = self.filename(key)
+        with self.lock:
+            entry = self.index.get(name)
+            if entry is not None and self._expired(entry):
+                self._remove(name)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.index.move_to_end(name)
+        try:
+            with open(os.path.join(self.directory, name), 'rb') as f:
+                data = f.read()
+        except OSError as e:
+            logger.warning(f"Failed to read cache entry {name}: {e}")
+            with self.lock:
+                if name in self.index:
+                    self._remove(name)
+                self.misses += 1
+            return None
+        with self.lock:
+            self.hits += 1
+        return data
+
+    def set(self, key, data):
+        """
+        Stores bytes for a key. The file is written atomically, so readers
+        never see a partial value.
+        """
+        name = self.filename(key)
+        try:
+            fd, temp_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, os.path.join(self.directory, name))
+        except OSError as e:
+            logger.warning(f"Failed to write cache entry {name}: {e}")
+            return
+        with self.lock:
+            previous = self.index.pop(name, None)
+            if previous is not None:
+                self.total_bytes -= previous[0]
+            self.index[name] = (len(data), time.time())
+            self.total_bytes += len(data)
+            self._enforce_quota()
+
+    def touch(self, key):
+        """
+        Marks an entry as recently used without reading it.
+        :return: True if the entry exists.
+        """
+        name = self.filename(key)
+        with self.lock:
+            entry = self.index.get(name)
+            if entry is None or self._expired(entry):
+                return False
+            self.index.move_to_end(name)
+            return True
+
+    def invalidate(self, key):
+        name = self.filename(key)
+        with self.lock:
+            if name in self.index:
+                self._remove(name)
+
+    def _expired(self, entry):
+        return self.ttl is not None and time.time() - entry[1] > self.ttl
+
+    def _enforce_quota(self):
+        while self.total_bytes > self.max_bytes and self.index:
+            self._remove(next(iter(self.index)))
+            self.evictions += 1
+
+    def _remove(self, name):
+        size, _ = self.index.pop(name)
+        self.total_bytes -= size
+        try:
+            os.remove(os.path.join(self.directory, name))
+        except OSError:
+            pass
+
+    def stats(self):
+        with self.lock:
+            return {
+                'entries': len(self.index),
+                'bytes': self.total_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+    def __len__(self):
+        with self.lock:
+            return len(self.index)
+
+class ContentAddressedCache:
+    """
+    On-disk cache that stores each distinct value once, addressed by its SHA-256.
+
+    A small index maps keys to content digests, so keys with identical values
+    share one file. Values are evicted least recently used first once they
+    exceed `max_bytes`; keys whose value was evicted become misses.
+    """
+
+    # The index only holds digests, 64 bytes per key
+    INDEX_MAX_BYTES = 1024 * 1024
+
+    def __init__(self, directory, max_bytes=100 * 1024 * 1024, ttl=None):
+        self.blobs = DiskCache(os.path.join(directory, 'blobs'), max_bytes)
+        self.index = DiskCache(os.path.join(directory, 'index'), self.INDEX_MAX_BYTES, ttl)
+
+    def get(self, key):
+        digest = self.index.get(key)
+        if digest is None:
+            return None
+        data = self.blobs.get(digest.decode('ascii'))
+        if data is None:
+            self.index.invalidate(key)
+        return data
+
+    def set(self, key, data):
+        digest = hashlib.sha256(data).hexdigest()
+        if not self.blobs.touch(digest):
+            self.blobs.set(digest, data)
+        self.index.set(key, digest.encode('ascii'))
+
+    def invalidate(self, key):
+        self.index.invalidate(key)
+
+    def stats(self):
+        return {'index': self.index.stats(), 'blobs': self.blobs.stats()}
+
+class TieredCache:
+    """
+    An in-memory cache in front of a slower cache, usually a `DiskCache`.
+
+    Values found only in the slower tier are copied into memory on access.
+    Writes go to both tiers.
+    """
+
+    def __init__(self, memory, disk):
+        self.memory = memory
+        self.disk = disk
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.memory.set(key, value)
+        return value
+
+    def set(self, key, value):
+        self.memory.set(key, value)
+        self.disk.set(key, value)
+
+    def invalidate(self, key):
+        self.memory.invalidate(key)
+        self.disk.invalidate(key)
+
+    def stats(self):
+        return {'memory': self.memory.stats(), 'disk': self.disk.stats()}
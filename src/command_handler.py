@@ -19,6 +19,14 @@ class CommandHandler:
         else:
             return f"Unknown command: {command}"
 
+    async def execute_async(self, command, args, channel_id, user_id):
+        if command in self.commands:
+            return self.commands[command](args, channel_id, user_id)
+        elif command in self.plugins:
+            return await self.plugins[command].execute_async(args, channel_id, user_id)
+        else:
+            return f"Unknown command: {command}"
+
     def help_command(self, args, channel_id, user_id):
         if args:
             plugin_name = args[0].lower()
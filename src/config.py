@@ -1,3 +1,4 @@
+import logging
 import os
 from dotenv import load_dotenv
 from pathlib import Path
@@ -10,6 +11,25 @@ load_dotenv(dotenv_path=env_path)
 MATTERMOST_URL = os.getenv('MATTERMOST_URL')
 MATTERMOST_TOKEN = os.getenv('MATTERMOST_TOKEN')
 MATTERMOST_BOTNAME = os.getenv('MATTERMOST_BOTNAME', '@chatgpt-bot')
+MATTERMOST_POOL_SIZE = int(os.getenv('MATTERMOST_POOL_SIZE', '20'))
+MATTERMOST_CONNECT_TIMEOUT = float(os.getenv('MATTERMOST_CONNECT_TIMEOUT', '5'))
+MATTERMOST_READ_TIMEOUT = float(os.getenv('MATTERMOST_READ_TIMEOUT', '30'))
+MATTERMOST_MAX_RETRIES = int(os.getenv('MATTERMOST_MAX_RETRIES', '3'))
+# Cache of users, the bot's identity, direct channels and file infos, kept
+# fresh by WebSocket events; a TTL of 0 disables caching that kind
+MATTERMOST_METADATA_CACHE_SIZE = int(os.getenv('MATTERMOST_METADATA_CACHE_SIZE', '10000'))
+MATTERMOST_USER_CACHE_TTL = float(os.getenv('MATTERMOST_USER_CACHE_TTL', '300'))
+MATTERMOST_CHANNEL_CACHE_TTL = float(os.getenv('MATTERMOST_CHANNEL_CACHE_TTL', '3600'))
+MATTERMOST_FILE_CACHE_TTL = float(os.getenv('MATTERMOST_FILE_CACHE_TTL', '3600'))
+# WebSocket reconnects wait from MATTERMOST_RECONNECT_BASE_DELAY up to
+# MATTERMOST_RECONNECT_MAX_DELAY seconds, doubling after every failed attempt
+MATTERMOST_RECONNECT_BASE_DELAY = float(os.getenv('MATTERMOST_RECONNECT_BASE_DELAY', '1'))
+MATTERMOST_RECONNECT_MAX_DELAY = float(os.getenv('MATTERMOST_RECONNECT_MAX_DELAY', '60'))
+# Longest `connect` waits for the WebSocket to be ready, in seconds
+MATTERMOST_READY_TIMEOUT = float(os.getenv('MATTERMOST_READY_TIMEOUT', '10'))
+# After a reconnect, posts created while disconnected are fetched, going back
+# at most MATTERMOST_CATCH_UP_MAX_AGE seconds; 0 disables catching up
+MATTERMOST_CATCH_UP_MAX_AGE = float(os.getenv('MATTERMOST_CATCH_UP_MAX_AGE', '3600'))
 
 # OpenAI Configuration
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
@@ -17,10 +37,66 @@ OPENAI_API_BASE = os.getenv('OPENAI_API_BASE', 'https://api.openai.com/v1')
 OPENAI_MODEL_NAME = os.getenv('OPENAI_MODEL_NAME', 'gpt-4o')
 OPENAI_MAX_TOKENS = int(os.getenv('OPENAI_MAX_TOKENS', '2000'))
 OPENAI_TEMPERATURE = float(os.getenv('OPENAI_TEMPERATURE', '0.7'))
+# Context window of the model in tokens; 0 looks it up from OPENAI_MODEL_NAME
+OPENAI_CONTEXT_WINDOW = int(os.getenv('OPENAI_CONTEXT_WINDOW', '0'))
+# Opt-in cache of chat responses for repeated deterministic or first-turn
+# requests. Set a directory to also keep them on disk across restarts.
+OPENAI_RESPONSE_CACHE = os.getenv('OPENAI_RESPONSE_CACHE', 'false').lower() == 'true'
+OPENAI_RESPONSE_CACHE_TTL = int(os.getenv('OPENAI_RESPONSE_CACHE_TTL', '3600'))
+OPENAI_RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('OPENAI_RESPONSE_CACHE_MAX_ENTRIES', '1000'))
+OPENAI_RESPONSE_CACHE_DIR = os.getenv('OPENAI_RESPONSE_CACHE_DIR', '')
+OPENAI_RESPONSE_CACHE_MAX_BYTES = int(os.getenv('OPENAI_RESPONSE_CACHE_MAX_BYTES', str(50 * 1024 * 1024)))
+# Admission control: requests and estimated tokens per minute allowed globally,
+# per channel and per user; 0 means unlimited
+OPENAI_GLOBAL_RPM = int(os.getenv('OPENAI_GLOBAL_RPM', '0'))
+OPENAI_GLOBAL_TPM = int(os.getenv('OPENAI_GLOBAL_TPM', '0'))
+OPENAI_CHANNEL_RPM = int(os.getenv('OPENAI_CHANNEL_RPM', '0'))
+OPENAI_CHANNEL_TPM = int(os.getenv('OPENAI_CHANNEL_TPM', '0'))
+OPENAI_USER_RPM = int(os.getenv('OPENAI_USER_RPM', '0'))
+OPENAI_USER_TPM = int(os.getenv('OPENAI_USER_TPM', '0'))
+# Longest a request over the limits is queued, in seconds, before it is refused
+OPENAI_ADMISSION_MAX_WAIT = float(os.getenv('OPENAI_ADMISSION_MAX_WAIT', '10'))
+
+# Retries and circuit breakers for OpenAI and Mattermost API calls
+RETRY_MAX_ATTEMPTS = int(os.getenv('RETRY_MAX_ATTEMPTS', '3'))
+RETRY_BASE_DELAY = float(os.getenv('RETRY_BASE_DELAY', '0.5'))
+RETRY_MAX_DELAY = float(os.getenv('RETRY_MAX_DELAY', '20'))
+# Retries may add this fraction of the requests, plus a few per second
+RETRY_BUDGET_RATIO = float(os.getenv('RETRY_BUDGET_RATIO', '0.2'))
+RETRY_BUDGET_MIN_PER_SECOND = float(os.getenv('RETRY_BUDGET_MIN_PER_SECOND', '1'))
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', '5'))
+CIRCUIT_RESET_TIMEOUT = float(os.getenv('CIRCUIT_RESET_TIMEOUT', '30'))
+
+# Outbound post queue: posts are delivered in order per channel, shaped to
+# OUTBOX_POSTS_PER_SECOND (bursts of OUTBOX_BURST), and retried with the same
+# pending post ID. Posts that still fail are appended to OUTBOX_DEAD_LETTER_PATH.
+OUTBOX_POSTS_PER_SECOND = float(os.getenv('OUTBOX_POSTS_PER_SECOND', '10'))
+OUTBOX_BURST = int(os.getenv('OUTBOX_BURST', '100'))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '5'))
+OUTBOX_RETRY_DELAY = float(os.getenv('OUTBOX_RETRY_DELAY', '2'))
+OUTBOX_QUEUE_SIZE = int(os.getenv('OUTBOX_QUEUE_SIZE', '1000'))
+OUTBOX_WORKERS = int(os.getenv('OUTBOX_WORKERS', '4'))
+OUTBOX_DEAD_LETTER_PATH = os.getenv('OUTBOX_DEAD_LETTER_PATH', 'data/dead_letters.jsonl')
 
 # Bot Configuration
 BOT_CONTEXT_MSG = int(os.getenv('BOT_CONTEXT_MSG', '50'))
 BOT_INSTRUCTION = os.getenv('BOT_INSTRUCTION', 'You are a helpful assistant.')
+BOT_MAX_CONVERSATIONS = int(os.getenv('BOT_MAX_CONVERSATIONS', '10000'))
+BOT_CONVERSATION_MAX_BYTES = int(os.getenv('BOT_CONVERSATION_MAX_BYTES', str(64 * 1024 * 1024)))
+BOT_CONVERSATION_IDLE_TTL = int(os.getenv('BOT_CONVERSATION_IDLE_TTL', '86400'))
+# Persistent conversation history: 'none' or 'sqlite'
+BOT_HISTORY_BACKEND = os.getenv('BOT_HISTORY_BACKEND', 'none').lower()
+BOT_HISTORY_DB_PATH = os.getenv('BOT_HISTORY_DB_PATH', 'data/conversations.db')
+# Fold older turns into a summary once a conversation has more messages than
+# the threshold (0, the default, disables), keeping the most recent ones verbatim
+BOT_SUMMARY_THRESHOLD = int(os.getenv('BOT_SUMMARY_THRESHOLD', '0'))
+BOT_SUMMARY_KEEP_MESSAGES = int(os.getenv('BOT_SUMMARY_KEEP_MESSAGES', '10'))
+BOT_WORKER_THREADS = int(os.getenv('BOT_WORKER_THREADS', '8'))
+BOT_EVENT_QUEUE_SIZE = int(os.getenv('BOT_EVENT_QUEUE_SIZE', '1000'))
+BOT_ASYNC_MODE = os.getenv('BOT_ASYNC_MODE', 'false').lower() == 'true'
+BOT_STREAM_RESPONSES = os.getenv('BOT_STREAM_RESPONSES', 'false').lower() == 'true'
+BOT_STREAM_UPDATE_INTERVAL = float(os.getenv('BOT_STREAM_UPDATE_INTERVAL', '1.0'))
+BOT_STREAM_MIN_CHARS = int(os.getenv('BOT_STREAM_MIN_CHARS', '40'))
 
 # Plugins Configuration
 PLUGINS = os.getenv('PLUGINS', 'chat,image,audio').split(',')
@@ -28,10 +104,32 @@ PLUGINS = os.getenv('PLUGINS', 'chat,image,audio').split(',')
 # Service Configuration
 CHAT_SERVICE = os.getenv('CHAT_SERVICE', 'openai')
 IMAGE_SERVICE = os.getenv('IMAGE_SERVICE', 'dalle')
+# Most image variants one /image command may ask for with --n
+IMAGE_MAX_VARIANTS = int(os.getenv('IMAGE_MAX_VARIANTS', '4'))
+# 'url' streams generated images from the provider straight into the Mattermost
+# upload instead of receiving them base64-encoded ('b64_json')
+IMAGE_RESPONSE_FORMAT = os.getenv('IMAGE_RESPONSE_FORMAT', 'b64_json')
 AUDIO_SERVICE = os.getenv('AUDIO_SERVICE', 'openai')
 
 # Temporary Directory for file operations
 TEMP_DIR = os.getenv('TEMP_DIR', '/tmp/mattermost_bot')
+# Audio up to AUDIO_SPOOL_MAX_MEMORY bytes is kept in memory, larger files are
+# spooled to TEMP_DIR. Files over AUDIO_MAX_FILE_SIZE are rejected.
+AUDIO_SPOOL_MAX_MEMORY = int(os.getenv('AUDIO_SPOOL_MAX_MEMORY', str(10 * 1024 * 1024)))
+AUDIO_MAX_FILE_SIZE = int(os.getenv('AUDIO_MAX_FILE_SIZE', str(100 * 1024 * 1024)))
+# Long WAV recordings are split into chunks of at most AUDIO_CHUNK_SECONDS,
+# overlapping by AUDIO_CHUNK_OVERLAP_SECONDS, and transcribed concurrently
+AUDIO_CHUNK_SECONDS = int(os.getenv('AUDIO_CHUNK_SECONDS', '300'))
+AUDIO_CHUNK_OVERLAP_SECONDS = float(os.getenv('AUDIO_CHUNK_OVERLAP_SECONDS', '1.0'))
+AUDIO_TRANSCRIBE_CONCURRENCY = int(os.getenv('AUDIO_TRANSCRIBE_CONCURRENCY', '4'))
+# Downmix WAV audio to mono and resample it to 16 kHz before transcription
+AUDIO_PREPROCESS = os.getenv('AUDIO_PREPROCESS', 'true').lower() == 'true'
+# Maximum number of audio attachments of one post transcribed at the same time
+AUDIO_FILES_CONCURRENCY = int(os.getenv('AUDIO_FILES_CONCURRENCY', '3'))
+# Disk quota of the generated image cache under TEMP_DIR; 0 disables it
+IMAGE_CACHE_MAX_BYTES = int(os.getenv('IMAGE_CACHE_MAX_BYTES', str(200 * 1024 * 1024)))
+# Disk quota of the transcript cache under TEMP_DIR; 0 disables it
+TRANSCRIPT_CACHE_MAX_BYTES = int(os.getenv('TRANSCRIPT_CACHE_MAX_BYTES', str(50 * 1024 * 1024)))
 
 # Validate Essential Configurations
 if not MATTERMOST_URL:
@@ -39,4 +137,16 @@ if not MATTERMOST_URL:
 if not MATTERMOST_TOKEN:
     raise ValueError("MATTERMOST_TOKEN is not set in the environment variables.")
 if not OPENAI_API_KEY:
-    raise ValueError("OPENAI_API_KEY is not set in the environment variables.")
\ No newline at end of file
+    raise ValueError("OPENAI_API_KEY is not set in the environment variables.")
+# Conversations are trimmed to BOT_CONTEXT_MSG messages, so a higher threshold
+# would drop old turns without ever summarizing them. A threshold above the
+# default context size is lowered; one that contradicts an explicit
+# BOT_CONTEXT_MSG is an error.
+if BOT_SUMMARY_THRESHOLD and BOT_SUMMARY_THRESHOLD >= BOT_CONTEXT_MSG:
+    if 'BOT_CONTEXT_MSG' in os.environ:
+        raise ValueError("BOT_SUMMARY_THRESHOLD must be lower than BOT_CONTEXT_MSG, or 0 to disable summaries.")
+    logging.getLogger(__name__).warning(
+        f"BOT_SUMMARY_THRESHOLD ({BOT_SUMMARY_THRESHOLD}) is not lower than BOT_CONTEXT_MSG "
+        f"({BOT_CONTEXT_MSG}); using {BOT_CONTEXT_MSG - 1}."
+    )
+    BOT_SUMMARY_THRESHOLD = BOT_CONTEXT_MSG - 1
\ No newline at end of file
@@ -0,0 +1,194 @@
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import Counter
+from .conversation_store import Conversation
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS turns (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        conversation_id TEXT NOT NULL,
+        seq INTEGER NOT NULL,
+        role TEXT NOT NULL,
+        content TEXT NOT NULL,
+        tokens INTEGER,
+        created_at REAL NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_turns_conversation ON turns (conversation_id, seq)",
+    """
+    CREATE TABLE IF NOT EXISTS summaries (
+        conversation_id TEXT PRIMARY KEY,
+        summary TEXT NOT NULL,
+        tokens INTEGER,
+        upto_seq INTEGER NOT NULL,
+        updated_at REAL NOT NULL
+    )
+    """,
+]
+
+class SQLiteConversationHistory:
+    """
+    Durable conversation history stored in SQLite.
+
+    Writes are queued and committed in batches by a background thread, so
+    saving a turn never waits for the disk. Reads load a single conversation on
+    demand using the (conversation_id, seq) index; nothing is loaded at startup.
+    """
+
+    def __init__(self, path, batch_size=100, flush_interval=1.0):
+        """
+        :param path: Path of the SQLite database file.
+        :param batch_size: Maximum number of messages written per transaction.
+        :param flush_interval: Maximum seconds a queued message waits before it is written.
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue()
+        # Messages queued but not yet committed, per conversation
+        self.pending = Counter()
+        self.pending_lock = threading.Lock()
+        self.written = threading.Condition(self.pending_lock)
+        self.local = threading.local()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = self.connect()
+        with connection:
+            for statement in SCHEMA:
+                connection.execute(statement)
+
+        self.writer = threading.Thread(target=self._writer_loop, name="history-writer", daemon=True)
+        self.writer.start()
+
+    def connect(self):
+        connection = sqlite3.connect(self.path, timeout=30)
+        # WAL lets readers load conversations while the writer commits
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def get_connection(self):
+        # SQLite connections can't be shared between threads, so keep one per thread
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = self.local.connection = self.connect()
+        return connection
+
+    def save(self, conversation_id, messages):
+        """
+        Queues messages to be appended to a conversation. Returns immediately.
+        """
+        now = time.time()
+        with self.pending_lock:
+            self.pending[conversation_id] += len(messages)
+        for message in messages:
+            self.queue.put(('turn', (conversation_id, message['seq'], message['role'], message['content'], message.get('tokens'), now)))
+
+    def save_summary(self, conversation_id, summary, upto_seq):
+        """
+        Queues the summary covering a conversation up to `upto_seq`. Returns immediately.
+        """
+        with self.pending_lock:
+            self.pending[conversation_id] += 1
+        self.queue.put(('summary', (conversation_id, summary['content'], summary.get('tokens'), upto_seq, time.time())))
+
+    def load(self, conversation_id, limit):
+        """
+        Loads a conversation: its summary and the last `limit` messages that the
+        summary does not cover. Waits for queued writes of that conversation to
+        be committed first.
+        :return: A `Conversation`, or None if nothing is stored for it.
+        """
+        with self.pending_lock:
+            self.written.wait_for(lambda: not self.pending[conversation_id], timeout=10)
+        connection = self.get_connection()
+        last_seq = connection.execute(
+            "SELECT MAX(seq) FROM turns WHERE conversation_id = ?", (conversation_id,)
+        ).fetchone()[0]
+        if last_seq is None:
+            return None
+
+        summary = None
+        summary_upto = -1
+        row = connection.execute(
+            "SELECT summary, tokens, upto_seq FROM summaries WHERE conversation_id = ?", (conversation_id,)
+        ).fetchone()
+        if row:
+            summary = {"role": "system", "content": row[0], "tokens": row[1]}
+            summary_upto = row[2]
+
+        rows = connection.execute(
+            "SELECT seq, role, content, tokens FROM turns WHERE conversation_id = ? AND seq > ? ORDER BY seq DESC LIMIT ?",
+            (conversation_id, summary_upto, limit)
+        ).fetchall()
+        messages = [
+            {"role": role, "content": content, "tokens": tokens, "seq": seq}
+            for seq, role, content, tokens in reversed(rows)
+        ]
+        return Conversation(messages, summary=summary, summary_upto=summary_upto, next_seq=last_seq + 1)
+
+    def _writer_loop(self):
+        connection = self.connect()
+        stopping = False
+        while not stopping:
+            item = self.queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    item = self.queue.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._write_batch(connection, batch)
+        connection.close()
+
+    def _write_batch(self, connection, batch):
+        turns = [values for kind, values in batch if kind == 'turn']
+        summaries = [values for kind, values in batch if kind == 'summary']
+        try:
+            with connection:
+                connection.executemany(
+                    "INSERT INTO turns (conversation_id, seq, role, content, tokens, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    turns
+                )
+                connection.executemany(
+                    "INSERT OR REPLACE INTO summaries (conversation_id, summary, tokens, upto_seq, updated_at) VALUES (?, ?, ?, ?, ?)",
+                    summaries
+                )
+            logger.debug(f"Wrote {len(turns)} messages and {len(summaries)} summaries to conversation history.")
+        except sqlite3.Error as e:
+            logger.error(f"Failed to write {len(batch)} entries to conversation history: {e}")
+        finally:
+            with self.pending_lock:
+                for kind, (conversation_id, *_) in batch:
+                    self.pending[conversation_id] -= 1
+                    if not self.pending[conversation_id]:
+                        del self.pending[conversation_id]
+                self.written.notify_all()
+
+    def close(self):
+        """
+        Writes everything still queued and stops the writer thread.
+        """
+        self.queue.put(None)
+        self.writer.join()
+        connection = getattr(self.local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self.local.connection = None
+        logger.info("Conversation history closed.")
@@ -0,0 +1,208 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Rough per-message cost of the dict, its keys and the list slot, on top of the text
+MESSAGE_OVERHEAD_BYTES = 200
+
+class Conversation:
+    """
+    In-memory state of one conversation.
+    """
+    __slots__ = ('messages', 'summary', 'summary_upto', 'next_seq', 'size', 'last_access')
+
+    def __init__(self, messages=None, summary=None, summary_upto=-1, next_seq=0):
+        self.messages = messages or []
+        # Summary message covering every turn up to and including summary_upto
+        self.summary = summary
+        self.summary_upto = summary_upto
+        self.next_seq = next_seq
+        self.size = sum(message_size(message) for message in self.messages)
+        if summary:
+            self.size += message_size(summary)
+        self.last_access = time.monotonic()
+
+class ConversationStore:
+    """
+    Thread-safe, bounded store of conversation histories.
+
+    Conversations are kept in least-recently-used order and evicted when there
+    are more than `max_conversations`, when their approximate size exceeds
+    `max_bytes`, or when they have been idle for longer than `idle_ttl` seconds.
+    Each conversation keeps at most `max_messages` messages.
+
+    Every stored message gets a 'seq' number, increasing within its conversation.
+    Older messages can be folded into a summary with `compact`.
+
+    If a `history` backend is given, appended messages and summaries are also
+    saved to it, and a conversation that is not in memory is loaded from it on
+    first access.
+    """
+
+    def __init__(self, max_conversations=10000, max_bytes=64 * 1024 * 1024, idle_ttl=86400, max_messages=50, history=None):
+        self.max_conversations = max_conversations
+        self.max_bytes = max_bytes
+        self.idle_ttl = idle_ttl
+        self.max_messages = max_messages
+        self.history = history
+        self.lock = threading.Lock()
+        # key -> Conversation, oldest access first
+        self.conversations = OrderedDict()
+        self.total_bytes = 0
+        self.evictions = {'lru': 0, 'bytes': 0, 'idle': 0}
+
+    def get(self, key):
+        """
+        Returns a copy of the messages of a conversation, or an empty list.
+        """
+        return self.get_conversation(key)[1]
+
+    def get_conversation(self, key):
+        """
+        Returns the summary message (or None) and a copy of the messages of a conversation.
+        """
+        conversation = self._get_or_load(key)
+        if conversation is None:
+            return None, []
+        with self.lock:
+            return conversation.summary, list(conversation.messages)
+
+    def append(self, key, *messages):
+        """
+        Appends messages to a conversation, creating it if needed, and enforces
+        the store's limits. Sets the 'seq' of each message.
+        """
+        self._get_or_load(key)
+        with self.lock:
+            now = time.monotonic()
+            conversation = self.conversations.get(key)
+            if conversation is None:
+                conversation = self.conversations[key] = Conversation()
+            else:
+                self.conversations.move_to_end(key)
+            conversation.last_access = now
+
+            for message in messages:
+                message['seq'] = conversation.next_seq
+                conversation.next_seq += 1
+            conversation.messages.extend(messages)
+            self._resize(conversation, sum(message_size(message) for message in messages))
+            if len(conversation.messages) > self.max_messages:
+                dropped = conversation.messages[:-self.max_messages]
+                del conversation.messages[:-self.max_messages]
+                self._resize(conversation, -sum(message_size(message) for message in dropped))
+
+            if self.history is not None:
+                self.history.save(key, messages)
+            self._evict_idle(now)
+            self._enforce_limits()
+
+    def compact(self, key, summary, upto_seq):
+        """
+        Replaces the messages up to and including `upto_seq` with a summary message.
+        """
+        with self.lock:
+            conversation = self.conversations.get(key)
+            if conversation is None:
+                return
+            folded = [message for message in conversation.messages if message['seq'] <= upto_seq]
+            conversation.messages = [message for message in conversation.messages if message['seq'] > upto_seq]
+            removed = sum(message_size(message) for message in folded)
+            if conversation.summary:
+                removed += message_size(conversation.summary)
+            self._resize(conversation, message_size(summary) - removed)
+            conversation.summary = summary
+            conversation.summary_upto = upto_seq
+            if self.history is not None:
+                self.history.save_summary(key, summary, upto_seq)
+
+    def _get_or_load(self, key):
+        with self.lock:
+            now = time.monotonic()
+            self._evict_idle(now)
+            conversation = self.conversations.get(key)
+            if conversation is not None:
+                conversation.last_access = now
+                self.conversations.move_to_end(key)
+                return conversation
+        if self.history is None:
+            return None
+
+        # Load outside the lock so a slow read doesn't block other conversations
+        loaded = self.history.load(key, self.max_messages)
+        if loaded is None:
+            return None
+        with self.lock:
+            conversation = self.conversations.get(key)
+            if conversation is not None:
+                # Another thread created the conversation in the meantime
+                return conversation
+            conversation = self.conversations[key] = loaded
+            self.total_bytes += conversation.size
+            self._enforce_limits()
+            return conversation
+
+    def _resize(self, conversation, delta):
+        conversation.size += delta
+        self.total_bytes += delta
+
+    def close(self):
+        if self.history is not None:
+            self.history.close()
+
+    def remove(self, key):
+        with self.lock:
+            conversation = self.conversations.pop(key, None)
+            if conversation is not None:
+                self.total_bytes -= conversation.size
+
+    def _enforce_limits(self):
+        while len(self.conversations) > self.max_conversations:
+            self._evict_oldest('lru')
+        # Never evict the conversation that was just used
+        while self.total_bytes > self.max_bytes and len(self.conversations) > 1:
+            self._evict_oldest('bytes')
+
+    def _evict_idle(self, now):
+        # Entries are ordered by last access, so expired ones are at the front
+        while self.conversations:
+            conversation = next(iter(self.conversations.values()))
+            if now - conversation.last_access <= self.idle_ttl:
+                break
+            self._evict_oldest('idle')
+
+    def _evict_oldest(self, reason):
+        key, conversation = self.conversations.popitem(last=False)
+        self.total_bytes -= conversation.size
+        self.evictions[reason] += 1
+        logger.debug(f"Evicted conversation {key} ({reason}).")
+
+    def stats(self):
+        """
+        Returns the number of conversations and messages, the approximate size
+        in bytes and the eviction counts by reason.
+        """
+        with self.lock:
+            return {
+                'entries': len(self.conversations),
+                'messages': sum(len(conversation.messages) for conversation in self.conversations.values()),
+                'bytes': self.total_bytes,
+                'evictions': dict(self.evictions),
+            }
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.conversations
+
+    def __len__(self):
+        with self.lock:
+            return len(self.conversations)
+
+def message_size(message):
+    """
+    Approximates the memory used by a message in bytes.
+    """
+    return MESSAGE_OVERHEAD_BYTES + len(message['content'].encode('utf-8'))
@@ -0,0 +1,199 @@
+import asyncio
+import logging
+import queue
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+class EventDispatcher:
+    """
+    Runs event handlers on a bounded pool of worker threads.
+
+    Events that share a key (e.g. a channel or thread ID) are handled one at a
+    time in the order they were submitted, while events with different keys
+    are handled in parallel.
+    """
+
+    def __init__(self, handler, key_func, num_workers=8, max_queue_size=1000, name="dispatcher"):
+        """
+        :param handler: Function called with each event.
+        :param key_func: Function returning the ordering key of an event.
+        :param num_workers: Number of worker threads.
+        :param max_queue_size: Maximum number of pending events across all keys.
+        :param name: Prefix for the worker thread names.
+        """
+        self.handler = handler
+        self.key_func = key_func
+        self.num_workers = num_workers
+        self.max_queue_size = max_queue_size
+        self.name = name
+        self.lock = threading.Lock()
+        self.drained = threading.Condition(self.lock)
+        self.pending = {}  # key -> deque of events waiting for that key
+        self.pending_count = 0
+        self.ready_keys = queue.Queue()
+        self.workers = []
+        self.running = False
+
+    def start(self):
+        with self.lock:
+            if self.running:
+                return
+            self.running = True
+        for i in range(self.num_workers):
+            worker = threading.Thread(target=self._worker_loop, name=f"{self.name}-{i}", daemon=True)
+            worker.start()
+            self.workers.append(worker)
+        logger.info(f"EventDispatcher started with {self.num_workers} workers.")
+
+    def dispatch(self, event):
+        """
+        Queues an event for its key. Returns False if the event was dropped
+        because the queue is full or the dispatcher is not running.
+        """
+        try:
+            key = self.key_func(event)
+        except Exception as e:
+            logger.error(f"Failed to compute dispatch key: {e}")
+            return False
+
+        with self.lock:
+            if not self.running:
+                logger.warning("EventDispatcher is not running. Dropping event.")
+                return False
+            if self.pending_count >= self.max_queue_size:
+                logger.warning(f"Event queue is full ({self.max_queue_size} pending). Dropping event for {key}.")
+                return False
+            self.pending_count += 1
+            if key in self.pending:
+                # A worker already owns this key; it will pick the event up in order
+                self.pending[key].append(event)
+                return True
+            self.pending[key] = deque([event])
+        self.ready_keys.put(key)
+        return True
+
+    def _worker_loop(self):
+        while True:
+            key = self.ready_keys.get()
+            if key is None:
+                break
+            with self.lock:
+                event = self.pending[key].popleft()
+            try:
+                self.handler(event)
+            except Exception as e:
+                logger.exception(f"Error while handling event for {key}: {e}")
+            with self.lock:
+                self.pending_count -= 1
+                if self.pending[key]:
+                    requeue = True
+                else:
+                    del self.pending[key]
+                    requeue = False
+                if self.pending_count == 0:
+                    self.drained.notify_all()
+            if requeue:
+                # Go to the back of the line so busy keys don't starve others
+                self.ready_keys.put(key)
+
+    def queue_size(self):
+        with self.lock:
+            return self.pending_count
+
+    def stop(self, timeout=None):
+        """
+        Stops accepting events, lets the workers finish what is already queued
+        and joins them.
+        :param timeout: (Optional) Longest wait for the whole shutdown, in seconds.
+            Workers still busy after it are left behind as daemon threads.
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self.lock:
+            if not self.running:
+                return
+            self.running = False
+            # Let the workers drain what is already queued before telling them to exit
+            if not self.drained.wait_for(lambda: self.pending_count == 0, timeout):
+                logger.warning(f"EventDispatcher stopped with {self.pending_count} events still pending.")
+        for _ in self.workers:
+            self.ready_keys.put(None)
+        for worker in self.workers:
+            worker.join(max(0, deadline - time.monotonic()) if deadline is not None else None)
+        self.workers = []
+        logger.info("EventDispatcher stopped.")
+
+class AsyncEventDispatcher:
+    """
+    asyncio counterpart of `EventDispatcher`.
+
+    Each event becomes a task; tasks with the same key wait for the previous
+    one, and a semaphore caps how many handlers run at once.
+    """
+
+    def __init__(self, handler, key_func, max_concurrency=8, max_queue_size=1000):
+        """
+        :param handler: Coroutine function called with each event.
+        :param key_func: Function returning the ordering key of an event.
+        :param max_concurrency: Maximum number of handlers running at once.
+        :param max_queue_size: Maximum number of pending events across all keys.
+        """
+        self.handler = handler
+        self.key_func = key_func
+        self.max_queue_size = max_queue_size
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.tails = {}  # key -> last task scheduled for that key
+        self.tasks = set()
+
+    def dispatch(self, event):
+        """
+        Schedules an event on the running loop. Returns False if the event was
+        dropped because the queue is full.
+        """
+        try:
+            key = self.key_func(event)
+        except Exception as e:
+            logger.error(f"Failed to compute dispatch key: {e}")
+            return False
+        if len(self.tasks) >= self.max_queue_size:
+            logger.warning(f"Event queue is full ({self.max_queue_size} pending). Dropping event for {key}.")
+            return False
+
+        previous = self.tails.get(key)
+        task = asyncio.get_running_loop().create_task(self._run(key, event, previous))
+        self.tails[key] = task
+        self.tasks.add(task)
+        task.add_done_callback(lambda t: self._forget(key, t))
+        return True
+
+    async def _run(self, key, event, previous):
+        if previous is not None:
+            # Errors of the previous event are logged by its own task
+            await asyncio.gather(previous, return_exceptions=True)
+        async with self.semaphore:
+            try:
+                await self.handler(event)
+            except Exception as e:
+                logger.exception(f"Error while handling event for {key}: {e}")
+
+    def _forget(self, key, task):
+        self.tasks.discard(task)
+        if self.tails.get(key) is task:
+            del self.tails[key]
+
+    def queue_size(self):
+        return len(self.tasks)
+
+    async def stop(self, timeout=None):
+        """
+        Waits for the scheduled events to finish, cancelling them after `timeout`.
+        """
+        if not self.tasks:
+            return
+        done, pending = await asyncio.wait(set(self.tasks), timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            logger.warning(f"AsyncEventDispatcher stopped with {len(pending)} events still pending.")
@@ -0,0 +1,84 @@
+import json
+import re
+
+# Events the clients act on: posts for the listeners, `hello` for readiness
+# and the changes the metadata cache follows. Other frames (typing, status,
+# reactions, ...) are dropped before they are decoded.
+WANTED_EVENTS = frozenset({
+    'posted', 'hello', 'post_deleted', 'user_updated', 'channel_updated', 'channel_deleted',
+})
+
+# The first "event" key of a frame is the event type: the server writes it
+# before the data, and the post itself is a nested JSON string whose quotes
+# are escaped, so it can't be matched
+EVENT_PATTERN = re.compile(r'"event"\s*:\s*"([^"\\]*)"')
+# The author of a `posted` frame, inside the escaped post JSON. The server
+# writes `user_id` before the message and props, so the first match is the
+# author's and text quoting it (escaped twice) doesn't match
+POST_USER_PATTERN = re.compile(r'\\"user_id\\"\s*:\s*\\"([^"\\]*)\\"')
+
+# Key under which the decoded `Post` of an event is kept
+POST_KEY = 'decoded_post'
+
+def wanted_frame(frame, bot_id=None):
+    """
+    Tells from a raw WebSocket frame, without decoding it, whether it may be
+    of interest: events of other types and the bot's own posts are not.
+    Frames that can't be read this way are kept.
+    :param frame: The text of the frame.
+    :param bot_id: User ID of the bot, if known.
+    """
+    match = EVENT_PATTERN.search(frame)
+    if match is None:
+        return True
+    event = match.group(1)
+    if event not in WANTED_EVENTS:
+        return False
+    if event == 'posted' and bot_id:
+        author = POST_USER_PATTERN.search(frame)
+        if author is not None and author.group(1) == bot_id:
+            return False
+    return True
+
+class Post:
+    """
+    The fields of a Mattermost post the bot uses.
+    """
+
+    __slots__ = ('id', 'channel_id', 'root_id', 'user_id', 'message', 'file_ids', 'type', 'create_at')
+
+    def __init__(self, data):
+        """
+        :param data: The post as a dict.
+        """
+        self.id = data.get('id')
+        self.channel_id = data.get('channel_id')
+        self.root_id = data.get('root_id') or ''
+        self.user_id = data.get('user_id')
+        self.message = data.get('message') or ''
+        self.file_ids = data.get('file_ids') or []
+        self.type = data.get('type') or ''
+        self.create_at = data.get('create_at') or 0
+
+    def __repr__(self):
+        return f"Post(id={self.id!r}, channel_id={self.channel_id!r}, user_id={self.user_id!r})"
+
+def event_post(event_data):
+    """
+    Returns the `Post` of an event, decoding the `post` JSON string of its
+    data the first time and keeping the result in the event, so later calls
+    for the same event don't decode it again.
+    :return: The post, or None if the event has none or it isn't valid JSON.
+    """
+    if POST_KEY in event_data:
+        return event_data[POST_KEY]
+    post = None
+    raw = (event_data.get('data') or {}).get('post')
+    if raw:
+        try:
+            data = json.loads(raw) if isinstance(raw, str) else raw
+            post = Post(data) if isinstance(data, dict) else None
+        except ValueError:
+            post = None
+    event_data[POST_KEY] = post
+    return post
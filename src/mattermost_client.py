@@ -1,11 +1,30 @@
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import websocket
 import threading
 import json
-import time
 import logging
-import shutil  # Added import
-from .config import MATTERMOST_URL, MATTERMOST_TOKEN, MATTERMOST_BOTNAME
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from .config import (
+    MATTERMOST_URL,
+    MATTERMOST_TOKEN,
+    MATTERMOST_BOTNAME,
+    MATTERMOST_POOL_SIZE,
+    MATTERMOST_CONNECT_TIMEOUT,
+    MATTERMOST_READ_TIMEOUT,
+    MATTERMOST_MAX_RETRIES,
+    MATTERMOST_RECONNECT_BASE_DELAY,
+    MATTERMOST_RECONNECT_MAX_DELAY,
+    MATTERMOST_READY_TIMEOUT,
+    MATTERMOST_CATCH_UP_MAX_AGE
+)
+from .multipart import encode_form, iter_parts, PartsReader
+from .resilience import create_resilience, classify_status, parse_retry_after, Outcome, RequestRejected
+from .metadata_cache import create_metadata_cache
+from .events import wanted_frame
+from .reconnect import ReconnectBackoff, EventTracker, missed_post_events
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
@@ -14,6 +33,68 @@ formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(messag
 handler.setFormatter(formatter)
 logger.addHandler(handler)
 
+# Size of the chunks file downloads are streamed in
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+# Largest page of users the API returns
+USERS_PER_PAGE = 200
+# Most user IDs resolved per POST /users/ids request
+USERS_BY_IDS_BATCH_SIZE = 200
+
+# One pooled, keep-alive session shared by every MattermostClient instance,
+# including the ones the plugins create.
+_http_session = None
+_http_session_lock = threading.Lock()
+
+def get_http_session():
+    """
+    Returns the shared `requests.Session`, creating it on first use.
+    """
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            _http_session = create_http_session()
+        return _http_session
+
+def create_http_session():
+    """
+    Creates a session with a connection pool of MATTERMOST_POOL_SIZE and
+    transport-level retries of failed connections. Requests that reached the
+    server are retried by `resilience`, which honors Retry-After, the retry
+    budget and the circuit breakers.
+    """
+    retries = Retry(
+        total=MATTERMOST_MAX_RETRIES,
+        read=0,
+        status=0,
+        backoff_factor=0.5,
+        allowed_methods=frozenset(['GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS']),
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(pool_connections=MATTERMOST_POOL_SIZE, pool_maxsize=MATTERMOST_POOL_SIZE, max_retries=retries)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+# Retries and circuit breakers shared by every MattermostClient instance
+resilience = create_resilience("Mattermost")
+# Users, direct channels and file infos, shared by every MattermostClient instance
+metadata_cache = create_metadata_cache()
+
+def classify_response(response, error, idempotent):
+    """
+    Classifies the outcome of a Mattermost REST request for `resilience`.
+    Requests that failed without a response are only sent again if they are
+    idempotent, since they may have been processed.
+    """
+    if error is not None:
+        if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+            return Outcome(idempotent, True, None)
+        return Outcome(False, False, None)
+    status = response.status_code
+    retry_after = parse_retry_after(response.headers.get('Retry-After')) if status == 429 or status >= 500 else None
+    return classify_status(status, retry_after, idempotent)
+
 class MattermostClient:
     def __init__(self):
         self.url = MATTERMOST_URL.rstrip('/')
@@ -23,6 +104,8 @@ class MattermostClient:
             'Authorization': f'Bearer {self.token}',
             'Content-Type': 'application/json'
         }
+        self.session = get_http_session()
+        self.timeout = (MATTERMOST_CONNECT_TIMEOUT, MATTERMOST_READ_TIMEOUT)
         self.bot_id = None
         self.ws_client = WebSocketClient(self)
         self.message_listeners = []
@@ -41,7 +124,8 @@ class MattermostClient:
         event = event_data.get('event')
         if event == 'posted':
             self.notify_listeners(event_data)
-        # Handle other event types as needed
+        else:
+            metadata_cache.handle_event(event_data)
 
     def notify_listeners(self, data):
         for listener in self.message_listeners:
@@ -54,7 +138,23 @@ class MattermostClient:
         """
         self.message_listeners.append(callback)
 
-    def post_message(self, channel_id, message, root_id=None, file_ids=None, props=None):
+    def send(self, endpoint, request, idempotent=False, retry=True):
+        """
+        Sends a REST request with retries and the endpoint's circuit breaker.
+        :param endpoint: Name of the endpoint, e.g. "POST /posts".
+        :param request: Function sending the request and returning the response.
+        :param idempotent: Whether the request may be sent again after an error
+            that leaves it unknown whether it was processed.
+        :param retry: False for requests whose body can only be sent once.
+        :return: The response of the last attempt. Its error is raised instead,
+            and `CircuitOpenError` while the endpoint is failing.
+        """
+        return resilience.call(
+            endpoint, request, lambda response, error: classify_response(response, error, idempotent), retry
+        )
+
+    def post_message(self, channel_id, message, root_id=None, file_ids=None, props=None, pending_post_id=None,
+                     retry=True, raise_errors=False):
         """
         Sends a message to a specified Mattermost channel.
         :param channel_id: ID of the channel.
@@ -62,11 +162,18 @@ class MattermostClient:
         :param root_id: (Optional) ID of the root post for threaded messages.
         :param file_ids: (Optional) List of file IDs to attach.
         :param props: (Optional) Additional properties for the post.
+        :param pending_post_id: (Optional) Client-side ID of the post. Mattermost
+            creates one post per ID, so sending the post again with the same ID
+            can't duplicate it. A new ID is used if not given.
+        :param retry: False to send the post once, for callers that retry themselves.
+        :param raise_errors: Raise `RequestRejected` with the status instead of
+            returning None if Mattermost rejects the post.
         :return: JSON response from Mattermost.
         """
         payload = {
             'channel_id': channel_id,
-            'message': message
+            'message': message,
+            'pending_post_id': pending_post_id or uuid.uuid4().hex
         }
         if root_id:
             payload['root_id'] = root_id
@@ -76,83 +183,252 @@ class MattermostClient:
             payload['props'] = props
 
         logger.debug(f"Sending payload: {json.dumps(payload, indent=2)}")
-        response = requests.post(f"{self.url}/api/v4/posts", headers=self.headers, json=payload)
+        # The pending post ID makes the request safe to retry
+        response = self.send("POST /posts", lambda: self.session.post(
+            f"{self.url}/api/v4/posts", headers=self.headers, json=payload, timeout=self.timeout
+        ), idempotent=True, retry=retry)
         if response.status_code == 201:
             logger.debug(f"Message posted successfully to channel {channel_id}.")
             return response.json()
-        else:
-            logger.error(f"Failed to post message: {response.status_code} - {response.text}")
-            return None
+        if raise_errors:
+            raise RequestRejected("Mattermost", response.status_code, response.text,
+                                  parse_retry_after(response.headers.get('Retry-After')))
+        logger.error(f"Failed to post message: {response.status_code} - {response.text}")
+        return None
 
-    def get_users(self):
+    def patch_post(self, post_id, message):
         """
-        Retrieves the list of users.
-        :return: JSON response with users details.
+        Updates the message of an existing post.
+        :param post_id: ID of the post to update.
+        :param message: The new message text.
+        :return: JSON response from Mattermost.
         """
-        response = requests.get(f"{self.url}/api/v4/users", headers=self.headers)
+        response = self.send("PUT /posts/patch", lambda: self.session.put(
+            f"{self.url}/api/v4/posts/{post_id}/patch",
+            headers=self.headers,
+            json={'message': message},
+            timeout=self.timeout
+        ), idempotent=True)
         if response.status_code == 200:
+            logger.debug(f"Post {post_id} updated successfully.")
             return response.json()
         else:
-            logger.error(f"Failed to get the list of users: {response.status_code} - {response.text}")
+            logger.error(f"Failed to update post {post_id}: {response.status_code} - {response.text}")
+            return None
+
+    def get_users(self, concurrency=1):
+        """
+        Retrieves the list of all users. On large servers prefer `iter_users`,
+        which doesn't hold every user in memory.
+        :param concurrency: See `iter_users`.
+        :return: List of user details, or None on failure.
+        """
+        try:
+            return list(self.iter_users(concurrency=concurrency))
+        except requests.RequestException as e:
+            logger.error(f"Failed to get the list of users: {e}")
             return None
 
+    def get_users_page(self, page, per_page=USERS_PER_PAGE, params=None):
+        """
+        Retrieves one page of users.
+        :param params: (Optional) Additional query parameters, e.g. {'in_channel': channel_id}.
+        :return: List of user details.
+        Raises `requests.HTTPError` if the request fails.
+        """
+        query = dict(params or {}, page=page, per_page=per_page)
+        response = self.send("GET /users", lambda: self.session.get(
+            f"{self.url}/api/v4/users", headers=self.headers, params=query, timeout=self.timeout
+        ), idempotent=True)
+        response.raise_for_status()
+        return response.json()
+
+    def iter_users(self, per_page=USERS_PER_PAGE, concurrency=1, params=None):
+        """
+        Yields every user, one page at a time, so memory use doesn't grow with
+        the number of users.
+        :param per_page: Users per request, at most USERS_PER_PAGE.
+        :param concurrency: Number of pages requested at the same time. Pages
+            are still yielded in order, and at most this many are held in memory.
+        :param params: (Optional) Additional query parameters, see `get_users_page`.
+        Raises `requests.HTTPError` if a page can't be retrieved.
+        """
+        if concurrency <= 1:
+            page = 0
+            while True:
+                users = self.get_users_page(page, per_page, params)
+                yield from users
+                if len(users) < per_page:
+                    return
+                page += 1
+
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="users") as executor:
+            # Keep `concurrency` pages in flight, yielding them in order
+            pending = [executor.submit(self.get_users_page, page, per_page, params) for page in range(concurrency)]
+            next_page = concurrency
+            try:
+                while pending:
+                    users = pending.pop(0).result()
+                    yield from users
+                    if len(users) < per_page:
+                        # Past the last page, the requests still in flight return nothing
+                        return
+                    pending.append(executor.submit(self.get_users_page, next_page, per_page, params))
+                    next_page += 1
+            finally:
+                for future in pending:
+                    future.cancel()
+
+    def get_users_by_ids(self, user_ids):
+        """
+        Resolves many user IDs with as few requests as possible: users in the
+        metadata cache are served from it, the others are retrieved in batches
+        of USERS_BY_IDS_BATCH_SIZE with POST /users/ids and cached.
+        :param user_ids: Iterable of user IDs.
+        :return: List of user details in the order of `user_ids`; unknown IDs
+            are left out. None if a request fails.
+        """
+        user_ids = list(dict.fromkeys(user_ids))
+        users = {}
+        missing = []
+        for user_id in user_ids:
+            user = metadata_cache.get('user', user_id)
+            if user is None:
+                missing.append(user_id)
+            else:
+                users[user_id] = user
+
+        for start in range(0, len(missing), USERS_BY_IDS_BATCH_SIZE):
+            batch = missing[start:start + USERS_BY_IDS_BATCH_SIZE]
+            # A read, even though it is a POST
+            response = self.send("POST /users/ids", lambda: self.session.post(
+                f"{self.url}/api/v4/users/ids", headers=self.headers, json=batch, timeout=self.timeout
+            ), idempotent=True)
+            if response.status_code != 200:
+                logger.error(f"Failed to get users by IDs: {response.status_code} - {response.text}")
+                return None
+            for user in response.json():
+                users[user['id']] = user
+                metadata_cache.set('user', user['id'], user)
+
+        return [users[user_id] for user_id in user_ids if user_id in users]
+
+    def get_missed_post_events(self, since):
+        """
+        Retrieves the posts created since a given time in the channels the bot
+        is a member of, for example while the WebSocket was disconnected.
+        :param since: Time in milliseconds since the epoch.
+        :return: List of `posted` events, oldest first in each channel.
+        """
+        response = self.send("GET /users/channels", lambda: self.session.get(
+            f"{self.url}/api/v4/users/{self.bot_id}/channels", headers=self.headers, timeout=self.timeout
+        ), idempotent=True)
+        if response.status_code != 200:
+            logger.error(f"Failed to get the channels of the bot: {response.status_code} - {response.text}")
+            return []
+
+        events = []
+        for channel in response.json():
+            # Skip channels without new posts
+            if channel.get('last_post_at', 0) < since:
+                continue
+            channel_id = channel['id']
+            response = self.send("GET /channels/posts", lambda: self.session.get(
+                f"{self.url}/api/v4/channels/{channel_id}/posts", headers=self.headers,
+                params={'since': since}, timeout=self.timeout
+            ), idempotent=True)
+            if response.status_code != 200:
+                logger.error(f"Failed to get the posts of channel {channel_id}: {response.status_code} - {response.text}")
+                continue
+            events.extend(missed_post_events(channel, response.json(), since, self.bot_id))
+        return events
+
     def get_user(self, user_id):
         """
-        Retrieves user information by user ID.
+        Retrieves user information by user ID, from the metadata cache if possible.
         :param user_id: The Mattermost user ID.
         :return: JSON response with user details.
         """
-        response = requests.get(f"{self.url}/api/v4/users/{user_id}", headers=self.headers)
-        if response.status_code == 200:
-            return response.json()
-        else:
+        def load():
+            response = self.send("GET /users/id", lambda: self.session.get(
+                f"{self.url}/api/v4/users/{user_id}", headers=self.headers, timeout=self.timeout
+            ), idempotent=True)
+            if response.status_code == 200:
+                return response.json()
             logger.error(f"Failed to get user {user_id}: {response.status_code} - {response.text}")
             return None
 
+        return metadata_cache.get_or_load('user', user_id, load)
+
     def get_me(self):
         """
-        Retrieves information about the bot itself.
+        Retrieves information about the bot itself, from the metadata cache if possible.
         :return: JSON response with bot user details.
         """
-        response = requests.get(f"{self.url}/api/v4/users/me", headers=self.headers)
-        if response.status_code == 200:
-            return response.json()
-        else:
+        def load():
+            response = self.send("GET /users/me", lambda: self.session.get(
+                f"{self.url}/api/v4/users/me", headers=self.headers, timeout=self.timeout
+            ), idempotent=True)
+            if response.status_code == 200:
+                return response.json()
             logger.error(f"Failed to get bot user info: {response.status_code} - {response.text}")
             return None
 
-    def get_direct_channel_id(self, user_id):
-        bot_id = self.get_me().get('id')
-        logger.debug(f"Bot ID: {bot_id}")
-        logger.debug(f"Target User ID: {user_id}")
+        return metadata_cache.get_or_load('me', self.token, load)
 
-        if not bot_id or not user_id:
+    def get_direct_channel_id(self, user_id):
+        """
+        Returns the ID of the direct channel between the bot and a user,
+        creating the channel if needed.
+        """
+        if not user_id:
             logger.error("One of the user IDs is invalid.")
             return None
 
-        # Send payload as a JSON array
-        payload = [bot_id, user_id]
-        logger.debug(f"Payload being sent: {json.dumps(payload)}")
+        def load():
+            me = self.get_me()
+            bot_id = me.get('id') if me else None
+            logger.debug(f"Bot ID: {bot_id}")
+            logger.debug(f"Target User ID: {user_id}")
 
-        response = requests.post(f"{self.url}/api/v4/channels/direct", headers=self.headers, json=payload)
-        logger.debug(f"Direct channel response: {response.status_code} - {response.text}")
+            if not bot_id:
+                logger.error("One of the user IDs is invalid.")
+                return None
 
-        if response.status_code in [200, 201]:
-            channel = response.json()
-            logger.debug(f"Direct channel created with ID: {channel['id']}")
-            return channel['id']
-        else:
+            # Send payload as a JSON array
+            payload = [bot_id, user_id]
+            logger.debug(f"Payload being sent: {json.dumps(payload)}")
+
+            # Creating a direct channel returns the existing one, so it is safe to repeat
+            response = self.send("POST /channels/direct", lambda: self.session.post(
+                f"{self.url}/api/v4/channels/direct", headers=self.headers, json=payload, timeout=self.timeout
+            ), idempotent=True)
+            logger.debug(f"Direct channel response: {response.status_code} - {response.text}")
+
+            if response.status_code in [200, 201]:
+                channel = response.json()
+                logger.debug(f"Direct channel created with ID: {channel['id']}")
+                return channel['id']
             logger.error(f"Failed to get/create direct channel: {response.status_code} - {response.text}")
             return None
 
+        return metadata_cache.get_or_load('direct_channel', user_id, load)
+
     def get_file_info(self, file_id):
-        response = requests.get(f"{self.url}/api/v4/files/{file_id}/info", headers=self.headers)
-        if response.status_code == 200:
-            return response.json()
-        else:
+        """
+        Retrieves the metadata of a file, from the metadata cache if possible.
+        """
+        def load():
+            response = self.send("GET /files/info", lambda: self.session.get(
+                f"{self.url}/api/v4/files/{file_id}/info", headers=self.headers, timeout=self.timeout
+            ), idempotent=True)
+            if response.status_code == 200:
+                return response.json()
             logger.error(f"Failed to get file info: {response.status_code} - {response.text}")
             return None
 
+        return metadata_cache.get_or_load('file_info', file_id, load)
+
     def download_file(self, file_id, destination_path):
         """
         Downloads a file from Mattermost using the file ID.
@@ -160,19 +436,35 @@ class MattermostClient:
         Returns True if successful, False otherwise.
         """
         try:
-            response = requests.get(f"{self.url}/api/v4/files/{file_id}", headers=self.headers, stream=True)
-            if response.status_code == 200:
-                with open(destination_path, 'wb') as f:
-                    shutil.copyfileobj(response.raw, f)
-                logger.debug(f"File downloaded successfully to {destination_path}.")
-                return True
-            else:
-                logger.error(f"Failed to download file: {response.status_code} - {response.text}")
-                return False
+            with self.send("GET /files", lambda: self.session.get(
+                f"{self.url}/api/v4/files/{file_id}", headers=self.headers, stream=True, timeout=self.timeout
+            ), idempotent=True) as response:
+                if response.status_code == 200:
+                    with open(destination_path, 'wb') as f:
+                        for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                            f.write(chunk)
+                    logger.debug(f"File downloaded successfully to {destination_path}.")
+                    return True
+                else:
+                    logger.error(f"Failed to download file: {response.status_code} - {response.text}")
+                    return False
         except Exception as e:
             logger.error(f"Exception during file download: {e}")
             return False
 
+    def iter_file(self, file_id, chunk_size=DOWNLOAD_CHUNK_SIZE):
+        """
+        Streams the content of a file from Mattermost in chunks, without
+        writing it to disk.
+        Raises `requests.HTTPError` if the download fails.
+        """
+        # Only opening the download is retried, not a partly received file
+        with self.send("GET /files", lambda: self.session.get(
+            f"{self.url}/api/v4/files/{file_id}", headers=self.headers, stream=True, timeout=self.timeout
+        ), idempotent=True) as response:
+            response.raise_for_status()
+            yield from response.iter_content(chunk_size)
+
     def upload_file(self, channel_id, file_bytes, filename, mime_type='application/octet-stream'):
         """
         Uploads a file to a specified Mattermost channel.
@@ -183,95 +475,248 @@ class MattermostClient:
         :param mime_type: MIME type of the file.
         :return: file_id if successful, None otherwise.
         """
+        file_ids = self.upload_files(channel_id, [(filename, file_bytes, mime_type)])
+        return file_ids[0] if file_ids else None
+
+    def upload_files(self, channel_id, files):
+        """
+        Uploads several files to a specified Mattermost channel in one multipart request.
+
+        :param channel_id: ID of the channel where the files will be uploaded.
+        :param files: List of (filename, file_bytes, mime_type) tuples.
+        :return: List of file_ids in the order of `files` if successful, None otherwise.
+        """
         upload_url = f"{self.url}/api/v4/files"
         headers = {
             'Authorization': f'Bearer {self.token}'
         }
-        files = {
-            'files': (filename, file_bytes, mime_type)
-        }
         data = {
             'channel_id': channel_id
         }
+        filenames = ", ".join(filename for filename, _, _ in files)
 
-        logger.debug(f"Uploading file {filename} to channel {channel_id}.")
+        logger.debug(f"Uploading files {filenames} to channel {channel_id}.")
         try:
-            response = requests.post(upload_url, headers=headers, files=files, data=data)
+            response = self.send("POST /files", lambda: self.session.post(
+                upload_url,
+                headers=headers,
+                files=[('files', file) for file in files],
+                data=data,
+                timeout=self.timeout
+            ))
             if response.status_code == 201:
                 json_response = response.json()
-                file_infos = json_response.get('file_infos')
-                file_id = file_infos[0].get('id')
-                logger.debug(f"File uploaded successfully with ID: {file_id}")
-                return file_id
+                file_ids = [file_info.get('id') for file_info in json_response.get('file_infos')]
+                logger.debug(f"Files uploaded successfully with IDs: {file_ids}")
+                return file_ids
+            else:
+                logger.error(f"Failed to upload files: {response.status_code} - {response.text}")
+                return None
+        except Exception as e:
+            logger.error(f"Exception during file upload: {e}")
+            return None
+
+    def upload_streams(self, channel_id, files):
+        """
+        Uploads several files to a specified Mattermost channel in one
+        streaming multipart request. The file contents are sent as they are
+        read from their iterables and never held in memory as a whole.
+
+        :param channel_id: ID of the channel where the files will be uploaded.
+        :param files: List of (filename, chunks, mime_type, size) tuples, where
+            `chunks` is an iterable of byte strings and `size` is its total
+            length, or None if unknown.
+        :return: List of file_ids in the order of `files` if successful, None otherwise.
+        """
+        content_type, parts, length = encode_form(
+            [('channel_id', channel_id)],
+            [('files', filename, chunks, mime_type, size) for filename, chunks, mime_type, size in files]
+        )
+        headers = {
+            'Authorization': f'Bearer {self.token}',
+            'Content-Type': content_type
+        }
+        filenames = ", ".join(filename for filename, _, _, _ in files)
+
+        logger.debug(f"Streaming files {filenames} to channel {channel_id}.")
+        # requests sets Content-Length for a body with a length, and sends
+        # an iterator with chunked transfer encoding; never both
+        body = PartsReader(parts, length) if length is not None else iter_parts(parts)
+        try:
+            # The streamed body can only be sent once
+            response = self.send("POST /files", lambda: self.session.post(
+                f"{self.url}/api/v4/files",
+                headers=headers,
+                data=body,
+                timeout=self.timeout
+            ), retry=False)
+            if response.status_code == 201:
+                file_ids = [file_info.get('id') for file_info in response.json().get('file_infos')]
+                logger.debug(f"Files uploaded successfully with IDs: {file_ids}")
+                return file_ids
             else:
-                logger.error(f"Failed to upload file: {response.status_code} - {response.text}")
+                logger.error(f"Failed to upload files: {response.status_code} - {response.text}")
                 return None
         except Exception as e:
             logger.error(f"Exception during file upload: {e}")
             return None
 
+    def disconnect(self):
+        """
+        Stops listening: closes the WebSocket connection. Posts can still be sent.
+        """
+        self.ws_client.close()
+
     def close(self):
         """
         Closes the WebSocket connection and performs any necessary cleanup.
         """
-        self.ws_client.close()
+        self.disconnect()
         logger.info("MattermostClient closed.")
 
 class WebSocketClient:
+    """
+    Keeps a WebSocket connection to Mattermost open from one long-lived
+    thread, reconnecting with capped exponential backoff when it drops.
+
+    `ready` is set once the server greets a connection with `hello` and
+    cleared when it closes. After a reconnect, posts created while the
+    connection was down are fetched and delivered like live events. Events
+    seen twice, by `seq` or post ID, are delivered once.
+    """
+
     def __init__(self, mattermost_client):
         self.mm_client = mattermost_client
         self.message_listeners = []
         self.ws = None
         self.ws_thread = None
-        self.reconnect_delay = 5  # seconds
+        self.lock = threading.Lock()
+        self.ready = threading.Event()
+        self.closed = threading.Event()
+        self.backoff = ReconnectBackoff(MATTERMOST_RECONNECT_BASE_DELAY, MATTERMOST_RECONNECT_MAX_DELAY)
+        self.tracker = EventTracker()
+        self.catch_up_since = None
 
-    def connect(self):
+    def connect(self, timeout=MATTERMOST_READY_TIMEOUT):
+        """
+        Starts the connection thread and waits up to `timeout` seconds for the
+        connection to be ready. If it isn't, the thread keeps trying.
+        :return: True if the connection is ready.
+        """
         # Get bot ID first
-        self.mm_client.bot_id = self.mm_client.get_me().get('id')
+        me = self.mm_client.get_me()
+        self.mm_client.bot_id = me.get('id') if me else None
         if not self.mm_client.bot_id:
             logger.error("Failed to get bot ID. Check your token and permissions.")
-            return
+            return False
 
-        # Establish WebSocket connection
+        self.closed.clear()
+        self.ws_thread = threading.Thread(target=self.run, name="mattermost-websocket", daemon=True)
+        self.ws_thread.start()
+        if not self.ready.wait(timeout):
+            logger.warning(f"WebSocket not ready after {timeout} seconds, still trying in the background.")
+            return False
+        logger.info("WebSocket connection ready.")
+        return True
+
+    def run(self):
+        """
+        Runs connections one after the other until `close` is called.
+        """
         api_url = self.mm_client.url.replace('https', 'wss').replace('http', 'ws') + '/api/v4/websocket'
-        logger.info(f"Connecting to Mattermost WebSocket at {api_url}")
         headers = [
             f"Authorization: Bearer {self.mm_client.token}"
         ]
-        self.ws = websocket.WebSocketApp(
-            api_url,
-            header=headers,
-            on_open=self.on_open,
-            on_message=self.on_message,
-            on_error=self.on_error,
-            on_close=self.on_close
-        )
-        self.ws_thread = threading.Thread(target=self.ws.run_forever, daemon=True)
-        self.ws_thread.start()
-        # Wait for connection establishment
-        time.sleep(1)
-        logger.info("WebSocket connection thread started.")
+        while True:
+            with self.lock:
+                if self.closed.is_set():
+                    break
+                logger.info(f"Connecting to Mattermost WebSocket at {api_url}")
+                self.ws = websocket.WebSocketApp(
+                    api_url,
+                    header=headers,
+                    on_open=self.on_open,
+                    on_message=self.on_message,
+                    on_error=self.on_error,
+                    on_close=self.on_close
+                )
+            try:
+                self.ws.run_forever()
+            except Exception as e:
+                logger.error(f"WebSocket encountered error: {e}")
+            self.ready.clear()
+            if self.closed.is_set():
+                break
+            delay = self.backoff.next_delay()
+            logger.info(f"Attempting to reconnect in {delay:.1f} seconds...")
+            self.closed.wait(delay)
 
     def on_open(self, ws):
+        with self.lock:
+            if self.closed.is_set():
+                # `close` ran after this connection was set up but before its
+                # socket existed, so nothing has closed it yet
+                ws.close()
+                return
         logger.info("WebSocket connection opened.")
+        # Work out what was missed before the new connection's events arrive
+        self.catch_up_since = self.tracker.catch_up_since(MATTERMOST_CATCH_UP_MAX_AGE)
+        self.tracker.connection_opened()
 
     def on_message(self, ws, message):
+        # Skip typing, status, reaction... events and the bot's own posts without decoding them
+        if not wanted_frame(message, self.mm_client.bot_id):
+            return
         try:
             event_data = json.loads(message)
-            logger.debug(f"Received WebSocket message: {event_data}")
-            for listener in self.message_listeners:
-                listener(event_data)
         except json.JSONDecodeError as e:
             logger.error(f"Failed to decode WebSocket message: {e}")
+            return
+        logger.debug(f"Received WebSocket event: {event_data.get('event')} (seq {event_data.get('seq')})")
+        if event_data.get('event') == 'hello':
+            self.on_ready()
+        self.deliver(event_data)
+
+    def on_ready(self):
+        self.backoff.reset()
+        self.ready.set()
+        since, self.catch_up_since = self.catch_up_since, None
+        if since is not None:
+            # Keep reading live events while catching up
+            threading.Thread(target=self.catch_up, args=(since,), name="mattermost-catch-up", daemon=True).start()
+
+    def catch_up(self, since):
+        """
+        Delivers the posts created since `since` (milliseconds since the epoch).
+        """
+        try:
+            events = self.mm_client.get_missed_post_events(since)
+        except Exception as e:
+            logger.error(f"Failed to fetch the posts missed while disconnected: {e}")
+            return
+        logger.info(f"Catching up on {len(events)} posts missed while disconnected.")
+        for event_data in events:
+            self.deliver(event_data)
+
+    def deliver(self, event_data):
+        """
+        Passes an event to the listeners unless it was already delivered.
+        """
+        if self.tracker.is_duplicate(event_data):
+            logger.debug(f"Ignoring duplicate WebSocket event: {event_data.get('event')} {event_data.get('seq')}")
+            return
+        for listener in self.message_listeners:
+            try:
+                listener(event_data)
+            except Exception as e:
+                logger.error(f"WebSocket listener failed: {e}")
 
     def on_error(self, ws, error):
         logger.error(f"WebSocket encountered error: {error}")
 
     def on_close(self, ws, close_status_code, close_msg):
+        self.ready.clear()
         logger.info(f"WebSocket connection closed. Code: {close_status_code}, Message: {close_msg}")
-        logger.info(f"Attempting to reconnect in {self.reconnect_delay} seconds...")
-        time.sleep(self.reconnect_delay)
-        self.connect()
 
     def add_message_listener(self, callback):
         """
@@ -280,8 +725,21 @@ class WebSocketClient:
         """
         self.message_listeners.append(callback)
 
-    def close(self):
-        if self.ws:
-            self.ws.close()
-            self.ws_thread.join()
-            logger.info("WebSocket connection closed and thread joined.")
\ No newline at end of file
+    def close(self, timeout=30):
+        """
+        Closes the connection and stops reconnecting.
+        :param timeout: Longest wait for the connection thread to end, in seconds.
+        """
+        # Under the lock, so the connection thread either sees the flag before
+        # opening another connection or its connection is closed here
+        with self.lock:
+            self.closed.set()
+            if self.ws:
+                self.ws.close()
+        if self.ws_thread:
+            self.ws_thread.join(timeout)
+            if self.ws_thread.is_alive():
+                logger.warning(f"WebSocket thread still running {timeout} seconds after close.")
+            else:
+                logger.info("WebSocket connection closed and thread joined.")
+            self.ws_thread = None
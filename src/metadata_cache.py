@@ -0,0 +1,121 @@
+import json
+import logging
+from .cache import TTLCache
+from .events import event_post
+from .config import (
+    MATTERMOST_METADATA_CACHE_SIZE,
+    MATTERMOST_USER_CACHE_TTL,
+    MATTERMOST_CHANNEL_CACHE_TTL,
+    MATTERMOST_FILE_CACHE_TTL
+)
+
+logger = logging.getLogger(__name__)
+
+class MetadataCache:
+    """
+    Caches Mattermost metadata the bot looks up over and over: its own user
+    ('me', keyed by token), users ('user', keyed by user ID), direct channels
+    ('direct_channel', channel ID keyed by the other user's ID) and file
+    infos ('file_info', keyed by file ID).
+
+    Each kind is a `TTLCache` with its own TTL and at most `max_entries`
+    entries. `handle_event` drops entries that WebSocket events report as
+    changed. Failed lookups are not cached.
+    """
+
+    def __init__(self, ttls, max_entries=10000):
+        """
+        :param ttls: Dict of kind -> seconds its entries stay valid; kinds
+            with a TTL of 0 are not cached.
+        :param max_entries: Most entries kept per kind, least recently used first out.
+        """
+        self.caches = {kind: TTLCache(max_entries, ttl) for kind, ttl in ttls.items() if ttl}
+
+    def get_or_load(self, kind, key, load):
+        """
+        Returns the cached value of `kind` for `key`, or calls `load` and
+        caches its result unless it is None.
+        """
+        cache = self.caches.get(kind)
+        if cache is None:
+            return load()
+        value = cache.get(key)
+        if value is None:
+            value = load()
+            if value is not None:
+                cache.set(key, value)
+        return value
+
+    async def get_or_load_async(self, kind, key, load):
+        """
+        Async version of `get_or_load`; `load` is a coroutine function.
+        """
+        cache = self.caches.get(kind)
+        if cache is None:
+            return await load()
+        value = cache.get(key)
+        if value is None:
+            value = await load()
+            if value is not None:
+                cache.set(key, value)
+        return value
+
+    def get(self, kind, key):
+        cache = self.caches.get(kind)
+        return cache.get(key) if cache is not None else None
+
+    def set(self, kind, key, value):
+        cache = self.caches.get(kind)
+        if cache is not None:
+            cache.set(key, value)
+
+    def invalidate(self, kind, key):
+        cache = self.caches.get(kind)
+        if cache is not None:
+            cache.invalidate(key)
+
+    def invalidate_matching(self, kind, predicate):
+        cache = self.caches.get(kind)
+        if cache is not None:
+            cache.invalidate_matching(predicate)
+
+    def handle_event(self, event_data):
+        """
+        Drops the entries a WebSocket event reports as changed.
+        """
+        event = event_data.get('event')
+        data = event_data.get('data') or {}
+        try:
+            if event == 'user_updated':
+                user_id = (data.get('user') or {}).get('id')
+                self.invalidate('user', user_id)
+                self.invalidate_matching('me', lambda key, me: me.get('id') == user_id)
+            elif event in ('channel_updated', 'channel_deleted'):
+                channel_id = data.get('channel_id') or json.loads(data.get('channel') or '{}').get('id')
+                self.invalidate_matching('direct_channel', lambda key, value: value == channel_id)
+            elif event == 'post_deleted':
+                post = event_post(event_data)
+                for file_id in post.file_ids if post is not None else []:
+                    self.invalidate('file_info', file_id)
+            elif event == 'hello':
+                # Sent on every (re)connection: user updates may have been
+                # missed while disconnected. Direct channel and file IDs don't change.
+                cache = self.caches.get('user')
+                if cache is not None:
+                    cache.clear()
+        except (AttributeError, ValueError) as e:
+            logger.error(f"Failed to apply {event} event to the metadata cache: {e}")
+
+    def stats(self):
+        return {kind: cache.stats() for kind, cache in self.caches.items()}
+
+def create_metadata_cache():
+    """
+    Returns a `MetadataCache` configured by the MATTERMOST_*_CACHE_TTL settings.
+    """
+    return MetadataCache({
+        'me': MATTERMOST_USER_CACHE_TTL,
+        'user': MATTERMOST_USER_CACHE_TTL,
+        'direct_channel': MATTERMOST_CHANNEL_CACHE_TTL,
+        'file_info': MATTERMOST_FILE_CACHE_TTL,
+    }, MATTERMOST_METADATA_CACHE_SIZE)
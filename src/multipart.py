@@ -0,0 +1,88 @@
+import uuid
+
+def field_header(boundary, name, filename=None, mime_type=None):
+    disposition = f'form-data; name="{name}"'
+    if filename is not None:
+        disposition += f'; filename="{filename}"'
+    header = f"--{boundary}\r\nContent-Disposition: {disposition}\r\n"
+    if mime_type is not None:
+        header += f"Content-Type: {mime_type}\r\n"
+    return (header + "\r\n").encode('utf-8')
+
+def encode_form(fields, files):
+    """
+    Lays out a multipart/form-data body whose file contents are streamed
+    rather than held in memory. Fields come before the files, since
+    Mattermost reads `channel_id` before it receives the files.
+
+    :param fields: List of (name, value) string fields.
+    :param files: List of (name, filename, chunks, mime_type, size) tuples,
+        where `chunks` is an iterable (or async iterable) of byte strings and
+        `size` is the total size in bytes, or None if it is not known.
+    :return: Tuple of (content type, parts, content length or None). Parts are
+        byte strings or the `chunks` of a file, in body order.
+    """
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields:
+        parts.append(field_header(boundary, name) + value.encode('utf-8') + b"\r\n")
+    for name, filename, chunks, mime_type, size in files:
+        parts.extend([field_header(boundary, name, filename, mime_type), chunks, b"\r\n"])
+    parts.append(f"--{boundary}--\r\n".encode('utf-8'))
+
+    sizes = [size for _, _, _, _, size in files]
+    length = None
+    if None not in sizes:
+        length = sum(len(part) for part in parts if isinstance(part, bytes)) + sum(sizes)
+    return f"multipart/form-data; boundary={boundary}", parts, length
+
+def iter_parts(parts):
+    """
+    Yields the body laid out by `encode_form`.
+    """
+    for part in parts:
+        if isinstance(part, bytes):
+            yield part
+        else:
+            yield from part
+
+class PartsReader:
+    """
+    File-like view of a body laid out by `encode_form` whose length is known.
+    requests sends it with a Content-Length header, reading it in blocks,
+    whereas an iterator body is always sent with chunked transfer encoding.
+    """
+
+    def __init__(self, parts, length):
+        self.chunks = iter_parts(parts)
+        self.length = length
+        self.buffer = bytearray()
+
+    def __len__(self):
+        return self.length
+
+    def read(self, size=-1):
+        while size is None or size < 0 or len(self.buffer) < size:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                break
+            self.buffer += chunk
+        if size is None or size < 0:
+            size = len(self.buffer)
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+async def aiter_parts(parts):
+    """
+    Async version of `iter_parts`; file chunks may be plain or async iterables.
+    """
+    for part in parts:
+        if isinstance(part, bytes):
+            yield part
+        elif hasattr(part, '__aiter__'):
+            async for chunk in part:
+                yield chunk
+        else:
+            for chunk in part:
+                yield chunk
@@ -1,12 +1,40 @@
-from openai import OpenAI
+import openai
+from openai import OpenAI, AsyncOpenAI
 from .config import (
     OPENAI_API_KEY,
     OPENAI_API_BASE,
     OPENAI_MODEL_NAME,
     OPENAI_MAX_TOKENS,
-    OPENAI_TEMPERATURE
+    OPENAI_TEMPERATURE,
+    OPENAI_RESPONSE_CACHE,
+    OPENAI_RESPONSE_CACHE_TTL,
+    OPENAI_RESPONSE_CACHE_MAX_ENTRIES,
+    OPENAI_RESPONSE_CACHE_DIR,
+    OPENAI_RESPONSE_CACHE_MAX_BYTES,
+    OPENAI_GLOBAL_RPM,
+    OPENAI_GLOBAL_TPM,
+    OPENAI_CHANNEL_RPM,
+    OPENAI_CHANNEL_TPM,
+    OPENAI_USER_RPM,
+    OPENAI_USER_TPM,
+    OPENAI_ADMISSION_MAX_WAIT
 )
+from .cache import TTLCache, DiskCache, TieredCache
+from .rate_limit import per_minute_bucket
+from .resilience import create_resilience, classify_status, parse_retry_after, Outcome, SUCCESS
+from .singleflight import SingleFlight
+from .tokenizer import count_message_tokens, TOKENS_PER_REPLY
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import contextvars
+import hashlib
+import json
 import logging
+import math
+import os
+import threading
+import time
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -16,92 +44,698 @@ formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(messag
 handler.setFormatter(formatter)
 logger.addHandler(handler)
 
-# Initialize OpenAI client
-client = OpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_API_BASE)
+# Initialize OpenAI clients
+# Retries are left to `resilience`, which also honors the retry budget and circuit breakers
+client = OpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_API_BASE, max_retries=0)
+async_client = AsyncOpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_API_BASE, max_retries=0)
+resilience = create_resilience("OpenAI")
+# Identical cacheable chat requests in flight share one reply
+chat_flights = SingleFlight("chat")
 
-def generate_chat_response(messages):
+def classify_openai_error(result, error):
+    """
+    Classifies the outcome of an OpenAI API call for `resilience`.
+    """
+    if error is None:
+        return SUCCESS
+    if isinstance(error, openai.APIConnectionError):
+        # Includes timeouts
+        return Outcome(True, True, None)
+    if isinstance(error, openai.APIStatusError):
+        if error.status_code == 429 and getattr(error, 'code', None) == 'insufficient_quota':
+            # Out of credit, retrying won't help
+            return Outcome(False, False, None)
+        return classify_status(error.status_code, parse_retry_after(error.response.headers.get('retry-after')))
+    return Outcome(False, False, None)
+
+def create_response_cache():
+    """
+    Creates the chat response cache if OPENAI_RESPONSE_CACHE is enabled: an
+    in-memory LRU cache, backed by a disk cache if OPENAI_RESPONSE_CACHE_DIR is set.
+    Cached replies are stored as UTF-8 bytes.
+    """
+    if not OPENAI_RESPONSE_CACHE:
+        return None
+    memory = TTLCache(OPENAI_RESPONSE_CACHE_MAX_ENTRIES, OPENAI_RESPONSE_CACHE_TTL)
+    if not OPENAI_RESPONSE_CACHE_DIR:
+        return memory
+    disk = DiskCache(OPENAI_RESPONSE_CACHE_DIR, OPENAI_RESPONSE_CACHE_MAX_BYTES, OPENAI_RESPONSE_CACHE_TTL)
+    return TieredCache(memory, disk)
+
+response_cache = create_response_cache()
+
+class AdmissionDenied(Exception):
+    """
+    Raised when a request would have to wait longer than
+    OPENAI_ADMISSION_MAX_WAIT for the rate limits to admit it.
+    """
+
+    def __init__(self, wait):
+        self.wait = wait
+        super().__init__(
+            f"You're sending requests faster than I can handle. "
+            f"Please slow down and try again in {math.ceil(wait)} seconds."
+        )
+
+# The user and channel the OpenAI calls of the current message are made for
+request_scope = contextvars.ContextVar('request_scope', default=(None, None))
+
+@contextmanager
+def request_context(user_id, channel_id):
+    """
+    Attributes the OpenAI calls made inside the block to a user and channel
+    for admission control. Work handed to thread pools must run in a copy of
+    the context (`contextvars.copy_context().run`) to keep the attribution.
+    """
+    token = request_scope.set((user_id, channel_id))
+    try:
+        yield
+    finally:
+        request_scope.reset(token)
+
+class AdmissionController:
+    """
+    Token buckets on OpenAI requests and estimated tokens per minute, kept
+    globally, per channel and per user.
+
+    A request is admitted once every bucket it draws from can cover it. It is
+    queued for at most `max_wait` seconds; if the buckets can't admit it by
+    then, `AdmissionDenied` is raised right away instead of waiting.
+    """
+
+    def __init__(self, limits, max_wait, max_keys=10000):
+        """
+        :param limits: Dictionary mapping 'global', 'channel' and 'user' to
+            (requests per minute, tokens per minute); 0 means unlimited.
+        :param max_wait: Longest a request is queued, in seconds.
+        :param max_keys: Most channels and users whose buckets are kept. The
+            least recently used are dropped, which refills them.
+        """
+        self.limits = limits
+        self.max_wait = max_wait
+        self.lock = threading.Lock()
+        self.global_buckets = self.create_buckets('global')
+        self.scoped_buckets = {'channel': TTLCache(max_keys), 'user': TTLCache(max_keys)}
+        self.admitted = 0
+        self.queued = 0
+        self.denied = 0
+
+    def create_buckets(self, scope):
+        requests_per_minute, tokens_per_minute = self.limits[scope]
+        return per_minute_bucket(requests_per_minute), per_minute_bucket(tokens_per_minute)
+
+    def get_buckets(self, scope, key):
+        buckets = self.scoped_buckets[scope].get(key)
+        if buckets is None:
+            buckets = self.create_buckets(scope)
+            self.scoped_buckets[scope].set(key, buckets)
+        return buckets
+
+    def reserve(self, tokens=0, user_id=None, channel_id=None):
+        """
+        Reserves one request and `tokens` estimated tokens.
+        :return: Seconds to wait before sending the request.
+        """
+        now = time.monotonic()
+        with self.lock:
+            scopes = [self.global_buckets]
+            if channel_id is not None:
+                scopes.append(self.get_buckets('channel', channel_id))
+            if user_id is not None:
+                scopes.append(self.get_buckets('user', user_id))
+            draws = [(bucket, amount) for requests, token_bucket in scopes
+                     for bucket, amount in ((requests, 1), (token_bucket, tokens)) if bucket is not None]
+
+            wait = max((bucket.delay(amount, now) for bucket, amount in draws), default=0.0)
+            if wait > self.max_wait:
+                self.denied += 1
+                raise AdmissionDenied(wait)
+            # Reserve from every bucket, so requests queued behind this one wait their turn
+            for bucket, amount in draws:
+                bucket.take(amount, now)
+            self.admitted += 1
+            if wait:
+                self.queued += 1
+        return wait
+
+    def stats(self):
+        with self.lock:
+            return {'admitted': self.admitted, 'queued': self.queued, 'denied': self.denied}
+
+def create_admission_controller():
+    """
+    Returns the admission controller configured by the OPENAI_*_RPM and
+    OPENAI_*_TPM settings, or None if they are all unlimited.
+    """
+    limits = {
+        'global': (OPENAI_GLOBAL_RPM, OPENAI_GLOBAL_TPM),
+        'channel': (OPENAI_CHANNEL_RPM, OPENAI_CHANNEL_TPM),
+        'user': (OPENAI_USER_RPM, OPENAI_USER_TPM),
+    }
+    if not any(limit for pair in limits.values() for limit in pair):
+        return None
+    return AdmissionController(limits, OPENAI_ADMISSION_MAX_WAIT)
+
+admission_controller = create_admission_controller()
+
+def admission_delay(tokens):
+    if admission_controller is None:
+        return 0.0
+    user_id, channel_id = request_scope.get()
+    wait = admission_controller.reserve(tokens, user_id, channel_id)
+    if wait:
+        logger.info(f"Rate limited, queuing OpenAI request of user {user_id} in channel {channel_id} for {wait:.1f}s")
+    return wait
+
+def admit(tokens=0):
+    """
+    Waits until the rate limits admit an OpenAI request for the current user
+    and channel. Raises `AdmissionDenied` if that would take too long.
+    :param tokens: Estimated tokens the request uses.
+    """
+    wait = admission_delay(tokens)
+    if wait:
+        time.sleep(wait)
+
+async def async_admit(tokens=0):
+    """
+    Async version of `admit`.
+    """
+    wait = admission_delay(tokens)
+    if wait:
+        await asyncio.sleep(wait)
+
+def estimate_chat_tokens(messages):
+    """
+    Estimates the tokens a chat completion uses: the prompt plus the most
+    the reply may use.
+    """
+    return sum(count_message_tokens(message) for message in messages) + TOKENS_PER_REPLY + OPENAI_MAX_TOKENS
+
+# Image generation settings, also part of the image cache key
+IMAGE_MODEL = "dall-e-3"
+IMAGE_SIZE = "1024x1024"
+IMAGE_QUALITY = "hd"
+# Sizes and qualities the image model accepts
+IMAGE_SIZES = ("1024x1024", "1792x1024", "1024x1792")
+IMAGE_QUALITIES = ("standard", "hd")
+# Most images the image model returns for one request; more are requested concurrently
+IMAGE_MAX_N_PER_REQUEST = 1
+
+# Returned instead of a transcript when transcription fails
+TRANSCRIPTION_ERROR_MESSAGE = "I'm sorry, I couldn't transcribe the audio."
+# Largest file the transcription API accepts
+TRANSCRIPTION_MAX_UPLOAD_BYTES = 25 * 1024 * 1024
+
+def is_cacheable(params):
+    """
+    Decides whether a chat request may be answered from the cache: deterministic
+    requests (temperature 0) and first-turn questions, which have no earlier
+    assistant replies in the context.
+    """
+    if params.get('temperature') == 0:
+        return True
+    return not any(msg['role'] == 'assistant' for msg in params['messages'])
+
+def response_cache_key(params):
+    """
+    Builds the cache key of a chat request from the model, the sampling
+    parameters and the messages, with whitespace in the messages normalized.
+    """
+    normalized = dict(params)
+    normalized['messages'] = [
+        {"role": msg['role'], "content": " ".join(msg['content'].split())}
+        for msg in params['messages']
+    ]
+    payload = json.dumps(normalized, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def get_response_cache_key(messages, cacheable=None):
+    """
+    Returns the key of a chat request whose reply may be cached and shared
+    with identical requests in flight, or None if the reply is its own.
+
+    :param messages: List of message dictionaries with 'role' and 'content'.
+    :param cacheable: True or False to override `is_cacheable`.
+    """
+    params = chat_completion_params(messages)
+    if cacheable is None:
+        cacheable = is_cacheable(params)
+    return response_cache_key(params) if cacheable else None
+
+def get_cached_response(cache_key):
+    if cache_key is None or response_cache is None:
+        return None
+    cached = response_cache.get(cache_key)
+    if cached is None:
+        return None
+    logger.debug("Chat response served from cache.")
+    return cached.decode('utf-8')
+
+def cache_response(cache_key, assistant_message):
+    if cache_key is not None and response_cache is not None and assistant_message:
+        response_cache.set(cache_key, assistant_message.encode('utf-8'))
+
+def response_cache_stats():
+    """
+    Returns the hit/miss counters of the response cache, or None if it is disabled.
+    """
+    return response_cache.stats() if response_cache is not None else None
+
+def generate_chat_response(messages, cacheable=None):
     """
     Generates a response from the chat model based on the provided messages.
 
     :param messages: List of message dictionaries with 'role' and 'content'.
+    :param cacheable: Whether the reply may be served from and stored in the
+        response cache. Defaults to `is_cacheable`.
     :return: The assistant's reply as a string.
     """
-    try:
+    cache_key = get_response_cache_key(messages, cacheable)
+    cached = get_cached_response(cache_key)
+    if cached is not None:
+        return cached
+
+    def request():
         logger.debug(f"Sending messages to OpenAI: {messages}")
         response = create_chat_completion(messages)
         assistant_message = response.choices[0].message.content.strip()
         logger.debug(f"Received response from OpenAI: {assistant_message}")
+        cache_response(cache_key, assistant_message)
         return assistant_message
+
+    try:
+        if cache_key is None:
+            return request()
+        return chat_flights.do(cache_key, request)
+    except AdmissionDenied:
+        raise
     except Exception as e:
         logger.error(f"Error generating chat response: {e}")
         return "I'm sorry, I couldn't process that request at the moment."
 
-def generate_image(prompt):
+class StreamInterrupted(Exception):
     """
-    Generates an image based on the provided prompt using OpenAI's DALL-E API.
+    Raised by `stream_chat_response` when a reply can't be completed. The
+    chunks yielded before it are an incomplete reply; the error message is
+    meant for the user.
+    """
+
+    def __init__(self):
+        super().__init__("I'm sorry, I couldn't process that request at the moment.")
+
+def stream_chat_response(messages, cacheable=None):
+    """
+    Streams a response from the chat model, yielding the reply text in chunks
+    as tokens arrive. A cached reply is yielded in one chunk.
+
+    :param messages: List of message dictionaries with 'role' and 'content'.
+    :param cacheable: See `generate_chat_response`.
+    :return: Generator of reply text chunks. It raises `StreamInterrupted`
+        if the reply fails midway.
+    """
+    cache_key = get_response_cache_key(messages, cacheable)
+    cached = get_cached_response(cache_key)
+    if cached is not None:
+        yield cached
+        return
+    if cache_key is not None:
+        # An identical request in flight is waited for, and its reply yielded in one chunk
+        leader, shared = chat_flights.join(cache_key)
+        if not leader:
+            yield shared
+            return
+    reply = None
+    try:
+        logger.debug(f"Streaming messages to OpenAI: {messages}")
+        started = time.monotonic()
+        first_token_at = None
+        chunks = []
+        stream = create_chat_completion(messages, stream=True)
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            content = chunk.choices[0].delta.content
+            if content:
+                if first_token_at is None:
+                    first_token_at = time.monotonic()
+                    logger.info(f"Time to first token: {first_token_at - started:.2f}s")
+                chunks.append(content)
+                yield content
+        logger.debug(f"Chat response streamed in {time.monotonic() - started:.2f}s")
+        # Only complete replies are cached and shared
+        reply = "".join(chunks).strip()
+        cache_response(cache_key, reply)
+    except AdmissionDenied:
+        raise
+    except Exception as e:
+        logger.error(f"Error streaming chat response: {e}")
+        raise StreamInterrupted() from e
+    finally:
+        if cache_key is not None:
+            chat_flights.finish(cache_key, reply, failed=reply is None)
+
+SUMMARY_INSTRUCTION = (
+    "You maintain a running summary of a conversation between a user and an AI assistant. "
+    "Update the summary with the new messages. Keep every fact, decision, name, number and "
+    "open question the assistant may need later, drop small talk, and reply with the summary only."
+)
+
+def summarize_conversation(summary, messages):
+    """
+    Folds messages into a running conversation summary.
+
+    :param summary: The current summary text, or None.
+    :param messages: List of message dictionaries with 'role' and 'content' to fold in.
+    :return: The updated summary text, or None on failure.
+    """
+    transcript = "\n".join(f"{msg['role']}: {msg['content']}" for msg in messages)
+    prompt = [
+        {"role": "system", "content": SUMMARY_INSTRUCTION},
+        {"role": "user", "content": f"Current summary:\n{summary or '(none)'}\n\nNew messages:\n{transcript}"}
+    ]
+    try:
+        logger.debug(f"Summarizing {len(messages)} messages.")
+        response = create_chat_completion(prompt)
+        return response.choices[0].message.content.strip()
+    except Exception as e:
+        logger.error(f"Error summarizing conversation: {e}")
+        return None
+
+def image_batches(n):
+    """
+    Splits a number of images into request sizes the image model accepts.
+    """
+    return [min(IMAGE_MAX_N_PER_REQUEST, n - start) for start in range(0, n, IMAGE_MAX_N_PER_REQUEST)]
+
+def join_image_batches(batches, results):
+    """
+    Joins the results of the requests for `batches` into one list with a slot
+    per requested image, None for the images of a failed request, so each
+    image stays at the position it was requested for.
+    """
+    images = []
+    for count, result in zip(batches, results):
+        result = list(result or [])[:count]
+        images.extend(result + [None] * (count - len(result)))
+    return images
+
+def request_images(prompt, n=1, size=IMAGE_SIZE, quality=IMAGE_QUALITY, response_format="b64_json"):
+    """
+    Generates images based on the provided prompt using OpenAI's DALL-E API,
+    in a single request.
 
     :param prompt: Description of the image to generate.
-    :return: Base64-encoded image string or error message.
+    :param n: Number of images, at most IMAGE_MAX_N_PER_REQUEST.
+    :param response_format: "b64_json", or "url" for short-lived download URLs.
+    :return: List of Base64-encoded image strings or URLs, or None on error.
     """
+    admit()
     try:
-        logger.debug(f"Generating image with prompt: {prompt}")
-        response = client.images.generate(
-            model="dall-e-3",
+        logger.debug(f"Generating {n} image(s) with prompt: {prompt}")
+        response = resilience.call("images", lambda: client.images.generate(
+            model=IMAGE_MODEL,
             prompt=prompt,
-            quality= "hd",
-            size="1024x1024",
-            response_format="b64_json",
-            n=1,
-        )
-        image_b64 = response.data[0].b64_json
+            quality=quality,
+            size=size,
+            response_format=response_format,
+            n=n,
+        ), classify_openai_error)
+        images = [image.url if response_format == "url" else image.b64_json for image in response.data]
         logger.debug("Image generated successfully.")
-        return image_b64
+        return images
     except Exception as e:
         logger.error(f"Error generating image: {e}")
         return None
 
-def transcribe_audio(audio_file_path):
+def generate_image(prompt, size=IMAGE_SIZE, quality=IMAGE_QUALITY):
+    """
+    Generates an image based on the provided prompt using OpenAI's DALL-E API.
+
+    :param prompt: Description of the image to generate.
+    :return: Base64-encoded image string or None.
+    """
+    images = request_images(prompt, 1, size, quality)
+    return images[0] if images else None
+
+def generate_images(prompt, n=1, size=IMAGE_SIZE, quality=IMAGE_QUALITY, response_format="b64_json"):
+    """
+    Generates `n` images for a prompt. Requests are split to respect the
+    model's limit on images per request and sent concurrently.
+
+    :return: List of `n` Base64-encoded image strings, or URLs if
+        `response_format` is "url"; the images of failed requests are None.
+    """
+    batches = image_batches(n)
+    if len(batches) == 1:
+        results = [request_images(prompt, batches[0], size, quality, response_format)]
+    else:
+        with ThreadPoolExecutor(max_workers=len(batches), thread_name_prefix="image") as executor:
+            # Each request runs in a copy of the caller's context, keeping its admission scope
+            futures = [
+                executor.submit(contextvars.copy_context().run, request_images, prompt, count, size, quality, response_format)
+                for count in batches
+            ]
+            results = [future.result() for future in futures]
+    return join_image_batches(batches, results)
+
+def transcribe_audio(audio_file):
     """
     Transcribes audio content using OpenAI's Whisper API.
 
-    :param audio_file_path: Path to the audio file to transcribe.
+    :param audio_file: Path to the audio file to transcribe, or a (filename,
+        file object or bytes) tuple for audio that is not on disk.
     :return: Transcribed text or error message.
     """
+    admit()
     try:
-        logger.debug(f"Transcribing audio file: {audio_file_path}")
-        with open(audio_file_path, 'rb') as audio_file:
-            transcript = client.audio.transcriptions.create(
-                model="whisper-1",
-                file=audio_file
-            )
+        if isinstance(audio_file, str):
+            logger.debug(f"Transcribing audio file: {audio_file}")
+        else:
+            logger.debug(f"Transcribing audio: {audio_file[0]}")
+
+        def attempt():
+            if isinstance(audio_file, str):
+                with open(audio_file, 'rb') as f:
+                    return client.audio.transcriptions.create(model="whisper-1", file=f)
+            # A retry sends the file object again from the start
+            if hasattr(audio_file[1], 'seek'):
+                audio_file[1].seek(0)
+            return client.audio.transcriptions.create(model="whisper-1", file=audio_file)
+
+        transcript = resilience.call("audio.transcriptions", attempt, classify_openai_error)
         logger.debug("Audio transcribed successfully.")
         return transcript.text.strip()
     except Exception as e:
         logger.error(f"Error transcribing audio: {e}")
-        return "I'm sorry, I couldn't transcribe the audio."
+        return TRANSCRIPTION_ERROR_MESSAGE
 
-def create_chat_completion(messages):
+def create_chat_completion(messages, stream=False):
     """
     Generate completions for the specified model with the given messages.
 
     :param messages: List of message dictionaries with 'role' and 'content'.
+    :param stream: If True, return an iterator of completion chunks.
     :return: The completion response.
     """
+    admit(estimate_chat_tokens(messages))
+    params = chat_completion_params(messages)
+    if stream:
+        # Only opening the stream is retried, never a partly received reply
+        params['stream'] = True
+    return resilience.call("chat.completions", lambda: client.chat.completions.create(**params), classify_openai_error)
+
+def chat_completion_params(messages):
+    """
+    Builds the chat completion request parameters for the configured model.
+
+    :param messages: List of message dictionaries with 'role' and 'content'.
+    :return: Keyword arguments for `chat.completions.create`.
+    """
     if OPENAI_MODEL_NAME in ["o1-mini", "o1-preview"]:
         # beta limitations for o1 series models:
         # - user and assistant messages only, system messages are not supported.
         # - temperature, top_p and n are fixed at 1, while presence_penalty and frequency_penalty are fixed at 0.
         filtered_messages = [msg for msg in messages if msg['role'] in ['user', 'assistant']]
-        return client.chat.completions.create(
-            model=OPENAI_MODEL_NAME,
-            messages=filtered_messages,
-            max_completion_tokens=OPENAI_MAX_TOKENS,
-        )
+        return {
+            'model': OPENAI_MODEL_NAME,
+            'messages': filtered_messages,
+            'max_completion_tokens': OPENAI_MAX_TOKENS,
+        }
     else:
-        return client.chat.completions.create(
-            model=OPENAI_MODEL_NAME,
-            messages=messages,
-            max_completion_tokens=OPENAI_MAX_TOKENS,
-            temperature=OPENAI_TEMPERATURE
-        )
+        return {
+            'model': OPENAI_MODEL_NAME,
+            'messages': messages,
+            'max_completion_tokens': OPENAI_MAX_TOKENS,
+            'temperature': OPENAI_TEMPERATURE,
+        }
+
+# Async variants used by the asyncio bot core. They share the request
+# parameters and error handling of the sync functions above.
+
+async def async_generate_chat_response(messages, cacheable=None):
+    """
+    Async version of `generate_chat_response`.
+
+    :param messages: List of message dictionaries with 'role' and 'content'.
+    :param cacheable: See `generate_chat_response`.
+    :return: The assistant's reply as a string.
+    """
+    cache_key = get_response_cache_key(messages, cacheable)
+    cached = get_cached_response(cache_key)
+    if cached is not None:
+        return cached
+
+    async def request():
+        logger.debug(f"Sending messages to OpenAI: {messages}")
+        response = await async_create_chat_completion(messages)
+        assistant_message = response.choices[0].message.content.strip()
+        logger.debug(f"Received response from OpenAI: {assistant_message}")
+        cache_response(cache_key, assistant_message)
+        return assistant_message
+
+    try:
+        if cache_key is None:
+            return await request()
+        return await chat_flights.do_async(cache_key, request)
+    except AdmissionDenied:
+        raise
+    except Exception as e:
+        logger.error(f"Error generating chat response: {e}")
+        return "I'm sorry, I couldn't process that request at the moment."
+
+async def async_stream_chat_response(messages, cacheable=None):
+    """
+    Async version of `stream_chat_response`.
+
+    :param messages: List of message dictionaries with 'role' and 'content'.
+    :param cacheable: See `generate_chat_response`.
+    :return: Async generator of reply text chunks. It raises `StreamInterrupted`
+        if the reply fails midway.
+    """
+    cache_key = get_response_cache_key(messages, cacheable)
+    cached = get_cached_response(cache_key)
+    if cached is not None:
+        yield cached
+        return
+    if cache_key is not None:
+        leader, shared = await chat_flights.join_async(cache_key)
+        if not leader:
+            yield shared
+            return
+    reply = None
+    try:
+        logger.debug(f"Streaming messages to OpenAI: {messages}")
+        started = time.monotonic()
+        first_token_at = None
+        chunks = []
+        stream = await async_create_chat_completion(messages, stream=True)
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            content = chunk.choices[0].delta.content
+            if content:
+                if first_token_at is None:
+                    first_token_at = time.monotonic()
+                    logger.info(f"Time to first token: {first_token_at - started:.2f}s")
+                chunks.append(content)
+                yield content
+        logger.debug(f"Chat response streamed in {time.monotonic() - started:.2f}s")
+        reply = "".join(chunks).strip()
+        cache_response(cache_key, reply)
+    except AdmissionDenied:
+        raise
+    except Exception as e:
+        logger.error(f"Error streaming chat response: {e}")
+        raise StreamInterrupted() from e
+    finally:
+        if cache_key is not None:
+            chat_flights.finish_async(cache_key, reply, failed=reply is None)
+
+async def async_request_images(prompt, n=1, size=IMAGE_SIZE, quality=IMAGE_QUALITY, response_format="b64_json"):
+    """
+    Async version of `request_images`.
+    """
+    await async_admit()
+    try:
+        logger.debug(f"Generating {n} image(s) with prompt: {prompt}")
+        response = await resilience.async_call("images", lambda: async_client.images.generate(
+            model=IMAGE_MODEL,
+            prompt=prompt,
+            quality=quality,
+            size=size,
+            response_format=response_format,
+            n=n,
+        ), classify_openai_error)
+        images = [image.url if response_format == "url" else image.b64_json for image in response.data]
+        logger.debug("Image generated successfully.")
+        return images
+    except Exception as e:
+        logger.error(f"Error generating image: {e}")
+        return None
+
+async def async_generate_image(prompt, size=IMAGE_SIZE, quality=IMAGE_QUALITY):
+    """
+    Async version of `generate_image`.
 
+    :param prompt: Description of the image to generate.
+    :return: Base64-encoded image string or None.
+    """
+    images = await async_request_images(prompt, 1, size, quality)
+    return images[0] if images else None
+
+async def async_generate_images(prompt, n=1, size=IMAGE_SIZE, quality=IMAGE_QUALITY, response_format="b64_json"):
+    """
+    Async version of `generate_images`.
+    """
+    batches = image_batches(n)
+    results = await asyncio.gather(*(
+        async_request_images(prompt, count, size, quality, response_format) for count in batches
+    ))
+    return join_image_batches(batches, results)
+
+async def async_transcribe_audio(audio_file):
+    """
+    Async version of `transcribe_audio`.
+
+    :param audio_file: Path to the audio file, or a (filename, file object or bytes) tuple.
+    :return: Transcribed text or error message.
+    """
+    await async_admit()
+    try:
+        if isinstance(audio_file, str):
+            logger.debug(f"Transcribing audio file: {audio_file}")
+            # Read local files off the event loop
+            loop = asyncio.get_running_loop()
+            audio_file = (os.path.basename(audio_file), await loop.run_in_executor(None, read_file_bytes, audio_file))
+        def attempt():
+            if hasattr(audio_file[1], 'seek'):
+                audio_file[1].seek(0)
+            return async_client.audio.transcriptions.create(model="whisper-1", file=audio_file)
+
+        transcript = await resilience.async_call("audio.transcriptions", attempt, classify_openai_error)
+        logger.debug("Audio transcribed successfully.")
+        return transcript.text.strip()
+    except Exception as e:
+        logger.error(f"Error transcribing audio: {e}")
+        return TRANSCRIPTION_ERROR_MESSAGE
+
+def read_file_bytes(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+async def async_create_chat_completion(messages, stream=False):
+    """
+    Async version of `create_chat_completion`.
+
+    :param messages: List of message dictionaries with 'role' and 'content'.
+    :param stream: If True, return an async iterator of completion chunks.
+    :return: The completion response.
+    """
+    await async_admit(estimate_chat_tokens(messages))
+    params = chat_completion_params(messages)
+    if stream:
+        params['stream'] = True
+    return await resilience.async_call(
+        "chat.completions", lambda: async_client.chat.completions.create(**params), classify_openai_error
+    )
@@ -0,0 +1,286 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import namedtuple
+from .dispatcher import EventDispatcher, AsyncEventDispatcher
+from .rate_limit import TokenBucket
+from .resilience import RequestRejected, CircuitOpenError
+from .config import (
+    OUTBOX_POSTS_PER_SECOND,
+    OUTBOX_BURST,
+    OUTBOX_MAX_ATTEMPTS,
+    OUTBOX_RETRY_DELAY,
+    OUTBOX_QUEUE_SIZE,
+    OUTBOX_WORKERS,
+    OUTBOX_DEAD_LETTER_PATH
+)
+
+logger = logging.getLogger(__name__)
+
+# A post waiting to be delivered. `options` holds the optional arguments of
+# `post_message` (root_id, file_ids, props).
+OutboundPost = namedtuple('OutboundPost', ['channel_id', 'message', 'options', 'pending_post_id', 'queued_at'])
+
+def outbound_post(channel_id, message, root_id=None, file_ids=None, props=None):
+    options = {name: value for name, value in (('root_id', root_id), ('file_ids', file_ids), ('props', props)) if value}
+    return OutboundPost(channel_id, message, options, uuid.uuid4().hex, time.time())
+
+class DeadLetterLog:
+    """
+    Appends posts that could not be delivered to a JSON Lines file, so they
+    can be inspected or sent again by hand.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def append(self, post, attempts, error):
+        record = {
+            'failed_at': time.time(),
+            'queued_at': post.queued_at,
+            'channel_id': post.channel_id,
+            'message': post.message,
+            'options': post.options,
+            'pending_post_id': post.pending_post_id,
+            'attempts': attempts,
+            'error': error,
+        }
+        logger.error(f"Giving up on post {post.pending_post_id} to channel {post.channel_id} after {attempts} attempts: {error}")
+        if not self.path:
+            return
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with self.lock, open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        except OSError as e:
+            logger.error(f"Failed to write dead letter to {self.path}: {e}")
+
+class Outbox:
+    """
+    Delivers posts in the background, so handlers can queue a reply and move on.
+
+    Posts to the same channel are delivered one at a time in the order they
+    were queued, while posts to different channels go out in parallel. All
+    posts share a token bucket that keeps the bot under the Mattermost API
+    rate limits. A post that fails is sent again with the same pending post
+    ID, which Mattermost uses to avoid creating it twice, and after
+    `max_attempts` it is written to the dead-letter log. Posts Mattermost
+    refuses for good, e.g. with 400 or 403, are dead-lettered right away.
+    The outbox is the only layer retrying its posts: the client sends each
+    attempt once.
+    """
+
+    def __init__(self, mm_client, posts_per_second=OUTBOX_POSTS_PER_SECOND, burst=OUTBOX_BURST,
+                 max_attempts=OUTBOX_MAX_ATTEMPTS, retry_delay=OUTBOX_RETRY_DELAY,
+                 max_queue_size=OUTBOX_QUEUE_SIZE, num_workers=OUTBOX_WORKERS,
+                 dead_letter_path=OUTBOX_DEAD_LETTER_PATH):
+        """
+        :param mm_client: `MattermostClient` used to send the posts.
+        :param posts_per_second: Sustained post rate; 0 disables rate shaping.
+        :param burst: Posts that may be sent at once after a quiet period.
+        :param max_attempts: Attempts per post before it is dead-lettered.
+        :param retry_delay: Wait before the first retry of a post, in seconds;
+            it doubles with every retry.
+        :param num_workers: Posts sent at the same time.
+        :param dead_letter_path: JSON Lines file for undeliverable posts, or
+            empty to only log them.
+        """
+        self.mm_client = mm_client
+        self.bucket = TokenBucket(posts_per_second, burst) if posts_per_second else None
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.dead_letters = DeadLetterLog(dead_letter_path)
+        self.dispatcher = self.create_dispatcher(num_workers, max_queue_size)
+        self.lock = threading.Lock()
+        self.delivered = 0
+        self.retried = 0
+        self.dead_lettered = 0
+
+    def create_dispatcher(self, num_workers, max_queue_size):
+        # Posts are ordered per channel
+        return EventDispatcher(
+            self.deliver,
+            lambda post: post.channel_id,
+            num_workers=num_workers,
+            max_queue_size=max_queue_size,
+            name="outbox"
+        )
+
+    def start(self):
+        self.dispatcher.start()
+
+    def post(self, channel_id, message, root_id=None, file_ids=None, props=None):
+        """
+        Queues a post for delivery. While the outbox is not running the post
+        is sent right away instead, and if the queue is full it is delivered
+        on the caller's thread.
+        :return: True if the post was queued.
+        """
+        post = outbound_post(channel_id, message, root_id, file_ids, props)
+        if not self.dispatcher.running:
+            self.mm_client.post_message(channel_id, message, **post.options)
+            return False
+        if self.dispatcher.dispatch(post):
+            return True
+        self.deliver(post)
+        return False
+
+    def delay(self, attempt):
+        """
+        Returns the wait before retry number `attempt` (from 1).
+        """
+        return self.retry_delay * 2 ** (attempt - 1)
+
+    def failed_attempt(self, post, attempt, error):
+        """
+        Logs failed attempt number `attempt` (from 0) to deliver a post.
+        :return: Seconds to wait before the next attempt, or None to give up.
+        """
+        if isinstance(error, RequestRejected) and not error.retryable:
+            logger.warning(f"Mattermost refused post {post.pending_post_id} to channel {post.channel_id}: {error}")
+            return None
+        logger.warning(f"Failed to deliver post {post.pending_post_id} to channel {post.channel_id} "
+                       f"(attempt {attempt + 1}/{self.max_attempts}): {error}")
+        if attempt + 1 >= self.max_attempts:
+            return None
+        # Wait at least as long as Mattermost asked, or the circuit stays open
+        if isinstance(error, CircuitOpenError):
+            requested = error.retry_in
+        else:
+            requested = getattr(error, 'retry_after', None) or 0
+        return max(self.delay(attempt + 1), requested)
+
+    def delivered_post(self, post):
+        with self.lock:
+            self.delivered += 1
+        logger.debug(f"Delivered post {post.pending_post_id} to channel {post.channel_id} "
+                     f"{time.time() - post.queued_at:.2f}s after it was queued.")
+
+    def deliver(self, post):
+        """
+        Sends a post, retrying it until it is delivered, refused for good, or
+        `max_attempts` run out.
+        :return: JSON response from Mattermost, or None if the post was dead-lettered.
+        """
+        attempt = 0
+        while True:
+            if self.bucket is not None:
+                time.sleep(self.bucket.reserve())
+            try:
+                result = self.mm_client.post_message(
+                    post.channel_id, post.message, pending_post_id=post.pending_post_id,
+                    retry=False, raise_errors=True, **post.options
+                )
+                error = None if result else "Mattermost rejected the post"
+            except Exception as e:
+                result, error = None, e
+            if result:
+                self.delivered_post(post)
+                return result
+            delay = self.failed_attempt(post, attempt, error)
+            if delay is None:
+                break
+            with self.lock:
+                self.retried += 1
+            time.sleep(delay)
+            attempt += 1
+        with self.lock:
+            self.dead_lettered += 1
+        self.dead_letters.append(post, attempt + 1, str(error))
+        return None
+
+    def stats(self):
+        with self.lock:
+            return {
+                'queued': self.dispatcher.queue_size(),
+                'delivered': self.delivered,
+                'retried': self.retried,
+                'dead_lettered': self.dead_lettered,
+            }
+
+    def stop(self, timeout=None):
+        """
+        Stops accepting posts and delivers the ones already queued.
+        """
+        self.dispatcher.stop(timeout)
+        logger.info(f"Outbox stopped: {self.stats()}")
+
+class AsyncOutbox(Outbox):
+    """
+    asyncio version of `Outbox`, sending posts with an `AsyncMattermostClient`.
+    """
+
+    running = False
+
+    def create_dispatcher(self, num_workers, max_queue_size):
+        return AsyncEventDispatcher(
+            self.deliver,
+            lambda post: post.channel_id,
+            max_concurrency=num_workers,
+            max_queue_size=max_queue_size
+        )
+
+    def start(self):
+        self.running = True
+
+    async def post(self, channel_id, message, root_id=None, file_ids=None, props=None):
+        """
+        Async version of `Outbox.post`.
+        """
+        post = outbound_post(channel_id, message, root_id, file_ids, props)
+        if not self.running:
+            await self.mm_client.post_message(channel_id, message, **post.options)
+            return False
+        if self.dispatcher.dispatch(post):
+            return True
+        await self.deliver(post)
+        return False
+
+    async def deliver(self, post):
+        """
+        Async version of `Outbox.deliver`.
+        """
+        attempt = 0
+        while True:
+            if self.bucket is not None:
+                await asyncio.sleep(self.bucket.reserve())
+            try:
+                result = await self.mm_client.post_message(
+                    post.channel_id, post.message, pending_post_id=post.pending_post_id,
+                    retry=False, raise_errors=True, **post.options
+                )
+                error = None if result else "Mattermost rejected the post"
+            except Exception as e:
+                result, error = None, e
+            if result:
+                self.delivered_post(post)
+                return result
+            delay = self.failed_attempt(post, attempt, error)
+            if delay is None:
+                break
+            with self.lock:
+                self.retried += 1
+            await asyncio.sleep(delay)
+            attempt += 1
+        with self.lock:
+            self.dead_lettered += 1
+        # Keep the file write off the event loop
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.dead_letters.append, post, attempt + 1, str(error))
+        return None
+
+    async def stop(self, timeout=None):
+        """
+        Stops accepting posts and delivers the ones already queued, cancelling
+        them after `timeout`.
+        """
+        self.running = False
+        await self.dispatcher.stop(timeout)
+        logger.info(f"Outbox stopped: {self.stats()}")
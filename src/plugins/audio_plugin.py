@@ -1,16 +1,84 @@
+import asyncio
+import contextvars
+import hashlib
+import logging
+import mmap
 import os
-import requests
-import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urlparse
 from src.plugins.base_plugin import BasePlugin
+from src.cache import TTLCache, DiskCache, TieredCache
+from src.singleflight import SingleFlight
 from src.openai_client import transcribe_audio as openai_transcribe
-from src.mattermost_client import MattermostClient
-from src.config import TEMP_DIR, AUDIO_SERVICE
+from src.openai_client import async_transcribe_audio as async_openai_transcribe
+from src.openai_client import TRANSCRIPTION_ERROR_MESSAGE, TRANSCRIPTION_MAX_UPLOAD_BYTES
+from src.mattermost_client import MattermostClient, DOWNLOAD_CHUNK_SIZE
+from src.audio_processing import split_audio, stitch_transcripts, preprocess_audio, WavChunk
+from src.config import (
+    TEMP_DIR,
+    AUDIO_SERVICE,
+    TRANSCRIPT_CACHE_MAX_BYTES,
+    AUDIO_SPOOL_MAX_MEMORY,
+    AUDIO_MAX_FILE_SIZE,
+    AUDIO_CHUNK_SECONDS,
+    AUDIO_CHUNK_OVERLAP_SECONDS,
+    AUDIO_TRANSCRIBE_CONCURRENCY,
+    AUDIO_PREPROCESS,
+    AUDIO_FILES_CONCURRENCY
+)
+
+logger = logging.getLogger(__name__)
+
+# Number of transcripts also kept in memory in front of the disk cache
+TRANSCRIPT_CACHE_MEMORY_ENTRIES = 256
+
+class FileTooLargeError(Exception):
+    """
+    Raised when an audio file is larger than AUDIO_MAX_FILE_SIZE.
+    """
+
+    def __init__(self):
+        super().__init__(f"The audio file is larger than the limit of {AUDIO_MAX_FILE_SIZE / (1024 * 1024):g} MB.")
+
+class AudioBuffer:
+    """
+    Downloaded audio, kept in memory up to AUDIO_SPOOL_MAX_MEMORY bytes and
+    spooled to a temporary file in TEMP_DIR past that. The content is hashed
+    as it is written, and writing more than AUDIO_MAX_FILE_SIZE bytes raises
+    `FileTooLargeError`.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.size = 0
+        self.hasher = hashlib.sha256()
+        self.file = tempfile.SpooledTemporaryFile(max_size=AUDIO_SPOOL_MAX_MEMORY, dir=TEMP_DIR)
+
+    def write(self, chunk):
+        self.size += len(chunk)
+        if self.size > AUDIO_MAX_FILE_SIZE:
+            raise FileTooLargeError()
+        self.hasher.update(chunk)
+        self.file.write(chunk)
+
+    def digest(self):
+        return self.hasher.hexdigest()
+
+    def as_upload(self):
+        """
+        Returns the (filename, file object) tuple accepted by the transcription services.
+        """
+        self.file.seek(0)
+        return (self.name, self.file)
+
+    def close(self):
+        self.file.close()
 
 class AudioPlugin(BasePlugin):
     name = "audio"
     description = "Transcribe audio files"
-    usage = "/audio <file_id|file_url|file_path|file> [--service <service_name>]"
+    usage = "/audio <file_id|file_url|file_path|file>... [--service <service_name>]"
 
     def __init__(self):
         self.services = {
@@ -19,16 +87,387 @@ class AudioPlugin(BasePlugin):
             # "google": google_transcribe,
             # "azure": azure_transcribe,
         }
+        self.async_services = {
+            "openai": async_openai_transcribe,
+        }
         self.default_service = AUDIO_SERVICE
         self.mm_client = MattermostClient()  # Initialize once
+        self.transcript_cache = self.create_transcript_cache()
+        # The same audio posted to several commands at once is transcribed once
+        self.flights = SingleFlight("transcription")
+        # Bounds the chunk transcriptions running at once, across all commands
+        self.transcribe_executor = ThreadPoolExecutor(max_workers=AUDIO_TRANSCRIBE_CONCURRENCY, thread_name_prefix="transcriber")
+        self.transcribe_semaphore = asyncio.Semaphore(AUDIO_TRANSCRIBE_CONCURRENCY)
 
     def execute(self, args, channel_id, user_id):
+        service, file_inputs, error = self.parse_args(args)
+        if error:
+            return error
+
+        # Ensure the TEMP_DIR exists for audio too large to keep in memory
+        os.makedirs(TEMP_DIR, exist_ok=True)
+
+        if len(file_inputs) == 1:
+            # A single recording is posted progressively as its chunks complete
+            post_id = None
+
+            def update(message):
+                nonlocal post_id
+                post_id = self.update_post(channel_id, post_id, message)
+
+            name, transcript, error = self.transcribe_input(service, file_inputs[0], update)
+            if error:
+                return error
+            return self.finish_post(post_id, self.format_transcript(service, [transcript]))
+
+        # Several recordings are transcribed concurrently and answered in one reply
+        workers = min(AUDIO_FILES_CONCURRENCY, len(file_inputs))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="audio-file") as executor:
+            # Copies of the context keep the user and channel the requests are rate limited for
+            futures = [
+                executor.submit(contextvars.copy_context().run, self.transcribe_input, service, file_input)
+                for file_input in file_inputs
+            ]
+            results = [future.result() for future in futures]
+        return self.format_results(service, results)
+
+    async def execute_async(self, args, channel_id, user_id):
+        service, file_inputs, error = self.parse_args(args)
+        if error:
+            return error
+        if service not in self.async_services or self.async_mm_client is None:
+            return await super().execute_async(args, channel_id, user_id)
+
+        os.makedirs(TEMP_DIR, exist_ok=True)
+
+        if len(file_inputs) == 1:
+            post_id = None
+
+            async def update(message):
+                nonlocal post_id
+                post_id = await self.update_post_async(channel_id, post_id, message)
+
+            name, transcript, error = await self.transcribe_input_async(service, file_inputs[0], update)
+            if error:
+                return error
+            return await self.finish_post_async(post_id, self.format_transcript(service, [transcript]))
+
+        semaphore = asyncio.Semaphore(AUDIO_FILES_CONCURRENCY)
+
+        async def transcribe(file_input):
+            async with semaphore:
+                return await self.transcribe_input_async(service, file_input)
+
+        results = await asyncio.gather(*(transcribe(file_input) for file_input in file_inputs))
+        return self.format_results(service, results)
+
+    def open_input(self, file_input):
+        """
+        Opens an audio input. Downloads from URLs and Mattermost file IDs are
+        streamed into an `AudioBuffer`; local paths are used in place.
+        :return: Tuple of (AudioBuffer, or None for local paths, error message or None).
+        """
+        try:
+            # Determine if the input is a URL, file path, or file ID
+            if self.is_url(file_input):
+                # Handle URL input
+                audio = self.read_url(file_input)
+                if not audio:
+                    return None, "Failed to download the audio file from the provided URL."
+            elif self.is_valid_path(file_input):
+                # Handle local file path input
+                return None, self.check_local_file(file_input)
+            else:
+                # Assume it's a Mattermost file ID
+                audio = self.read_file_id(file_input)
+                if not audio:
+                    return None, "Failed to download the audio file from the provided file ID."
+            return audio, None
+        except FileTooLargeError as e:
+            return None, str(e)
+
+    async def open_input_async(self, file_input):
+        """
+        Async version of `open_input`.
+        """
+        try:
+            if self.is_url(file_input):
+                audio = await self.read_url_async(file_input)
+                if not audio:
+                    return None, "Failed to download the audio file from the provided URL."
+            elif self.is_valid_path(file_input):
+                return None, self.check_local_file(file_input)
+            else:
+                audio = await self.read_file_id_async(file_input)
+                if not audio:
+                    return None, "Failed to download the audio file from the provided file ID."
+            return audio, None
+        except FileTooLargeError as e:
+            return None, str(e)
+
+    def transcribe_input(self, service, file_input, on_progress=None):
+        """
+        Downloads and transcribes one audio input, using the transcript cache.
+        :param on_progress: Called with a partial reply as the leading chunks of
+            a long recording are transcribed.
+        :return: Tuple of (file name, transcript, error message or None).
+        """
+        audio, error = self.open_input(file_input)
+        if error:
+            return file_input, None, error
+        name = audio.name if audio else os.path.basename(file_input)
+
+        try:
+            digest = audio.digest() if audio else self.hash_file(file_input)
+            transcript = self.get_cached_transcript(service, digest)
+            if transcript is None:
+                def transcribe():
+                    # Transcribe the audio, in concurrent chunks if it is long
+                    processed = self.preprocess(audio, file_input)
+                    try:
+                        transcript, complete = self.transcribe_chunks(service, self.split(processed, file_input), on_progress)
+                    finally:
+                        if processed is not audio:
+                            processed.close()
+                    if complete:
+                        self.cache_transcript(service, digest, transcript)
+                    return transcript
+
+                transcript = self.flights.do(f"{service}:{digest}", transcribe)
+            return name, transcript, None
+        except Exception as e:
+            return name, None, f"Failed to transcribe the audio using {service}: {str(e)}"
+        finally:
+            if audio:
+                audio.close()
+
+    async def transcribe_input_async(self, service, file_input, on_progress=None):
+        """
+        Async version of `transcribe_input`. `on_progress` is a coroutine function.
+        """
+        audio, error = await self.open_input_async(file_input)
+        if error:
+            return file_input, None, error
+        name = audio.name if audio else os.path.basename(file_input)
+
+        try:
+            # Hashing, processing and the disk cache run in the executor, off the event loop
+            loop = asyncio.get_running_loop()
+            if audio:
+                digest = audio.digest()
+            else:
+                digest = await loop.run_in_executor(None, self.hash_file, file_input)
+            transcript = await loop.run_in_executor(None, self.get_cached_transcript, service, digest)
+            if transcript is None:
+                async def transcribe():
+                    processed = await loop.run_in_executor(None, self.preprocess, audio, file_input)
+                    try:
+                        chunks = await loop.run_in_executor(None, self.split, processed, file_input)
+                        transcript, complete = await self.transcribe_chunks_async(service, chunks, on_progress)
+                    finally:
+                        if processed is not audio:
+                            processed.close()
+                    if complete:
+                        await loop.run_in_executor(None, self.cache_transcript, service, digest, transcript)
+                    return transcript
+
+                transcript = await self.flights.do_async(f"{service}:{digest}", transcribe)
+            return name, transcript, None
+        except Exception as e:
+            return name, None, f"Failed to transcribe the audio using {service}: {str(e)}"
+        finally:
+            if audio:
+                audio.close()
+
+    def preprocess(self, audio, file_input):
+        """
+        Downmixes WAV audio to mono and resamples it to 16 kHz before upload,
+        if AUDIO_PREPROCESS is enabled.
+        :return: The audio to transcribe: a new `AudioBuffer` with the processed
+            audio, or `audio` unchanged if there was nothing to gain.
+        """
+        if not AUDIO_PREPROCESS:
+            return audio
+        name = audio.name if audio else os.path.basename(file_input)
+        processed = AudioBuffer(f"{name.rsplit('.', 1)[0] or 'audio'}.wav")
+        try:
+            stats = preprocess_audio(audio.file if audio else file_input, processed.file)
+        except Exception as e:
+            logger.warning(f"Failed to preprocess {name}, uploading it as is: {e}")
+            stats = None
+        if stats is None:
+            processed.close()
+            return audio
+
+        saved = stats['input_bytes'] - stats['output_bytes']
+        logger.info(f"Preprocessed {name}: {stats['input_bytes']} -> {stats['output_bytes']} bytes "
+                    f"({saved} saved) in {stats['seconds']:.2f}s")
+        if audio:
+            audio.close()
+        return processed
+
+    def split(self, audio, file_input):
+        """
+        Splits long WAV recordings into overlapping chunks small enough for the
+        transcription service.
+        :return: List of audio inputs for the transcription service: `WavChunk`s,
+            read when their transcription starts, or the whole audio if it
+            can't or needn't be split.
+        """
+        name = audio.name if audio else os.path.basename(file_input)
+        chunks = split_audio(audio.file if audio else file_input, name, AUDIO_CHUNK_SECONDS,
+                             AUDIO_CHUNK_OVERLAP_SECONDS, TRANSCRIPTION_MAX_UPLOAD_BYTES)
+        if chunks is None:
+            return [audio.as_upload() if audio else file_input]
+        return chunks
+
+    def transcribe_chunk(self, transcribe_function, chunk):
+        """
+        Transcribes one input, writing a `WavChunk` out to a temporary file
+        for the duration of the call.
+        """
+        if not isinstance(chunk, WavChunk):
+            return transcribe_function(chunk)
+        name, file = chunk.read(AUDIO_SPOOL_MAX_MEMORY, TEMP_DIR)
+        try:
+            return transcribe_function((name, file))
+        finally:
+            file.close()
+
+    def transcribe_chunks(self, service, chunks, on_progress=None):
+        """
+        Transcribes chunks concurrently on the shared transcription pool. While
+        later chunks are still running, `on_progress` is called with the
+        transcript of the leading finished chunks.
+        :return: Tuple of (transcript, whether every chunk was transcribed).
+        """
+        transcribe_function = self.services[service]
+        futures = [
+            self.transcribe_executor.submit(contextvars.copy_context().run, self.transcribe_chunk, transcribe_function, chunk)
+            for chunk in chunks
+        ]
+        parts = []
+        try:
+            while len(parts) < len(futures):
+                parts.append(futures[len(parts)].result())
+                # Take every following chunk that finished in the meantime
+                while len(parts) < len(futures) and futures[len(parts)].done():
+                    parts.append(futures[len(parts)].result())
+                if len(parts) < len(futures) and on_progress is not None:
+                    on_progress(self.format_transcript(service, parts, len(futures)))
+        except BaseException:
+            # Nobody will receive the transcript, don't spend API calls on the chunks not started yet
+            for future in futures:
+                future.cancel()
+            raise
+        return self.join_parts(parts), TRANSCRIPTION_ERROR_MESSAGE not in parts
+
+    async def transcribe_chunks_async(self, service, chunks, on_progress=None):
+        """
+        Async version of `transcribe_chunks`.
+        """
+        transcribe_function = self.async_services[service]
+
+        async def transcribe(chunk):
+            async with self.transcribe_semaphore:
+                if not isinstance(chunk, WavChunk):
+                    return await transcribe_function(chunk)
+                loop = asyncio.get_running_loop()
+                name, file = await loop.run_in_executor(None, chunk.read, AUDIO_SPOOL_MAX_MEMORY, TEMP_DIR)
+                try:
+                    return await transcribe_function((name, file))
+                finally:
+                    file.close()
+
+        tasks = [asyncio.ensure_future(transcribe(chunk)) for chunk in chunks]
+        parts = []
+        try:
+            while len(parts) < len(tasks):
+                parts.append(await tasks[len(parts)])
+                while len(parts) < len(tasks) and tasks[len(parts)].done():
+                    parts.append(tasks[len(parts)].result())
+                if len(parts) < len(tasks) and on_progress is not None:
+                    await on_progress(self.format_transcript(service, parts, len(tasks)))
+        finally:
+            for task in tasks:
+                task.cancel()
+        return self.join_parts(parts), TRANSCRIPTION_ERROR_MESSAGE not in parts
+
+    def join_parts(self, parts):
+        if len(parts) == 1:
+            return parts[0]
+        return stitch_transcripts([
+            f"[Part {index + 1} could not be transcribed.]" if part == TRANSCRIPTION_ERROR_MESSAGE else part
+            for index, part in enumerate(parts)
+        ])
+
+    def format_transcript(self, service, parts, total=None):
+        """
+        Formats the reply for the transcribed parts, marking it as partial if
+        only `len(parts)` of `total` parts are done.
+        """
+        if total is not None and len(parts) < total:
+            return f"Transcription by {service} ({len(parts)}/{total} parts so far):\n\n{self.join_parts(parts)}"
+        return f"Transcription by {service}:\n\n{self.join_parts(parts)}"
+
+    def format_results(self, service, results):
+        """
+        Formats one reply for several transcribed files, in the order given.
+        :param results: List of (file name, transcript, error message) tuples.
+        """
+        sections = [f"**{name}**\n{error or transcript}" for name, transcript, error in results]
+        return f"Transcription by {service}:\n\n" + "\n\n".join(sections)
+
+    def update_post(self, channel_id, post_id, message):
+        """
+        Edits the progress post with the given ID, or creates it on the first
+        update. It is posted directly rather than through the outbox, since
+        its ID is needed for the edits.
+        :return: The ID of the post, or None if it could not be created.
+        """
+        if post_id is None:
+            post = self.mm_client.post_message(channel_id, message)
+            return post['id'] if post else None
+        self.mm_client.patch_post(post_id, message)
+        return post_id
+
+    async def update_post_async(self, channel_id, post_id, message):
+        """
+        Async version of `update_post`.
+        """
+        if post_id is None:
+            post = await self.async_mm_client.post_message(channel_id, message)
+            return post['id'] if post else None
+        await self.async_mm_client.patch_post(post_id, message)
+        return post_id
+
+    def finish_post(self, post_id, message):
+        """
+        Puts the complete transcript in the progress post.
+        :return: None, or the transcript for the bot service to post if there
+            is no progress post or it could not be edited.
+        """
+        if post_id and self.mm_client.patch_post(post_id, message):
+            return None
+        return message
+
+    async def finish_post_async(self, post_id, message):
+        """
+        Async version of `finish_post`.
+        """
+        if post_id and await self.async_mm_client.patch_post(post_id, message):
+            return None
+        return message
+
+    def parse_args(self, args):
+        """
+        Splits the command arguments into the service and the audio inputs.
+        :return: Tuple of (service, list of file inputs, error message or None).
+        """
         if not args:
-            return f"Please provide a file ID, URL, or file path for the audio file. Usage: {self.usage}"
+            return None, None, f"Please provide a file ID for the audio file, or its URL or path. Usage: {self.usage}"
 
-        # Parse arguments
         service = self.default_service
-        file_input = None
 
         # Check for '--service' flag
         if "--service" in args:
@@ -38,53 +477,16 @@ class AudioPlugin(BasePlugin):
                 # Remove the service flag and its value from args
                 args = args[:service_index] + args[service_index + 2:]
             else:
-                return "Please specify a service name after --service"
+                return None, None, "Please specify a service name after --service"
 
         if not args:
-            return f"Please provide a file ID, URL, or file path for the audio file. Usage: {self.usage}"
-
-        file_input = args[0]
+            return None, None, f"Please provide a file ID for the audio file, or its URL or path. Usage: {self.usage}"
 
         # Validate the service
         if service not in self.services:
-            return f"Unknown service: {service}. Available services: {', '.join(self.services.keys())}"
-
-        # Determine if the input is a URL, file path, or file ID
-        if self.is_url(file_input):
-            # Handle URL input
-            audio_file_path = self.download_file_from_url(file_input)
-            if not audio_file_path:
-                return "Failed to download the audio file from the provided URL."
-        elif self.is_valid_path(file_input):
-            # Handle local file path input
-            if not os.path.isfile(file_input):
-                return f"The provided file path does not exist or is not a file: {file_input}"
-            audio_file_path = file_input
-        else:
-            # Assume it's a Mattermost file ID
-            audio_file_path = self.download_file_from_id(file_input)
-            if not audio_file_path:
-                return "Failed to download the audio file from the provided file ID."
-
-        # Ensure the TEMP_DIR exists
-        os.makedirs(TEMP_DIR, exist_ok=True)
+            return None, None, f"Unknown service: {service}. Available services: {', '.join(self.services.keys())}"
 
-        try:
-            # Transcribe the audio
-            transcribe_function = self.services[service]
-            transcript = transcribe_function(audio_file_path)
-            response_message = f"Transcription by {service}:\n\n{transcript}"
-            return response_message
-        except Exception as e:
-            return f"Failed to transcribe the audio using {service}: {str(e)}"
-        finally:
-            # Clean up the downloaded file if it was downloaded from a URL or file ID
-            if self.is_url(file_input) or not self.is_valid_path(file_input):
-                try:
-                    os.remove(audio_file_path)
-                except Exception as e:
-                    # Log the error if needed
-                    pass
+        return service, list(args), None
 
     def initialize(self):
         os.makedirs(TEMP_DIR, exist_ok=True)
@@ -92,6 +494,46 @@ class AudioPlugin(BasePlugin):
 
     def cleanup(self):
         print(f"Cleaning up {self.name} plugin")
+        self.transcribe_executor.shutdown(wait=False, cancel_futures=True)
+        if self.transcript_cache is not None:
+            print(f"Transcript cache stats: {self.transcript_cache.stats()}")
+        print(f"Transcription stats: {self.flights.stats()}")
+
+    def create_transcript_cache(self):
+        """
+        Returns the transcript cache, kept on disk under TEMP_DIR with the most
+        recent transcripts also in memory, or None if TRANSCRIPT_CACHE_MAX_BYTES is 0.
+        """
+        if not TRANSCRIPT_CACHE_MAX_BYTES:
+            return None
+        disk = DiskCache(os.path.join(TEMP_DIR, 'transcript_cache'), TRANSCRIPT_CACHE_MAX_BYTES)
+        return TieredCache(TTLCache(TRANSCRIPT_CACHE_MEMORY_ENTRIES), disk)
+
+    def get_cached_transcript(self, service, digest):
+        """
+        Returns the transcript of audio with the given SHA-256 by the given service, or None.
+        """
+        if self.transcript_cache is None:
+            return None
+        cached = self.transcript_cache.get(f"{service}:{digest}")
+        return cached.decode('utf-8') if cached is not None else None
+
+    def cache_transcript(self, service, digest, transcript):
+        if self.transcript_cache is None or not transcript or transcript == TRANSCRIPTION_ERROR_MESSAGE:
+            return
+        self.transcript_cache.set(f"{service}:{digest}", transcript.encode('utf-8'))
+
+    def hash_file(self, path):
+        """
+        Returns the SHA-256 of a local file. The file is hashed through a
+        memory-mapped view, so large files are not read into memory.
+        """
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                # Empty files can't be memory-mapped
+                return hashlib.sha256().hexdigest()
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                return hashlib.sha256(mapped).hexdigest()
 
     def is_url(self, string):
         """
@@ -103,43 +545,107 @@ class AudioPlugin(BasePlugin):
         except ValueError:
             return False
 
-    def download_file_from_url(self, url):
+    def check_local_file(self, path):
+        """
+        Returns an error message if a local path is not a file or is too large, else None.
+        """
+        if not os.path.isfile(path):
+            return f"The provided file path does not exist or is not a file: {path}"
+        if os.path.getsize(path) > AUDIO_MAX_FILE_SIZE:
+            return str(FileTooLargeError())
+        return None
+
+    def read_url(self, url):
         """
-        Downloads a file from the provided URL to the TEMP_DIR.
-        Returns the file path if successful, else None.
+        Downloads a file from the provided URL into an `AudioBuffer`.
+        Returns the buffer if successful, else None. Raises `FileTooLargeError`
+        as soon as the download exceeds AUDIO_MAX_FILE_SIZE.
         """
+        audio = AudioBuffer(os.path.basename(urlparse(url).path))
         try:
-            local_filename = os.path.join(TEMP_DIR, os.path.basename(urlparse(url).path))
-            with requests.get(url, stream=True) as r:
+            # Reuse the shared pooled session rather than opening a new connection
+            with self.mm_client.session.get(url, stream=True, timeout=self.mm_client.timeout) as r:
                 r.raise_for_status()
-                with open(local_filename, 'wb') as f:
-                    shutil.copyfileobj(r.raw, f)
-            return local_filename
+                for chunk in r.iter_content(DOWNLOAD_CHUNK_SIZE):
+                    audio.write(chunk)
+            return audio
+        except FileTooLargeError:
+            audio.close()
+            raise
         except Exception as e:
             # Log the error if needed
+            audio.close()
             return None
 
-    def download_file_from_id(self, file_id):
+    def read_file_id(self, file_id):
         """
-        Downloads a file from Mattermost using the file ID.
-        Returns the file path if successful, else None.
+        Downloads a file from Mattermost into an `AudioBuffer` using the file ID.
+        Returns the buffer if successful, else None. Raises `FileTooLargeError`
+        if the file exceeds AUDIO_MAX_FILE_SIZE.
         """
         try:
             file_info = self.mm_client.get_file_info(file_id)
-            if not file_info:
+            if not file_info or not file_info['mime_type'].startswith('audio/'):
                 return None
+        except Exception as e:
+            # Log the error if needed
+            return None
+        if file_info.get('size', 0) > AUDIO_MAX_FILE_SIZE:
+            raise FileTooLargeError()
 
-            if not file_info['mime_type'].startswith('audio/'):
-                return None
+        audio = AudioBuffer(file_info['name'])
+        try:
+            for chunk in self.mm_client.iter_file(file_id):
+                audio.write(chunk)
+            return audio
+        except FileTooLargeError:
+            audio.close()
+            raise
+        except Exception as e:
+            # Log the error if needed
+            audio.close()
+            return None
 
-            audio_file_path = os.path.join(TEMP_DIR, f"{file_id}_{file_info['name']}")
-            success = self.mm_client.download_file(file_id, audio_file_path)
-            if success:
-                return audio_file_path
-            else:
-                return None
+    async def read_url_async(self, url):
+        """
+        Async version of `read_url`.
+        """
+        audio = AudioBuffer(os.path.basename(urlparse(url).path))
+        try:
+            async with self.async_mm_client.get_session().get(url) as response:
+                response.raise_for_status()
+                async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                    audio.write(chunk)
+            return audio
+        except FileTooLargeError:
+            audio.close()
+            raise
+        except Exception as e:
+            # Log the error if needed
+            audio.close()
+            return None
+
+    async def read_file_id_async(self, file_id):
+        """
+        Async version of `read_file_id`.
+        """
+        file_info = await self.async_mm_client.get_file_info(file_id)
+        if not file_info or not file_info['mime_type'].startswith('audio/'):
+            return None
+        if file_info.get('size', 0) > AUDIO_MAX_FILE_SIZE:
+            raise FileTooLargeError()
+
+        audio = AudioBuffer(file_info['name'])
+        try:
+            async for chunk in self.async_mm_client.iter_file(file_id):
+                audio.write(chunk)
+            return audio
+        except FileTooLargeError:
+            audio.close()
+            raise
         except Exception as e:
             # Log the error if needed
+            audio.close()
             return None
 
     def is_valid_path(self, path):
@@ -148,4 +654,4 @@ class AudioPlugin(BasePlugin):
         """
         # For security reasons, you might want to restrict paths
         # Here, we'll assume any absolute path is valid
-        return os.path.isabs(path)
\ No newline at end of file
+        return os.path.isabs(path)
@@ -1,6 +1,12 @@
+import asyncio
+import contextvars
+import functools
 from abc import ABC, abstractmethod
 
 class BasePlugin(ABC):
+    # Set by AsyncBotService so async plugins can share its Mattermost client
+    async_mm_client = None
+
     @property
     @abstractmethod
     def name(self):
@@ -18,8 +24,17 @@ class BasePlugin(ABC):
 
     @abstractmethod
     def execute(self, args, channel_id, user_id):
+        # Returns the reply the bot service posts through its outbox: a
+        # message, a (message, file_ids) tuple, or None
         pass
 
+    async def execute_async(self, args, channel_id, user_id):
+        # Default implementation runs the sync execute in an executor, so plugins
+        # without an async implementation still work in async mode
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(None, functools.partial(context.run, self.execute, args, channel_id, user_id))
+
     def initialize(self):
         # Default implementation, can be overridden by subclasses
         pass
@@ -1,6 +1,34 @@
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from src.plugins.base_plugin import BasePlugin
+from src.conversation_store import ConversationStore
+from src.conversation_history import SQLiteConversationHistory
 from src.openai_client import generate_chat_response as openai_chat
-from src.config import CHAT_SERVICE, BOT_INSTRUCTION, BOT_CONTEXT_MSG
+from src.openai_client import async_generate_chat_response as async_openai_chat
+from src.openai_client import stream_chat_response as openai_stream_chat
+from src.openai_client import async_stream_chat_response as async_openai_stream_chat
+from src.openai_client import summarize_conversation, response_cache_stats, chat_flights
+from src.tokenizer import count_tokens, count_message_tokens, get_prompt_budget
+from src.config import (
+    CHAT_SERVICE,
+    BOT_INSTRUCTION,
+    BOT_CONTEXT_MSG,
+    BOT_MAX_CONVERSATIONS,
+    BOT_CONVERSATION_MAX_BYTES,
+    BOT_CONVERSATION_IDLE_TTL,
+    BOT_HISTORY_BACKEND,
+    BOT_HISTORY_DB_PATH,
+    BOT_SUMMARY_THRESHOLD,
+    BOT_SUMMARY_KEEP_MESSAGES
+)
+
+# Put in front of the running summary when it is sent to the chat service
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+
+logger = logging.getLogger(__name__)
+
 
 class ChatPlugin(BasePlugin):
     name = "chat"
@@ -8,50 +36,236 @@ class ChatPlugin(BasePlugin):
     usage = "Just type your message to chat, or use /chat [--service <service_name>] <message>"
 
     def __init__(self):
-        self.conversation_context = {}
+        # Thread-safe, since plugins run on several dispatcher workers at once
+        self.conversations = ConversationStore(
+            max_conversations=BOT_MAX_CONVERSATIONS,
+            max_bytes=BOT_CONVERSATION_MAX_BYTES,
+            idle_ttl=BOT_CONVERSATION_IDLE_TTL,
+            max_messages=BOT_CONTEXT_MSG,
+            history=self.create_history()
+        )
         self.services = {
             "openai": openai_chat,
             # Add other chat services here, e.g.:
             # "gpt4all": gpt4all_chat,
             # "huggingface": huggingface_chat,
         }
+        self.async_services = {
+            "openai": async_openai_chat,
+        }
+        self.stream_services = {
+            "openai": openai_stream_chat,
+        }
+        self.async_stream_services = {
+            "openai": async_openai_stream_chat,
+        }
         self.default_service = CHAT_SERVICE
+        self.system_message = {"role": "system", "content": BOT_INSTRUCTION}
+        self.system_tokens = count_message_tokens(self.system_message)
+        self.summary_prefix_tokens = count_tokens(SUMMARY_PREFIX)
+        # Summaries are generated off the reply path, one at a time per conversation
+        self.summary_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="summarizer")
+        self.summarizing = set()
+        self.summarizing_lock = threading.Lock()
 
     def execute(self, args, channel_id, user_id):
+        service, message, error = self.parse_args(args)
+        if error:
+            return error
+
+        messages, user_message = self.build_messages(user_id, message)
+
+        # Generate response
+        chat_function = self.services[service]
+        response = chat_function(messages)
+
+        self.record_turn(user_id, user_message, response)
+        return f"[{service}] {response}"
+
+    async def execute_async(self, args, channel_id, user_id):
+        service, message, error = self.parse_args(args)
+        if error:
+            return error
+        if service not in self.async_services:
+            # No async implementation for this service, run the sync one in an executor
+            return await super().execute_async(args, channel_id, user_id)
+
+        # The context of a conversation that isn't in memory is loaded from the
+        # history backend, keep that off the event loop
+        loop = asyncio.get_running_loop()
+        messages, user_message = await loop.run_in_executor(None, self.build_messages, user_id, message)
+
+        # Generate response
+        chat_function = self.async_services[service]
+        response = await chat_function(messages)
+
+        self.record_turn(user_id, user_message, response)
+        return f"[{service}] {response}"
+
+    def execute_stream(self, args, channel_id, user_id):
+        """
+        Like `execute`, but yields the reply in chunks as the chat service
+        produces it. The conversation context is updated once the reply is
+        complete; a reply interrupted by `StreamInterrupted` is not recorded.
+        """
+        service, message, error = self.parse_args(args)
+        if error:
+            yield error
+            return
+        if service not in self.stream_services:
+            # No streaming implementation for this service, send the reply in one piece
+            yield self.execute(args, channel_id, user_id)
+            return
+
+        messages, user_message = self.build_messages(user_id, message)
+
+        yield f"[{service}] "
+        chunks = []
+        for chunk in self.stream_services[service](messages):
+            chunks.append(chunk)
+            yield chunk
+
+        self.record_turn(user_id, user_message, "".join(chunks).strip())
+
+    async def execute_stream_async(self, args, channel_id, user_id):
+        """
+        Async version of `execute_stream`.
+        """
+        service, message, error = self.parse_args(args)
+        if error:
+            yield error
+            return
+        if service not in self.async_stream_services:
+            yield await self.execute_async(args, channel_id, user_id)
+            return
+
+        loop = asyncio.get_running_loop()
+        messages, user_message = await loop.run_in_executor(None, self.build_messages, user_id, message)
+
+        yield f"[{service}] "
+        chunks = []
+        async for chunk in self.async_stream_services[service](messages):
+            chunks.append(chunk)
+            yield chunk
+
+        self.record_turn(user_id, user_message, "".join(chunks).strip())
+
+    def parse_args(self, args):
+        """
+        Splits the command arguments into the service and the message.
+        :return: Tuple of (service, message, error message or None).
+        """
         service = self.default_service
         if args and args[0] == "--service":
             if len(args) < 3:
-                return "Please specify a service name and a message after --service"
+                return None, None, "Please specify a service name and a message after --service"
             service = args[1]
             message = " ".join(args[2:])
             if service not in self.services:
-                return f"Unknown service: {service}. Available services: {', '.join(self.services.keys())}"
+                return None, None, f"Unknown service: {service}. Available services: {', '.join(self.services.keys())}"
         else:
             message = " ".join(args)
+        return service, message, None
+
+    def build_messages(self, user_id, message):
+        """
+        Builds the messages for the chat service from the stored context. The
+        newest turns are kept as long as they fit in the model's prompt budget
+        (context window minus OPENAI_MAX_TOKENS), up to BOT_CONTEXT_MSG messages.
+        :return: Tuple of (messages, the new user message).
+        """
+        user_message = self.make_message("user", message)
+        budget = get_prompt_budget() - self.system_tokens - user_message["tokens"]
 
-        # Get or create conversation context
-        context = self.conversation_context.get(user_id, [])
-        context.append({"role": "user", "content": message})
+        summary, history = self.conversations.get_conversation(user_id)
+        summary_messages = []
+        if summary:
+            summary_messages = [{"role": "system", "content": SUMMARY_PREFIX + summary["content"]}]
+            budget -= summary["tokens"] + self.summary_prefix_tokens
+        max_history = BOT_CONTEXT_MSG - 1  # Leave room for the new message
+        history = history[-max_history:] if max_history > 0 else []
 
-        # Trim context if it's too long
-        if len(context) > BOT_CONTEXT_MSG:
-            context = context[-BOT_CONTEXT_MSG:]
+        context = []
+        for stored_message in reversed(history):
+            budget -= stored_message["tokens"]
+            if budget < 0:
+                break
+            context.append({"role": stored_message["role"], "content": stored_message["content"]})
+        context.reverse()
 
         # Prepare messages for the chat service
-        messages = [{"role": "system", "content": BOT_INSTRUCTION}] + context
+        messages = [self.system_message] + summary_messages + context + [{"role": "user", "content": message}]
+        return messages, user_message
 
-        # Generate response
-        chat_function = self.services[service]
-        response = chat_function(messages)
+    def make_message(self, role, content):
+        """
+        Creates a message for the conversation context. Its token count is
+        stored with it, so it is only tokenized once.
+        """
+        message = {"role": role, "content": content}
+        message["tokens"] = count_message_tokens(message)
+        return message
 
-        # Update context
-        context.append({"role": "assistant", "content": response})
-        self.conversation_context[user_id] = context
+    def record_turn(self, user_id, user_message, response):
+        # Append to the stored history rather than replacing it, so turns from
+        # concurrent conversations with the same user are not lost.
+        self.conversations.append(user_id, user_message, self.make_message("assistant", response))
+        self.schedule_summary(user_id)
 
-        return f"[{service}] {response}"
+    def schedule_summary(self, user_id):
+        """
+        Starts folding older turns into the running summary in the background
+        once the conversation is longer than BOT_SUMMARY_THRESHOLD messages.
+        """
+        if not BOT_SUMMARY_THRESHOLD:
+            return
+        if len(self.conversations.get(user_id)) <= BOT_SUMMARY_THRESHOLD:
+            return
+        with self.summarizing_lock:
+            if user_id in self.summarizing:
+                return
+            self.summarizing.add(user_id)
+        self.summary_executor.submit(self.summarize, user_id)
+
+    def summarize(self, user_id):
+        """
+        Folds all but the last BOT_SUMMARY_KEEP_MESSAGES messages into the
+        conversation summary, updating the previous summary incrementally.
+        """
+        try:
+            summary, history = self.conversations.get_conversation(user_id)
+            to_fold = history[:-BOT_SUMMARY_KEEP_MESSAGES] if BOT_SUMMARY_KEEP_MESSAGES > 0 else history
+            if not to_fold:
+                return
+            text = summarize_conversation(summary["content"] if summary else None, to_fold)
+            if not text:
+                return
+            self.conversations.compact(user_id, self.make_message("system", text), to_fold[-1]["seq"])
+        except Exception as e:
+            logger.error(f"Failed to summarize conversation {user_id}: {e}")
+        finally:
+            with self.summarizing_lock:
+                self.summarizing.discard(user_id)
+
+    def create_history(self):
+        """
+        Returns the persistent history backend selected by BOT_HISTORY_BACKEND, if any.
+        """
+        if BOT_HISTORY_BACKEND == 'sqlite':
+            return SQLiteConversationHistory(BOT_HISTORY_DB_PATH)
+        if BOT_HISTORY_BACKEND != 'none':
+            logger.warning(f"Unknown history backend: {BOT_HISTORY_BACKEND}. Conversations will not be persisted.")
+        return None
 
     def initialize(self):
         print(f"Initialized {self.name} plugin with default service: {self.default_service}")
 
     def cleanup(self):
-        print(f"Cleaning up {self.name} plugin")
\ No newline at end of file
+        print(f"Cleaning up {self.name} plugin")
+        self.summary_executor.shutdown(wait=True)
+        print(f"Conversation store stats: {self.conversations.stats()}")
+        cache_stats = response_cache_stats()
+        if cache_stats is not None:
+            print(f"Response cache stats: {cache_stats}")
+        print(f"Chat request stats: {chat_flights.stats()}")
+        self.conversations.close()
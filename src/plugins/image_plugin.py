@@ -1,58 +1,286 @@
+import asyncio
 import base64
+import json
+import logging
+import os
+from contextlib import AsyncExitStack, ExitStack
 from src.plugins.base_plugin import BasePlugin
-from src.openai_client import generate_image as dalle_generate_image
-from src.mattermost_client import MattermostClient
-from src.config import IMAGE_SERVICE
+from src.cache import ContentAddressedCache
+from src.singleflight import SingleFlight
+from src.openai_client import generate_images as dalle_generate_images
+from src.openai_client import async_generate_images as async_dalle_generate_images
+from src.openai_client import IMAGE_SIZE, IMAGE_QUALITY, IMAGE_SIZES, IMAGE_QUALITIES
+from src.mattermost_client import MattermostClient, DOWNLOAD_CHUNK_SIZE
+from src.config import IMAGE_SERVICE, IMAGE_MAX_VARIANTS, IMAGE_RESPONSE_FORMAT, IMAGE_CACHE_MAX_BYTES, TEMP_DIR
+
+logger = logging.getLogger(__name__)
 
 class ImagePlugin(BasePlugin):
     name = "image"
     description = "Generate images based on text descriptions"
-    usage = "/image <description> [--service <service_name>]"
+    usage = "/image <description> [--n <count>] [--size <size>] [--quality <quality>] [--service <service_name>]"
 
     def __init__(self):
         self.services = {
-            "dalle": dalle_generate_image,
+            "dalle": dalle_generate_images,
             # Add other services here, e.g.:
-            # "midjourney": midjourney_generate_image,
-            # "stable_diffusion": stable_diffusion_generate_image,
+            # "midjourney": midjourney_generate_images,
+            # "stable_diffusion": stable_diffusion_generate_images,
+        }
+        self.async_services = {
+            "dalle": async_dalle_generate_images,
         }
         self.default_service = IMAGE_SERVICE
+        self.image_cache = self.create_image_cache()
+        # Identical requests in flight share one generation
+        self.flights = SingleFlight("image")
 
     def execute(self, args, channel_id, user_id):
+        service, prompt, options, error = self.parse_args(args)
+        if error:
+            return error
+
+        # Only the variants that are not cached yet are generated
+        images = self.get_cached_images(service, prompt, options)
+        missing = [index for index, image in enumerate(images) if image is None]
+        if missing:
+            generated = self.flights.do(
+                self.generation_key(service, prompt, options, missing),
+                lambda: self.generate_missing(service, prompt, options, missing)
+            )
+            for index, image in zip(missing, generated):
+                images[index] = image
+
+        images = [image for image in images if image]
+        if not images:
+            return f"Failed to generate the image using {service}. Please try again."
+
+        # All variants go up in one request and are posted together by the
+        # bot service, in order with its other replies to the channel
+        mm_client = MattermostClient()
+        file_ids = self.upload_images(mm_client, channel_id, service, images)
+        if file_ids:
+            return self.describe_images(service, prompt, len(images)), file_ids
+        else:
+            return "Failed to upload the generated image."
+
+    async def execute_async(self, args, channel_id, user_id):
+        service, prompt, options, error = self.parse_args(args)
+        if error:
+            return error
+        if service not in self.async_services or self.async_mm_client is None:
+            return await super().execute_async(args, channel_id, user_id)
+
+        # The cache reads and writes whole images, keep that off the event loop
+        loop = asyncio.get_running_loop()
+        images = await loop.run_in_executor(None, self.get_cached_images, service, prompt, options)
+        missing = [index for index, image in enumerate(images) if image is None]
+        if missing:
+            generated = await self.flights.do_async(
+                self.generation_key(service, prompt, options, missing),
+                lambda: self.generate_missing_async(service, prompt, options, missing)
+            )
+            for index, image in zip(missing, generated):
+                images[index] = image
+
+        images = [image for image in images if image]
+        if not images:
+            return f"Failed to generate the image using {service}. Please try again."
+
+        file_ids = await self.upload_images_async(channel_id, service, images)
+        if file_ids:
+            return self.describe_images(service, prompt, len(images)), file_ids
+        else:
+            return "Failed to upload the generated image."
+
+    def parse_args(self, args):
+        """
+        Splits the command arguments into the service, the prompt and the
+        image options.
+        :return: Tuple of (service, prompt, options, error message or None),
+            where options holds the number of variants `n`, the `size` and the `quality`.
+        """
         if not args:
-            return f"Please provide a description for the image. Usage: {self.usage}"
+            return None, None, None, f"Please provide a description for the image. Usage: {self.usage}"
 
         service = self.default_service
-        if "--service" in args:
-            service_index = args.index("--service")
-            if service_index + 1 < len(args):
-                service = args[service_index + 1]
-                args = args[:service_index] + args[service_index + 2:]
+        options = {'n': 1, 'size': IMAGE_SIZE, 'quality': IMAGE_QUALITY}
+        words = []
+        index = 0
+        while index < len(args):
+            flag = args[index]
+            if flag not in ("--service", "--n", "--size", "--quality"):
+                words.append(flag)
+                index += 1
+                continue
+            if index + 1 >= len(args):
+                if flag == "--service":
+                    return None, None, None, "Please specify a service name after --service"
+                return None, None, None, f"Please specify a value after {flag}"
+            value = args[index + 1]
+            index += 2
+
+            if flag == "--service":
+                service = value
+            elif flag == "--n":
+                if not value.isdigit() or not 1 <= int(value) <= IMAGE_MAX_VARIANTS:
+                    return None, None, None, f"Please specify a number of images from 1 to {IMAGE_MAX_VARIANTS} after --n"
+                options['n'] = int(value)
+            elif flag == "--size":
+                if value not in IMAGE_SIZES:
+                    return None, None, None, f"Unknown size: {value}. Available sizes: {', '.join(IMAGE_SIZES)}"
+                options['size'] = value
             else:
-                return "Please specify a service name after --service"
+                if value not in IMAGE_QUALITIES:
+                    return None, None, None, f"Unknown quality: {value}. Available qualities: {', '.join(IMAGE_QUALITIES)}"
+                options['quality'] = value
 
         if service not in self.services:
-            return f"Unknown service: {service}. Available services: {', '.join(self.services.keys())}"
+            return None, None, None, f"Unknown service: {service}. Available services: {', '.join(self.services.keys())}"
 
-        prompt = " ".join(args)
-        generate_image = self.services[service]
-        image_b64 = generate_image(prompt)
+        if not words:
+            return None, None, None, f"Please provide a description for the image. Usage: {self.usage}"
 
-        if image_b64:
-            image_bytes = base64.b64decode(image_b64)
-            mm_client = MattermostClient()
-            file_id = mm_client.upload_file(channel_id, image_bytes, f"generated_image_{service}.png")
+        return service, " ".join(words), options, None
 
-            if file_id:
-                mm_client.post_message(channel_id, f"Here's the image generated by {service} based on: '{prompt}'", file_ids=[file_id])
-                return None
-            else:
-                return "Failed to upload the generated image."
-        else:
-            return f"Failed to generate the image using {service}. Please try again."
+    def generate_missing(self, service, prompt, options, missing):
+        """
+        Generates the variants at the `missing` indexes and caches them.
+        :return: List with an item per index of `missing`: PNG bytes, or a URL
+            if IMAGE_RESPONSE_FORMAT is "url", or None if the variant failed.
+        """
+        generate_images = self.services[service]
+        if IMAGE_RESPONSE_FORMAT == "url":
+            # Streamed images never pass through here whole, so they are not cached
+            return generate_images(prompt, len(missing), options['size'], options['quality'], response_format="url")
+        images = []
+        for index, image_b64 in zip(missing, generate_images(prompt, len(missing), options['size'], options['quality'])):
+            images.append(base64.b64decode(image_b64) if image_b64 else None)
+            if images[-1]:
+                self.cache_image(service, prompt, options, index, images[-1])
+        return images
+
+    async def generate_missing_async(self, service, prompt, options, missing):
+        """
+        Async version of `generate_missing`.
+        """
+        generate_images = self.async_services[service]
+        if IMAGE_RESPONSE_FORMAT == "url":
+            return await generate_images(prompt, len(missing), options['size'], options['quality'], response_format="url")
+        loop = asyncio.get_running_loop()
+        images = []
+        for index, image_b64 in zip(missing, await generate_images(prompt, len(missing), options['size'], options['quality'])):
+            images.append(base64.b64decode(image_b64) if image_b64 else None)
+            if images[-1]:
+                await loop.run_in_executor(None, self.cache_image, service, prompt, options, index, images[-1])
+        return images
+
+    def generation_key(self, service, prompt, options, missing):
+        """
+        Identifies a generation request, so identical requests in flight are coalesced.
+        """
+        return json.dumps([service, " ".join(prompt.split()), options['size'], options['quality'], missing, IMAGE_RESPONSE_FORMAT])
+
+    def image_files(self, service, images):
+        """
+        Names the generated images for upload.
+        :return: List of (filename, PNG bytes or URL, MIME type) tuples.
+        """
+        if len(images) == 1:
+            return [(f"generated_image_{service}.png", images[0], 'image/png')]
+        return [(f"generated_image_{service}_{index + 1}.png", image, 'image/png') for index, image in enumerate(images)]
+
+    def upload_images(self, mm_client, channel_id, service, images):
+        """
+        Uploads the images in one request. Images given as URLs are downloaded
+        and uploaded in the same pass, one chunk at a time, so they are never
+        held in memory as a whole.
+        :param images: PNG bytes or download URLs.
+        :return: List of file IDs, or None.
+        """
+        files = self.image_files(service, images)
+        if not any(isinstance(image, str) for image in images):
+            return mm_client.upload_files(channel_id, files)
+
+        try:
+            with ExitStack() as stack:
+                streams = []
+                for filename, image, mime_type in files:
+                    if isinstance(image, bytes):
+                        streams.append((filename, [image], mime_type, len(image)))
+                        continue
+                    response = stack.enter_context(mm_client.session.get(image, stream=True, timeout=mm_client.timeout))
+                    response.raise_for_status()
+                    size = response.headers.get('Content-Length')
+                    streams.append((filename, response.iter_content(DOWNLOAD_CHUNK_SIZE), mime_type, int(size) if size else None))
+                return mm_client.upload_streams(channel_id, streams)
+        except Exception as e:
+            logger.error(f"Failed to download the generated image: {e}")
+            return None
+
+    async def upload_images_async(self, channel_id, service, images):
+        """
+        Async version of `upload_images`.
+        """
+        files = self.image_files(service, images)
+        if not any(isinstance(image, str) for image in images):
+            return await self.async_mm_client.upload_files(channel_id, files)
+
+        try:
+            async with AsyncExitStack() as stack:
+                streams = []
+                for filename, image, mime_type in files:
+                    if isinstance(image, bytes):
+                        streams.append((filename, [image], mime_type, len(image)))
+                        continue
+                    response = await stack.enter_async_context(self.async_mm_client.get_session().get(image))
+                    response.raise_for_status()
+                    streams.append((filename, response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE), mime_type, response.content_length))
+                return await self.async_mm_client.upload_streams(channel_id, streams)
+        except Exception as e:
+            logger.error(f"Failed to download the generated image: {e}")
+            return None
+
+    def describe_images(self, service, prompt, count):
+        if count == 1:
+            return f"Here's the image generated by {service} based on: '{prompt}'"
+        return f"Here are {count} images generated by {service} based on: '{prompt}'"
+
+    def create_image_cache(self):
+        """
+        Returns the on-disk cache of generated images under TEMP_DIR, or None if
+        IMAGE_CACHE_MAX_BYTES is 0.
+        """
+        if not IMAGE_CACHE_MAX_BYTES:
+            return None
+        return ContentAddressedCache(os.path.join(TEMP_DIR, 'image_cache'), IMAGE_CACHE_MAX_BYTES)
+
+    def image_cache_key(self, service, prompt, options, index):
+        key = [service, " ".join(prompt.split()), options['size'], options['quality']]
+        # The first variant keeps the key of a single image
+        if index:
+            key.append(index)
+        return json.dumps(key)
+
+    def get_cached_images(self, service, prompt, options):
+        """
+        Returns the PNG bytes previously generated for each of the `n` variants
+        of the same service, prompt, size and quality, with None for the
+        variants that are not cached.
+        """
+        if self.image_cache is None:
+            return [None] * options['n']
+        return [self.image_cache.get(self.image_cache_key(service, prompt, options, index)) for index in range(options['n'])]
+
+    def cache_image(self, service, prompt, options, index, image_bytes):
+        if self.image_cache is not None:
+            self.image_cache.set(self.image_cache_key(service, prompt, options, index), image_bytes)
 
     def initialize(self):
         print(f"Initialized {self.name} plugin with default service: {self.default_service}")
 
     def cleanup(self):
-        print(f"Cleaning up {self.name} plugin")
\ No newline at end of file
+        print(f"Cleaning up {self.name} plugin")
+        if self.image_cache is not None:
+            print(f"Image cache stats: {self.image_cache.stats()}")
+        print(f"Image generation stats: {self.flights.stats()}")
@@ -0,0 +1,87 @@
+import threading
+import time
+
+class TokenBucket:
+    """
+    Thread-safe token bucket that refills at `rate` tokens per second up to
+    `capacity`.
+
+    Tokens can be taken before they are available, leaving the bucket in
+    debt; later callers then wait for the debt to be repaid as well, so
+    callers are served in the order they reserved.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        # `now` may have been read before the bucket was created
+        if now > self.updated_at:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+
+    def delay(self, amount, now=None):
+        """
+        Returns how many seconds to wait until `amount` tokens are available.
+        Amounts larger than the capacity only wait for a full bucket.
+        """
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            self._refill(now)
+            missing = min(amount, self.capacity) - self.tokens
+        return max(0.0, missing / self.rate)
+
+    def take(self, amount, now=None):
+        """
+        Takes `amount` tokens, going into debt if fewer are available.
+        """
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            self._refill(now)
+            self.tokens -= min(amount, self.capacity)
+
+    def reserve(self, amount=1, now=None):
+        """
+        Takes `amount` tokens, going into debt if fewer are available.
+        :return: Seconds to wait until the tokens would have been available.
+        """
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            self._refill(now)
+            self.tokens -= min(amount, self.capacity)
+            return max(0.0, -self.tokens / self.rate)
+
+    def put(self, amount, now=None):
+        """
+        Adds `amount` tokens, up to the capacity.
+        """
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            self._refill(now)
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+    def try_take(self, amount=1, now=None):
+        """
+        Takes `amount` tokens if they are available.
+        :return: True if the tokens were taken.
+        """
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            self._refill(now)
+            if self.tokens < amount:
+                return False
+            self.tokens -= amount
+            return True
+
+def per_minute_bucket(limit):
+    """
+    Returns a bucket allowing `limit` per minute with bursts of up to `limit`,
+    or None if `limit` is 0 (unlimited).
+    """
+    if not limit:
+        return None
+    return TokenBucket(limit / 60.0, limit)
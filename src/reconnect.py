@@ -0,0 +1,134 @@
+import json
+import logging
+import random
+import threading
+import time
+from collections import OrderedDict
+from .events import Post, POST_KEY, event_post
+
+logger = logging.getLogger(__name__)
+
+class ReconnectBackoff:
+    """
+    Capped exponential backoff with jitter between WebSocket reconnects, so
+    a server coming back up isn't hit by every bot at the same moment.
+    """
+
+    def __init__(self, base_delay=1.0, max_delay=60.0):
+        """
+        :param base_delay: Wait before the first reconnect, in seconds.
+        :param max_delay: Longest wait between reconnects.
+        """
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.attempt = 0
+
+    def next_delay(self):
+        """
+        Returns the wait before the next reconnect: between half and all of
+        the capped exponential delay.
+        """
+        delay = min(self.max_delay, self.base_delay * 2 ** self.attempt)
+        self.attempt += 1
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def reset(self):
+        """
+        Called once a connection is ready, so the next drop reconnects quickly.
+        """
+        self.attempt = 0
+
+class EventTracker:
+    """
+    Drops WebSocket events that were already handled and remembers when the
+    last one arrived, so posts missed while disconnected can be fetched.
+
+    The server numbers the events of a connection with `seq`, starting over
+    on every connection; an event whose `seq` isn't past the last one seen is
+    a duplicate. Posts are also remembered by ID, since catching up after a
+    reconnect may return posts that were already received live.
+    """
+
+    def __init__(self, max_posts=10000):
+        """
+        :param max_posts: Most post IDs remembered, oldest first out.
+        """
+        self.max_posts = max_posts
+        self.lock = threading.Lock()
+        self.last_seq = None
+        self.post_ids = OrderedDict()
+        self.last_event_at = None
+        self.duplicates = 0
+
+    def connection_opened(self):
+        with self.lock:
+            self.last_seq = None
+
+    def is_duplicate(self, event_data):
+        """
+        Records an event.
+        :return: True if the event was already seen and must be ignored.
+        """
+        seq = event_data.get('seq')
+        post = event_post(event_data) if event_data.get('event') == 'posted' else None
+        post_id = post.id if post is not None else None
+        with self.lock:
+            if isinstance(seq, int) and not event_data.get('catch_up'):
+                if self.last_seq is not None and seq <= self.last_seq:
+                    self.duplicates += 1
+                    return True
+                self.last_seq = seq
+                self.last_event_at = time.time()
+            if post_id:
+                if post_id in self.post_ids:
+                    self.duplicates += 1
+                    return True
+                self.post_ids[post_id] = True
+                if len(self.post_ids) > self.max_posts:
+                    self.post_ids.popitem(last=False)
+            return False
+
+    def catch_up_since(self, max_age):
+        """
+        Returns the time, in milliseconds since the epoch, from which missed
+        posts are fetched after a reconnect, or None if there is nothing to
+        catch up (first connection, or catching up disabled).
+        :param max_age: Furthest back to go, in seconds; 0 disables catching up.
+        """
+        with self.lock:
+            last_event_at = self.last_event_at
+        if not max_age or last_event_at is None:
+            return None
+        # A little overlap covers clock differences with the server; posts
+        # received twice are dropped by ID
+        since = max(last_event_at - 5, time.time() - max_age)
+        return int(since * 1000)
+
+def missed_post_events(channel, posts, since, skip_user_id=None):
+    """
+    Turns the response of GET /channels/{channel_id}/posts?since= into
+    `posted` events, oldest first, leaving out posts that were only edited
+    or deleted since then.
+    :param channel: The channel the posts belong to.
+    :param posts: The JSON response, with `order` and `posts`.
+    :param since: The `since` parameter of the request, in milliseconds.
+    :param skip_user_id: (Optional) Leave out the posts of this user, e.g. the bot.
+    """
+    new_posts = [
+        post for post in (posts.get('posts') or {}).values()
+        if post.get('create_at', 0) >= since and not post.get('delete_at') and not post.get('type')
+        and not (skip_user_id and post.get('user_id') == skip_user_id)
+    ]
+    new_posts.sort(key=lambda post: post.get('create_at', 0))
+    return [{
+        'event': 'posted',
+        'data': {
+            'post': json.dumps(post),
+            'channel_type': channel.get('type'),
+            'channel_name': channel.get('name'),
+            'channel_display_name': channel.get('display_name'),
+        },
+        'broadcast': {'channel_id': channel.get('id')},
+        'catch_up': True,
+        POST_KEY: Post(post),
+    } for post in new_posts]
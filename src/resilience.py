@@ -0,0 +1,334 @@
+import asyncio
+import email.utils
+import logging
+import random
+import threading
+import time
+from collections import namedtuple
+from .rate_limit import TokenBucket
+from .config import (
+    RETRY_MAX_ATTEMPTS,
+    RETRY_BASE_DELAY,
+    RETRY_MAX_DELAY,
+    RETRY_BUDGET_RATIO,
+    RETRY_BUDGET_MIN_PER_SECOND,
+    CIRCUIT_FAILURE_THRESHOLD,
+    CIRCUIT_RESET_TIMEOUT
+)
+
+logger = logging.getLogger(__name__)
+
+# How an attempt ended: whether it may be retried, whether it counts against
+# the health of the upstream, and how long the upstream asked us to wait
+Outcome = namedtuple('Outcome', ['retryable', 'failure', 'retry_after'])
+SUCCESS = Outcome(False, False, None)
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling an upstream endpoint whose circuit is open.
+    """
+
+    def __init__(self, name, retry_in):
+        self.name = name
+        self.retry_in = retry_in
+        super().__init__(f"{name} is unavailable, not calling it again for {retry_in:.0f}s")
+
+class RequestRejected(Exception):
+    """
+    Raised, by the client calls that are asked to, when an upstream answered
+    a request with an error status.
+    """
+
+    def __init__(self, name, status, body, retry_after=None):
+        self.name = name
+        self.status = status
+        self.retry_after = retry_after
+        super().__init__(f"{name} rejected the request: {status} - {body}")
+
+    @property
+    def retryable(self):
+        """
+        False for errors that sending the request again can't fix, such as
+        400 or 403.
+        """
+        return classify_status(self.status, self.retry_after).retryable
+
+def parse_retry_after(value):
+    """
+    Parses a Retry-After header, given in seconds or as an HTTP date.
+    :return: Seconds to wait, or None if the header is missing or invalid.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, date.timestamp() - time.time())
+
+def classify_status(status, retry_after=None, idempotent=True):
+    """
+    Classifies an HTTP response status. Rate limited requests and requests a
+    proxy or server turned away with 502 or 503 are retried. Other 5xx
+    errors are only retried for idempotent requests, since the request may
+    have been processed.
+    """
+    if status == 429:
+        return Outcome(True, False, retry_after)
+    if status in (502, 503):
+        return Outcome(True, True, retry_after)
+    if status >= 500:
+        return Outcome(idempotent, True, retry_after)
+    return SUCCESS
+
+class CircuitBreaker:
+    """
+    Fails fast while an upstream endpoint is down.
+
+    After `failure_threshold` failures in a row the circuit opens and calls
+    are refused for `reset_timeout` seconds. Then a single trial call is let
+    through: if it succeeds the circuit closes, otherwise it opens again.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.lock = threading.Lock()
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+
+    def before_call(self):
+        """
+        Raises `CircuitOpenError` if the call must not be made.
+        """
+        with self.lock:
+            if self.state == self.OPEN:
+                remaining = self.opened_at + self.reset_timeout - time.monotonic()
+                if remaining > 0:
+                    raise CircuitOpenError(self.name, remaining)
+                self.state = self.HALF_OPEN
+                self.probing = False
+            if self.state == self.HALF_OPEN:
+                if self.probing:
+                    # Another caller is already checking whether the upstream recovered
+                    raise CircuitOpenError(self.name, 0)
+                self.probing = True
+
+    def record_success(self):
+        with self.lock:
+            if self.state != self.CLOSED:
+                logger.info(f"Circuit for {self.name} closed, the upstream recovered.")
+            self.state = self.CLOSED
+            self.failures = 0
+            self.probing = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning(f"Circuit for {self.name} opened after {self.failures} failures.")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self.probing = False
+
+    def record_abandoned(self):
+        """
+        Called when a call ends without an outcome, e.g. because it was
+        cancelled. A probe that was in progress no longer blocks the next one.
+        """
+        with self.lock:
+            self.probing = False
+
+class RetryBudget:
+    """
+    Caps retries at a fraction of the requests, so retries can't multiply
+    the load on an upstream that is already struggling.
+
+    Every request adds `ratio` to the budget and every retry spends 1 from
+    it. The budget also refills by `min_per_second`, so a quiet client can
+    still retry.
+    """
+
+    def __init__(self, ratio=0.2, min_per_second=1.0, capacity=10):
+        self.ratio = ratio
+        self.bucket = TokenBucket(min_per_second, capacity)
+
+    def record_request(self):
+        self.bucket.put(self.ratio)
+
+    def try_spend(self):
+        return self.bucket.try_take(1)
+
+class Resilience:
+    """
+    Retries calls to one upstream with exponential backoff and jitter,
+    honoring Retry-After, within a shared retry budget, and keeps a circuit
+    breaker per endpoint.
+    """
+
+    def __init__(self, name, max_attempts=3, base_delay=0.5, max_delay=20.0,
+                 budget=None, failure_threshold=5, reset_timeout=30.0):
+        """
+        :param name: Name of the upstream, used in logs and errors.
+        :param max_attempts: Attempts per call, including the first.
+        :param base_delay: Backoff before the first retry, in seconds; it
+            doubles with every retry and a random part of it is used.
+        :param max_delay: Longest wait before a retry. A call whose upstream
+            asks for a longer Retry-After is not retried.
+        :param budget: `RetryBudget` shared by the calls, or None for no limit.
+        """
+        self.name = name
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.lock = threading.Lock()
+        self.breakers = {}
+        self.retries = 0
+        self.budget_exhausted = 0
+        self.rejected = 0
+
+    def breaker(self, endpoint):
+        with self.lock:
+            if endpoint not in self.breakers:
+                self.breakers[endpoint] = CircuitBreaker(f"{self.name} {endpoint}", self.failure_threshold, self.reset_timeout)
+            return self.breakers[endpoint]
+
+    def backoff(self, attempt):
+        """
+        Full-jitter exponential backoff before retry number `attempt` (from 0).
+        """
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def _before_attempt(self, breaker):
+        try:
+            breaker.before_call()
+        except CircuitOpenError:
+            with self.lock:
+                self.rejected += 1
+            raise
+
+    def _retry_delay(self, endpoint, breaker, outcome, attempt, retry):
+        """
+        Records the outcome of an attempt.
+        :return: Seconds to wait before retrying, or None to stop.
+        """
+        if outcome.failure:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        if not retry or not outcome.retryable or attempt + 1 >= self.max_attempts:
+            return None
+        if outcome.retry_after is not None and outcome.retry_after > self.max_delay:
+            logger.warning(f"{self.name} {endpoint} asked to retry after {outcome.retry_after:.0f}s, giving up.")
+            return None
+        if self.budget is not None and not self.budget.try_spend():
+            with self.lock:
+                self.budget_exhausted += 1
+            logger.warning(f"Retry budget for {self.name} exhausted, not retrying {endpoint}.")
+            return None
+        with self.lock:
+            self.retries += 1
+        delay = outcome.retry_after if outcome.retry_after is not None else self.backoff(attempt)
+        logger.info(f"Retrying {self.name} {endpoint} in {delay:.2f}s (attempt {attempt + 2}/{self.max_attempts}).")
+        return delay
+
+    def call(self, endpoint, attempt_function, classify, retry=True):
+        """
+        Calls `attempt_function` until it succeeds, its result or error is not
+        retryable, or the attempts or retry budget run out.
+
+        :param endpoint: Name of the endpoint, which has its own circuit breaker.
+        :param attempt_function: Function making one attempt.
+        :param classify: Function taking (result, error) and returning an `Outcome`.
+        :param retry: False to only apply the circuit breaker, e.g. for
+            request bodies that can't be sent twice.
+        :return: The result of the last attempt. The error of the last
+            attempt is raised instead, and `CircuitOpenError` if the circuit is open.
+        """
+        breaker = self.breaker(endpoint)
+        if self.budget is not None:
+            self.budget.record_request()
+        attempt = 0
+        while True:
+            self._before_attempt(breaker)
+            result, error = None, None
+            try:
+                result = attempt_function()
+            except Exception as e:
+                error = e
+            except BaseException:
+                breaker.record_abandoned()
+                raise
+            delay = self._retry_delay(endpoint, breaker, classify(result, error), attempt, retry)
+            if delay is None:
+                if error is not None:
+                    raise error
+                return result
+            time.sleep(delay)
+            attempt += 1
+
+    async def async_call(self, endpoint, attempt_function, classify, retry=True):
+        """
+        Async version of `call`; `attempt_function` is a coroutine function.
+        """
+        breaker = self.breaker(endpoint)
+        if self.budget is not None:
+            self.budget.record_request()
+        attempt = 0
+        while True:
+            self._before_attempt(breaker)
+            result, error = None, None
+            try:
+                result = await attempt_function()
+            except Exception as e:
+                error = e
+            except BaseException:
+                # Cancelled: the probe of a half-open circuit must not stay pending
+                breaker.record_abandoned()
+                raise
+            delay = self._retry_delay(endpoint, breaker, classify(result, error), attempt, retry)
+            if delay is None:
+                if error is not None:
+                    raise error
+                return result
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                'retries': self.retries,
+                'budget_exhausted': self.budget_exhausted,
+                'rejected': self.rejected,
+                'open_circuits': [name for name, breaker in self.breakers.items() if breaker.state != CircuitBreaker.CLOSED],
+            }
+
+def create_resilience(name):
+    """
+    Returns a `Resilience` for an upstream configured by the RETRY_* and
+    CIRCUIT_* settings.
+    """
+    return Resilience(
+        name,
+        max_attempts=RETRY_MAX_ATTEMPTS,
+        base_delay=RETRY_BASE_DELAY,
+        max_delay=RETRY_MAX_DELAY,
+        budget=RetryBudget(RETRY_BUDGET_RATIO, RETRY_BUDGET_MIN_PER_SECOND),
+        failure_threshold=CIRCUIT_FAILURE_THRESHOLD,
+        reset_timeout=CIRCUIT_RESET_TIMEOUT
+    )
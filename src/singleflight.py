@@ -0,0 +1,155 @@
+import asyncio
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+class Flight:
+    """
+    A call in flight and the callers waiting for it.
+    """
+
+    def __init__(self, done):
+        self.done = done
+        self.started_at = time.monotonic()
+        self.waiters = 0
+        self.result = None
+        self.failed = False
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical calls: the first caller with a key makes
+    the call, and callers arriving with the same key while it runs wait for
+    it and get the same result.
+
+    If the call raises, the error goes to its caller only and one of the
+    waiting callers makes the call again, since errors such as a refused
+    admission belong to the caller.
+
+    Threads and coroutines are coalesced separately: `do` is for threads,
+    `do_async` for coroutines running on one event loop.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.lock = threading.Lock()
+        self.flights = {}
+        self.async_flights = {}
+        self.calls = 0
+        self.shared = 0
+
+    def _join(self, flights, key, done_factory):
+        """
+        Registers the caller as making the call for `key` if none is in flight.
+        :return: Tuple of (leader, flight): the flight to wait for if leader is False.
+        """
+        with self.lock:
+            flight = flights.get(key)
+            if flight is None:
+                flights[key] = Flight(done_factory())
+                self.calls += 1
+                return True, None
+            flight.waiters += 1
+        logger.debug(f"Joining {self.name} call in flight for {key} ({flight.waiters} waiting).")
+        return False, flight
+
+    def _finish(self, flights, key, result, failed):
+        with self.lock:
+            flight = flights.pop(key)
+            if not failed:
+                self.shared += flight.waiters
+        flight.result = result
+        flight.failed = failed
+        flight.done.set()
+
+    def join(self, key):
+        """
+        Waits for the call with `key` in flight, if any. Otherwise the caller
+        must make the call and pass its outcome to `finish`.
+        :return: Tuple of (leader, result): result is the shared result if
+            leader is False.
+        """
+        while True:
+            leader, flight = self._join(self.flights, key, threading.Event)
+            if leader:
+                return True, None
+            flight.done.wait()
+            if not flight.failed:
+                return False, flight.result
+
+    def finish(self, key, result=None, failed=False):
+        """
+        Hands the result of the call made after `join` to the waiting callers.
+        :param failed: True if the call raised; a waiting caller then makes it again.
+        """
+        self._finish(self.flights, key, result, failed)
+
+    def do(self, key, function):
+        """
+        Calls `function` unless a call with `key` is in flight, and returns
+        its result or the result of the call in flight.
+        """
+        leader, result = self.join(key)
+        if not leader:
+            return result
+        try:
+            result = function()
+        except BaseException:
+            self.finish(key, failed=True)
+            raise
+        self.finish(key, result)
+        return result
+
+    async def join_async(self, key):
+        """
+        Async version of `join`, paired with `finish_async`.
+        """
+        while True:
+            leader, flight = self._join(self.async_flights, key, asyncio.Event)
+            if leader:
+                return True, None
+            await flight.done.wait()
+            if not flight.failed:
+                return False, flight.result
+
+    def finish_async(self, key, result=None, failed=False):
+        self._finish(self.async_flights, key, result, failed)
+
+    async def do_async(self, key, function):
+        """
+        Async version of `do`; `function` is a coroutine function.
+        """
+        leader, result = await self.join_async(key)
+        if not leader:
+            return result
+        try:
+            result = await function()
+        except BaseException:
+            # Includes cancellation of the caller making the call
+            self.finish_async(key, failed=True)
+            raise
+        self.finish_async(key, result)
+        return result
+
+    def in_flight(self):
+        """
+        Returns the keys of the calls in flight, with the number of callers
+        waiting for each and how long it has been running, in seconds.
+        """
+        now = time.monotonic()
+        with self.lock:
+            return {
+                key: {'waiters': flight.waiters, 'age': round(now - flight.started_at, 3)}
+                for flights in (self.flights, self.async_flights)
+                for key, flight in flights.items()
+            }
+
+    def stats(self):
+        """
+        Returns the number of calls made and of callers that shared a call
+        instead, and the calls in flight.
+        """
+        in_flight = self.in_flight()
+        with self.lock:
+            return {'calls': self.calls, 'shared': self.shared, 'in_flight': in_flight}
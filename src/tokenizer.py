@@ -0,0 +1,93 @@
+import logging
+import threading
+from .config import OPENAI_MODEL_NAME, OPENAI_MAX_TOKENS, OPENAI_CONTEXT_WINDOW
+
+try:
+    import tiktoken
+except ImportError:  # Optional dependency, fall back to an estimate
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# Context window sizes in tokens. Names are matched by prefix, longest first,
+# so dated snapshots such as "gpt-4o-2024-08-06" resolve to their family.
+MODEL_CONTEXT_WINDOWS = {
+    'gpt-4o': 128000,
+    'gpt-4o-mini': 128000,
+    'gpt-4-turbo': 128000,
+    'gpt-4-32k': 32768,
+    'gpt-4': 8192,
+    'gpt-3.5-turbo': 16385,
+    'o1': 200000,
+    'o1-mini': 128000,
+    'o1-preview': 128000,
+}
+DEFAULT_CONTEXT_WINDOW = 8192
+
+# Every message costs a few tokens for its role and separators, and every
+# reply is primed with a few more (see OpenAI's token counting guide).
+TOKENS_PER_MESSAGE = 3
+TOKENS_PER_REPLY = 3
+
+# Rough characters-per-token ratio used when tiktoken is unavailable
+CHARS_PER_TOKEN = 4
+
+_encoding = None
+_encoding_loaded = False
+_encoding_lock = threading.Lock()
+
+def get_encoding():
+    """
+    Returns the tiktoken encoding for OPENAI_MODEL_NAME, or None if tiktoken is
+    not installed or the encoding cannot be loaded.
+    """
+    global _encoding, _encoding_loaded
+    with _encoding_lock:
+        if not _encoding_loaded:
+            _encoding_loaded = True
+            if tiktoken is None:
+                logger.warning("tiktoken is not installed. Token counts will be estimated.")
+            else:
+                try:
+                    try:
+                        _encoding = tiktoken.encoding_for_model(OPENAI_MODEL_NAME)
+                    except KeyError:
+                        _encoding = tiktoken.get_encoding('o200k_base')
+                except Exception as e:
+                    logger.warning(f"Failed to load tokenizer for {OPENAI_MODEL_NAME}: {e}. Token counts will be estimated.")
+        return _encoding
+
+def count_tokens(text):
+    """
+    Counts the tokens of a text for the configured model.
+    """
+    if not text:
+        return 0
+    encoding = get_encoding()
+    if encoding is None:
+        return len(text) // CHARS_PER_TOKEN + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+def count_message_tokens(message):
+    """
+    Counts the tokens a chat message takes up in the prompt.
+    :param message: Message dictionary with 'role' and 'content'.
+    """
+    return TOKENS_PER_MESSAGE + count_tokens(message['content'])
+
+def get_context_window(model=OPENAI_MODEL_NAME):
+    """
+    Returns the context window of a model, preferring OPENAI_CONTEXT_WINDOW if set.
+    """
+    if OPENAI_CONTEXT_WINDOW:
+        return OPENAI_CONTEXT_WINDOW
+    for name in sorted(MODEL_CONTEXT_WINDOWS, key=len, reverse=True):
+        if model.startswith(name):
+            return MODEL_CONTEXT_WINDOWS[name]
+    return DEFAULT_CONTEXT_WINDOW
+
+def get_prompt_budget():
+    """
+    Returns how many tokens the prompt may use, leaving room for the reply.
+    """
+    return get_context_window() - OPENAI_MAX_TOKENS - TOKENS_PER_REPLY
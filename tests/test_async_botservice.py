@@ -0,0 +1,244 @@
+# tests/test_async_botservice.py
+
+import unittest
+from unittest.mock import patch, MagicMock, AsyncMock
+import sys
+import os
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.async_botservice import AsyncBotService
+from src.openai_client import StreamInterrupted
+
+class TestAsyncBotService(unittest.IsolatedAsyncioTestCase):
+
+    @patch('src.async_botservice.get_plugins')
+    @patch('src.async_botservice.CommandHandler')
+    @patch('src.async_botservice.AsyncMattermostClient')
+    async def test_handle_message_with_command(self, mock_mm_client_cls, mock_command_handler_cls, mock_get_plugins):
+        """
+        Test that command messages are executed asynchronously and the response is posted.
+        """
+        mock_command_handler = MagicMock()
+        mock_command_handler.execute_async = AsyncMock(return_value="Transcription result")
+        mock_command_handler.plugins = {}
+        mock_command_handler_cls.return_value = mock_command_handler
+
+        mock_mm_client = MagicMock()
+        mock_mm_client.bot_id = 'bot_id'
+        mock_mm_client.post_message = AsyncMock()
+        mock_mm_client_cls.return_value = mock_mm_client
+
+        mock_get_plugins.return_value = {}
+
+        bot_service = AsyncBotService()
+
+        event_data = {
+            'data': {
+                'post': '{"channel_id": "channel_id", "user_id": "user_id", "message": "/audio", "file_ids": ["test_file_id_123"]}'
+            }
+        }
+        await bot_service.handle_message(event_data)
+
+        mock_command_handler.execute_async.assert_awaited_once_with('audio', ['test_file_id_123'], 'channel_id', 'user_id')
+        mock_mm_client.post_message.assert_awaited_once_with('channel_id', 'Transcription result')
+
+    @patch('src.async_botservice.get_plugins')
+    @patch('src.async_botservice.CommandHandler')
+    @patch('src.async_botservice.AsyncMattermostClient')
+    async def test_plugin_reply_with_files_goes_through_the_outbox(self, mock_mm_client_cls, mock_command_handler_cls, mock_get_plugins):
+        """
+        Test that a (message, file_ids) reply is delivered by the outbox with its files.
+        """
+        mock_command_handler = MagicMock()
+        mock_command_handler.execute_async = AsyncMock(return_value=("Here's the image", ["file_id"]))
+        mock_command_handler.plugins = {}
+        mock_command_handler_cls.return_value = mock_command_handler
+        mock_mm_client = MagicMock()
+        mock_mm_client.post_message = AsyncMock(return_value={'id': 'post_id'})
+        mock_mm_client_cls.return_value = mock_mm_client
+        mock_get_plugins.return_value = {}
+
+        bot_service = AsyncBotService()
+        bot_service.outbox.start()
+        await bot_service.handle_command('channel_id', 'user_id', '/image cat', [])
+        await bot_service.outbox.stop(timeout=5)
+
+        mock_mm_client.post_message.assert_awaited_once()
+        args, kwargs = mock_mm_client.post_message.await_args
+        self.assertEqual(args, ('channel_id', "Here's the image"))
+        self.assertEqual(kwargs['file_ids'], ["file_id"])
+        self.assertEqual(bot_service.outbox.stats()['delivered'], 1)
+
+    @patch('src.async_botservice.get_plugins')
+    @patch('src.async_botservice.CommandHandler')
+    @patch('src.async_botservice.AsyncMattermostClient')
+    async def test_handle_message_with_chat_message(self, mock_mm_client_cls, mock_command_handler_cls, mock_get_plugins):
+        """
+        Test that chat messages are delegated to the chat plugin's async execute.
+        """
+        mock_chat_plugin = MagicMock()
+        mock_chat_plugin.execute_async = AsyncMock(return_value="Chat response")
+        mock_get_plugins.return_value = {'chat': mock_chat_plugin}
+        mock_command_handler_cls.return_value.plugins = {}
+
+        mock_mm_client = MagicMock()
+        mock_mm_client.bot_id = 'bot_id'
+        mock_mm_client.post_message = AsyncMock()
+        mock_mm_client_cls.return_value = mock_mm_client
+
+        bot_service = AsyncBotService()
+
+        # Plugins share the service's async Mattermost client
+        self.assertIs(mock_chat_plugin.async_mm_client, mock_mm_client)
+
+        event_data = {
+            'data': {
+                'post': '{"channel_id": "channel_id", "user_id": "user_id", "message": "Hello, bot!"}'
+            }
+        }
+        await bot_service.handle_message(event_data)
+
+        mock_chat_plugin.execute_async.assert_awaited_once_with(['Hello, bot!'], 'channel_id', 'user_id')
+        mock_mm_client.post_message.assert_awaited_once_with('channel_id', 'Chat response')
+
+    @patch('src.async_botservice.get_plugins')
+    @patch('src.async_botservice.CommandHandler')
+    @patch('src.async_botservice.AsyncMattermostClient')
+    async def test_handle_chat_streaming(self, mock_mm_client_cls, mock_command_handler_cls, mock_get_plugins):
+        """
+        Test that streamed chat replies post a placeholder and then patch it with throttled updates.
+        """
+        async def chunks():
+            for chunk in ["[openai] ", "Hello", ", ", "world", "!"]:
+                yield chunk
+
+        mock_chat_plugin = MagicMock()
+        mock_chat_plugin.execute_stream_async.return_value = chunks()
+        mock_chat_plugin.execute_async = AsyncMock()
+        mock_get_plugins.return_value = {'chat': mock_chat_plugin}
+        mock_command_handler_cls.return_value.plugins = {}
+
+        mock_mm_client = MagicMock()
+        mock_mm_client.post_message = AsyncMock(return_value={'id': 'post_id'})
+        mock_mm_client.patch_post = AsyncMock()
+        mock_mm_client_cls.return_value = mock_mm_client
+
+        bot_service = AsyncBotService()
+
+        with patch('src.async_botservice.BOT_STREAM_RESPONSES', True), \
+             patch('src.async_botservice.BOT_STREAM_UPDATE_INTERVAL', 0), \
+             patch('src.async_botservice.BOT_STREAM_MIN_CHARS', 15):
+            await bot_service.handle_chat('channel_id', 'user_id', 'Hello, bot!')
+
+        mock_chat_plugin.execute_stream_async.assert_called_once_with(['Hello, bot!'], 'channel_id', 'user_id')
+        mock_chat_plugin.execute_async.assert_not_called()
+        mock_mm_client.post_message.assert_awaited_once_with('channel_id', '...')
+        # One intermediate update once 15 characters arrived, then the final text
+        self.assertEqual(mock_mm_client.patch_post.await_args_list, [
+            unittest.mock.call('post_id', '[openai] Hello, '),
+            unittest.mock.call('post_id', '[openai] Hello, world!'),
+        ])
+
+    @patch('src.async_botservice.get_plugins')
+    @patch('src.async_botservice.CommandHandler')
+    @patch('src.async_botservice.AsyncMattermostClient')
+    async def test_handle_chat_streaming_interrupted(self, mock_mm_client_cls, mock_command_handler_cls, mock_get_plugins):
+        """
+        Test that a reply failing midway is replaced by the error message, not appended to.
+        """
+        async def chunks():
+            yield "[openai] "
+            yield "Half of the answer"
+            raise StreamInterrupted()
+
+        mock_chat_plugin = MagicMock()
+        mock_chat_plugin.execute_stream_async.return_value = chunks()
+        mock_get_plugins.return_value = {'chat': mock_chat_plugin}
+        mock_command_handler_cls.return_value.plugins = {}
+
+        mock_mm_client = MagicMock()
+        mock_mm_client.post_message = AsyncMock(return_value={'id': 'post_id'})
+        mock_mm_client.patch_post = AsyncMock()
+        mock_mm_client_cls.return_value = mock_mm_client
+
+        bot_service = AsyncBotService()
+
+        with patch('src.async_botservice.BOT_STREAM_RESPONSES', True):
+            await bot_service.handle_chat('channel_id', 'user_id', 'Hello, bot!')
+
+        mock_mm_client.patch_post.assert_awaited_once_with('post_id', str(StreamInterrupted()))
+
+    @patch('src.async_botservice.get_plugins')
+    @patch('src.async_botservice.CommandHandler')
+    @patch('src.async_botservice.AsyncMattermostClient')
+    async def test_handle_message_from_bot(self, mock_mm_client_cls, mock_command_handler_cls, mock_get_plugins):
+        """
+        Test that messages sent by the bot itself are ignored.
+        """
+        mock_command_handler = MagicMock()
+        mock_command_handler.execute_async = AsyncMock()
+        mock_command_handler.plugins = {}
+        mock_command_handler_cls.return_value = mock_command_handler
+
+        mock_mm_client = MagicMock()
+        mock_mm_client.bot_id = 'bot_id'
+        mock_mm_client.post_message = AsyncMock()
+        mock_mm_client_cls.return_value = mock_mm_client
+
+        mock_get_plugins.return_value = {}
+
+        bot_service = AsyncBotService()
+
+        event_data = {
+            'data': {
+                'post': '{"channel_id": "channel_id", "user_id": "bot_id", "message": "/audio"}'
+            }
+        }
+        await bot_service.handle_message(event_data)
+
+        mock_command_handler.execute_async.assert_not_called()
+        mock_mm_client.post_message.assert_not_called()
+
+    @patch('src.async_botservice.get_plugins')
+    @patch('src.async_botservice.CommandHandler')
+    @patch('src.async_botservice.AsyncMattermostClient')
+    async def test_start_and_stop(self, mock_mm_client_cls, mock_command_handler_cls, mock_get_plugins):
+        """
+        Test that the service connects, registers its dispatcher and cleans up plugins.
+        """
+        mock_mm_client = MagicMock()
+        mock_mm_client.connect = AsyncMock()
+        mock_mm_client.disconnect = AsyncMock()
+        mock_mm_client.close = AsyncMock()
+        mock_mm_client_cls.return_value = mock_mm_client
+        mock_command_handler_cls.return_value.plugins = {}
+
+        mock_plugins = {'audio': MagicMock(), 'chat': MagicMock()}
+        mock_get_plugins.return_value = mock_plugins
+
+        bot_service = AsyncBotService()
+        await bot_service.start()
+
+        mock_mm_client.connect.assert_awaited_once()
+        mock_mm_client.add_message_listener.assert_called_once_with(bot_service.dispatcher.dispatch)
+
+        # The outbox is drained before the HTTP session is closed
+        calls = []
+        mock_mm_client.disconnect.side_effect = lambda: calls.append('disconnect')
+        mock_mm_client.close.side_effect = lambda: calls.append('close')
+        outbox_stop = bot_service.outbox.stop
+        async def stop_outbox(timeout=None):
+            calls.append('outbox')
+            await outbox_stop(timeout)
+        bot_service.outbox.stop = stop_outbox
+
+        await bot_service.stop()
+
+        self.assertEqual(calls, ['disconnect', 'outbox', 'close'])
+        for plugin in mock_plugins.values():
+            plugin.cleanup.assert_called_once()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,21 +1,35 @@
 import unittest
+import tempfile
 from unittest.mock import patch, MagicMock
 import sys
 import os
 import shutil
+import hashlib
+import io
+import wave
+import threading
+from concurrent.futures import Future
 
 # Add the project root to the Python path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from src.plugins.audio_plugin import AudioPlugin
 import src.plugins.audio_plugin as audio_plugin_module
+from src.openai_client import AdmissionDenied
 
 class TestAudioPlugin(unittest.TestCase):
 
+    def setUp(self):
+        # Keep downloads and the transcript cache of each test in their own directory
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        patcher = patch.object(audio_plugin_module, 'TEMP_DIR', self.temp_dir.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
     @patch('src.plugins.audio_plugin.openai_transcribe')
     @patch('src.plugins.audio_plugin.MattermostClient')
-    @patch('src.plugins.audio_plugin.os.remove')
-    def test_execute_default_service(self, mock_remove, mock_mm_client, mock_transcribe):
+    def test_execute_default_service(self, mock_mm_client, mock_transcribe):
         # Patch AUDIO_SERVICE before initializing the plugin
         with patch.object(audio_plugin_module, 'AUDIO_SERVICE', 'openai'):
             # Initialize the plugin after patching AUDIO_SERVICE
@@ -35,42 +49,215 @@ class TestAudioPlugin(unittest.TestCase):
             # Ensure the test .wav file exists
             self.assertTrue(os.path.exists(test_wav_path), f"Test .wav file not found at {test_wav_path}")
 
-            # Mock the download_file method to copy the actual .wav file to the expected path
-            def download_file_side_effect(file_id, audio_file_path):
-                # Ensure the parent directory exists
-                os.makedirs(os.path.dirname(audio_file_path), exist_ok=True)
-                shutil.copy(test_wav_path, audio_file_path)
-
-            mock_mm_client_instance.download_file.side_effect = download_file_side_effect
+            # Stream the actual .wav file in chunks, as the Mattermost client would
+            with open(test_wav_path, 'rb') as f:
+                wav_bytes = f.read()
+            mock_mm_client_instance.iter_file.return_value = iter([wav_bytes[:1000], wav_bytes[1000:]])
 
-            # Set up the transcription return value
-            mock_transcribe.return_value = (
-                "The sun rises in the east and sets in the west. "
-                "This simple fact has been observed by humans for thousands of years."
-            )
+            # Capture what the transcription service receives
+            received = {}
+            def transcribe_side_effect(audio_file):
+                name, file_obj = audio_file
+                received['name'] = name
+                received['content'] = file_obj.read()
+                return (
+                    "The sun rises in the east and sets in the west. "
+                    "This simple fact has been observed by humans for thousands of years."
+                )
+            mock_transcribe.side_effect = transcribe_side_effect
 
             # Call the execute method with the file_id
             result = plugin.execute(["file_id"], "channel_id", "user_id")
 
         # Assertions to ensure that the methods were called as expected
         mock_mm_client_instance.get_file_info.assert_called_once_with("file_id")
-        mock_mm_client_instance.download_file.assert_called_once_with(
-            "file_id",
-            os.path.join(audio_plugin_module.TEMP_DIR, "file_id_test.wav")
-        )
-        mock_transcribe.assert_called_once_with(
-            os.path.join(audio_plugin_module.TEMP_DIR, "file_id_test.wav")
-        )
-        mock_mm_client_instance.post_message.assert_called_once_with(
-            "channel_id",
+        mock_mm_client_instance.iter_file.assert_called_once_with("file_id")
+        self.assertEqual(received, {'name': 'test.wav', 'content': wav_bytes})
+        # The audio was kept in memory, nothing but the transcript cache was written to disk
+        self.assertEqual(os.listdir(audio_plugin_module.TEMP_DIR), ['transcript_cache'])
+        # A transcript without progress updates is returned for the bot service to post
+        self.assertEqual(
+            result,
             "Transcription by openai:\n\n"
             "The sun rises in the east and sets in the west. "
             "This simple fact has been observed by humans for thousands of years."
         )
-        mock_remove.assert_called_once_with(
-            os.path.join(audio_plugin_module.TEMP_DIR, "file_id_test.wav")
-        )
+        mock_mm_client_instance.post_message.assert_not_called()
+
+    @patch('src.plugins.audio_plugin.openai_transcribe')
+    @patch('src.plugins.audio_plugin.MattermostClient')
+    def test_execute_rejects_oversized_file(self, mock_mm_client, mock_transcribe):
+        mock_mm_client_instance = mock_mm_client.return_value
+        mock_mm_client_instance.get_file_info.return_value = {'mime_type': 'audio/wav', 'name': 'test.wav'}
+        mock_mm_client_instance.iter_file.return_value = iter([b"x" * 600, b"x" * 600])
+
+        with patch.object(audio_plugin_module, 'AUDIO_MAX_FILE_SIZE', 1000):
+            plugin = AudioPlugin()
+            result = plugin.execute(["file_id"], "channel_id", "user_id")
+
+            # Files whose reported size is already too large are not downloaded at all
+            mock_mm_client_instance.get_file_info.return_value['size'] = 5000
+            mock_mm_client_instance.iter_file.reset_mock()
+            second_result = plugin.execute(["file_id"], "channel_id", "user_id")
+
+        self.assertIn("larger than the limit", result)
+        self.assertIn("larger than the limit", second_result)
+        mock_mm_client_instance.iter_file.assert_not_called()
+        mock_transcribe.assert_not_called()
+
+    @patch('src.plugins.audio_plugin.openai_transcribe')
+    @patch('src.plugins.audio_plugin.MattermostClient')
+    def test_long_audio_is_transcribed_in_chunks(self, mock_mm_client, mock_transcribe):
+        test_wav_path = os.path.abspath(os.path.join(os.path.dirname(__file__), 'sample_audio.wav'))
+        mock_mm_client_instance = mock_mm_client.return_value
+        first_part_posted = threading.Event()
+        mock_mm_client_instance.post_message.side_effect = lambda *args: first_part_posted.set() or {'id': 'post_id'}
+
+        def transcribe_side_effect(chunk):
+            name, data = chunk
+            if name != "sample_audio_part1.wav":
+                # Later chunks finish only after the first part was posted
+                self.assertTrue(first_part_posted.wait(5))
+            return f"Words of {name}."
+        mock_transcribe.side_effect = transcribe_side_effect
+
+        # The 7 second sample becomes 3 chunks
+        with patch.object(audio_plugin_module, 'AUDIO_SERVICE', 'openai'), \
+             patch.object(audio_plugin_module, 'AUDIO_CHUNK_SECONDS', 3):
+            plugin = AudioPlugin()
+            result = plugin.execute([test_wav_path], "channel_id", "user_id")
+        plugin.cleanup()
+
         self.assertIsNone(result)
+        self.assertEqual(mock_transcribe.call_count, 3)
+        mock_mm_client_instance.post_message.assert_called_once_with(
+            "channel_id", "Transcription by openai (1/3 parts so far):\n\nWords of sample_audio_part1.wav."
+        )
+        mock_mm_client_instance.patch_post.assert_called_with(
+            "post_id",
+            "Transcription by openai:\n\n"
+            "Words of sample_audio_part1.wav. Words of sample_audio_part2.wav. Words of sample_audio_part3.wav."
+        )
+
+    @patch('src.plugins.audio_plugin.openai_transcribe')
+    @patch('src.plugins.audio_plugin.MattermostClient')
+    def test_audio_is_preprocessed_before_upload(self, mock_mm_client, mock_transcribe):
+        # One second of 48 kHz stereo silence
+        stereo = io.BytesIO()
+        with wave.open(stereo, 'wb') as wav:
+            wav.setnchannels(2)
+            wav.setsampwidth(2)
+            wav.setframerate(48000)
+            wav.writeframes(b"\0" * 48000 * 4)
+        mock_mm_client_instance = mock_mm_client.return_value
+        mock_mm_client_instance.get_file_info.return_value = {'mime_type': 'audio/wav', 'name': 'memo.wav'}
+        mock_mm_client_instance.iter_file.return_value = iter([stereo.getvalue()])
+
+        uploaded = {}
+        def transcribe_side_effect(audio_file):
+            name, file_obj = audio_file
+            with wave.open(file_obj, 'rb') as wav:
+                uploaded[name] = (wav.getnchannels(), wav.getframerate(), wav.getnframes())
+            return "Silence"
+        mock_transcribe.side_effect = transcribe_side_effect
+
+        with patch.object(audio_plugin_module, 'AUDIO_SERVICE', 'openai'), \
+             patch.object(audio_plugin_module, 'AUDIO_PREPROCESS', True):
+            plugin = AudioPlugin()
+            with self.assertLogs('src.plugins.audio_plugin', level='INFO') as logs:
+                plugin.execute(["file_id"], "channel_id", "user_id")
+
+        self.assertEqual(uploaded, {'memo.wav': (1, 16000, 16000)})
+        self.assertTrue(any("Preprocessed memo.wav" in line for line in logs.output))
+
+    @patch('src.plugins.audio_plugin.openai_transcribe')
+    @patch('src.plugins.audio_plugin.MattermostClient')
+    def test_multiple_files_are_transcribed_concurrently(self, mock_mm_client, mock_transcribe):
+        mock_mm_client_instance = mock_mm_client.return_value
+        mock_mm_client_instance.get_file_info.side_effect = lambda file_id: {'mime_type': 'audio/wav', 'name': f"{file_id}.wav"}
+        mock_mm_client_instance.iter_file.side_effect = lambda file_id: iter([file_id.encode()])
+
+        lock = threading.Lock()
+        running = []
+        peak = []
+        def transcribe_side_effect(audio_file):
+            name, file_obj = audio_file
+            with lock:
+                running.append(name)
+                peak.append(len(running))
+            # Give the other workers time to start
+            threading.Event().wait(0.05)
+            with lock:
+                running.remove(name)
+            if name == "memo2.wav":
+                raise Exception("Service unavailable")
+            return f"Words of {name}."
+        mock_transcribe.side_effect = transcribe_side_effect
+
+        with patch.object(audio_plugin_module, 'AUDIO_SERVICE', 'openai'), \
+             patch.object(audio_plugin_module, 'AUDIO_PREPROCESS', False), \
+             patch.object(audio_plugin_module, 'AUDIO_FILES_CONCURRENCY', 2):
+            plugin = AudioPlugin()
+            result = plugin.execute(["memo1", "memo2", "memo3", "memo4"], "channel_id", "user_id")
+
+        self.assertEqual(mock_transcribe.call_count, 4)
+        self.assertEqual(max(peak), 2)
+        # One reply, in attachment order, with the failed file reported in place
+        mock_mm_client_instance.post_message.assert_not_called()
+        self.assertEqual(
+            result,
+            "Transcription by openai:\n\n"
+            "**memo1.wav**\nWords of memo1.wav.\n\n"
+            "**memo2.wav**\nFailed to transcribe the audio using openai: Service unavailable\n\n"
+            "**memo3.wav**\nWords of memo3.wav.\n\n"
+            "**memo4.wav**\nWords of memo4.wav."
+        )
+
+    @patch('src.plugins.audio_plugin.MattermostClient')
+    def test_failed_chunk_cancels_the_chunks_not_started(self, mock_mm_client):
+        class FirstOnlyExecutor:
+            """
+            Runs the first submitted call right away and leaves the others queued.
+            """
+            def __init__(self):
+                self.futures = []
+            def submit(self, fn, *args):
+                future = Future()
+                if not self.futures:
+                    try:
+                        future.set_result(fn(*args))
+                    except Exception as e:
+                        future.set_exception(e)
+                self.futures.append(future)
+                return future
+            def shutdown(self, wait=True, cancel_futures=False):
+                pass
+
+        def transcribe(chunk):
+            raise AdmissionDenied(60)
+
+        plugin = AudioPlugin()
+        self.addCleanup(plugin.cleanup)
+        plugin.transcribe_executor = executor = FirstOnlyExecutor()
+        plugin.services['openai'] = transcribe
+        with self.assertRaises(AdmissionDenied):
+            plugin.transcribe_chunks('openai', ['part1', 'part2', 'part3'])
+
+        self.assertEqual([future.cancelled() for future in executor.futures], [False, True, True])
+
+    def test_audio_buffer_spools_large_files(self):
+        with patch.object(audio_plugin_module, 'AUDIO_SPOOL_MAX_MEMORY', 1000):
+            small = audio_plugin_module.AudioBuffer("small.wav")
+            large = audio_plugin_module.AudioBuffer("large.wav")
+        small.write(b"x" * 500)
+        large.write(b"x" * 1500)
+
+        self.assertFalse(small.file._rolled)
+        self.assertTrue(large.file._rolled)
+        self.assertEqual(large.as_upload()[1].read(), b"x" * 1500)
+        self.assertEqual(small.digest(), hashlib.sha256(b"x" * 500).hexdigest())
+        small.close()
+        large.close()
 
     @patch('src.plugins.audio_plugin.AUDIO_SERVICE', 'openai')
     def test_execute_unknown_service(self):
@@ -96,5 +283,32 @@ class TestAudioPlugin(unittest.TestCase):
         # Assert that the appropriate error message is returned
         self.assertIn("Please provide a file ID for the audio file", result)
 
+    @patch('src.plugins.audio_plugin.openai_transcribe')
+    @patch('src.plugins.audio_plugin.MattermostClient')
+    def test_repeat_audio_uses_cached_transcript(self, mock_mm_client, mock_transcribe):
+        mock_transcribe.return_value = "Hello world"
+        test_wav_path = os.path.abspath(os.path.join(os.path.dirname(__file__), 'sample_audio.wav'))
+        copy_path = os.path.join(self.temp_dir.name, 'forwarded.wav')
+        shutil.copy(test_wav_path, copy_path)
+
+        with patch.object(audio_plugin_module, 'AUDIO_SERVICE', 'openai'):
+            plugin = AudioPlugin()
+            plugin.execute([test_wav_path], "channel_1", "user_id")
+            # Same content under another name, with a fresh plugin reading the cache from disk
+            plugin = AudioPlugin()
+            plugin.execute([copy_path], "channel_2", "user_id")
+
+        mock_transcribe.assert_called_once_with(test_wav_path)
+
+    def test_hash_file_matches_content_hash(self):
+        test_wav_path = os.path.join(os.path.dirname(__file__), 'sample_audio.wav')
+        empty_path = os.path.join(self.temp_dir.name, 'empty.wav')
+        open(empty_path, 'wb').close()
+
+        plugin = AudioPlugin()
+        with open(test_wav_path, 'rb') as f:
+            self.assertEqual(plugin.hash_file(test_wav_path), hashlib.sha256(f.read()).hexdigest())
+        self.assertEqual(plugin.hash_file(empty_path), hashlib.sha256(b"").hexdigest())
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,127 @@
+import unittest
+import io
+import wave
+import numpy as np
+import sys
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.audio_processing import open_wav, split_audio, stitch_transcripts, preprocess_audio, WavChunk
+
+RATE = 8000
+
+def make_wav(segments, channels=1, rate=RATE, frequency=440):
+    """
+    Builds a 16-bit WAV file from (seconds, loud) segments: a tone or silence.
+    """
+    pieces = []
+    for seconds, loud in segments:
+        t = np.arange(int(seconds * rate)) / rate
+        pieces.append((np.sin(2 * np.pi * frequency * t) * 10000 * loud).astype(np.int16))
+    samples = np.repeat(np.concatenate(pieces)[:, None], channels, axis=1)
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(samples.tobytes())
+    buffer.seek(0)
+    return buffer
+
+def read_chunk(chunk):
+    name, file = chunk.read()
+    with file:
+        return file.read()
+
+def duration(chunk):
+    with wave.open(io.BytesIO(read_chunk(chunk))) as wav:
+        return wav.getnframes() / wav.getframerate()
+
+class TestSplitAudio(unittest.TestCase):
+
+    def test_short_audio_is_not_split(self):
+        self.assertIsNone(split_audio(make_wav([(3, 1)]), "short.wav", 10, 0, 10 ** 9))
+
+    def test_non_wav_audio_is_not_split(self):
+        self.assertIsNone(open_wav(io.BytesIO(b"ID3 not a wav file")))
+        self.assertIsNone(split_audio(io.BytesIO(b"ID3 not a wav file"), "memo.mp3", 10, 0, 10 ** 9))
+
+    def test_cuts_at_silence(self):
+        # Speech with a pause from 7 to 8 seconds and from 15 to 16 seconds
+        audio = make_wav([(7, 1), (1, 0), (7, 1), (1, 0), (4, 1)], channels=2)
+        chunks = split_audio(audio, "meeting.wav", 10, 0, 10 ** 9)
+
+        self.assertEqual([chunk.name for chunk in chunks], ["meeting_part1.wav", "meeting_part2.wav", "meeting_part3.wav"])
+        durations = [duration(chunk) for chunk in chunks]
+        self.assertTrue(7 <= durations[0] <= 8, durations)
+        self.assertTrue(7 <= durations[1] <= 9, durations)
+        self.assertAlmostEqual(sum(durations), 20, places=2)
+
+    def test_chunks_overlap_and_respect_size_limit(self):
+        audio = make_wav([(20, 1)])
+        # 8 kHz 16-bit mono is 16000 bytes per second; allow 5 seconds
+        chunks = split_audio(audio, "memo.wav", 60, 0.5, 5 * 16000 + 1024)
+
+        self.assertGreaterEqual(len(chunks), 5)
+        self.assertTrue(all(len(read_chunk(chunk)) <= 5 * 16000 + 1024 for chunk in chunks))
+        # Every chunk after the first starts half a second before the previous one ended
+        self.assertAlmostEqual(sum(duration(chunk) for chunk in chunks), 20 + (len(chunks) - 1) * 0.5, places=2)
+
+    def test_chunks_are_read_lazily_and_concurrently(self):
+        audio = make_wav([(20, 1)])
+        chunks = split_audio(audio, "memo.wav", 5, 0, 10 ** 9)
+        self.assertTrue(all(isinstance(chunk, WavChunk) for chunk in chunks))
+
+        # Chunks read at the same time from the shared source get their own frames
+        expected = [read_chunk(chunk) for chunk in chunks]
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            self.assertEqual(list(executor.map(read_chunk, chunks * 3)), expected * 3)
+
+class TestPreprocessAudio(unittest.TestCase):
+
+    def preprocess(self, source):
+        output = io.BytesIO()
+        stats = preprocess_audio(source, output)
+        output.seek(0)
+        return stats, output
+
+    def test_downmixes_and_resamples_to_16khz(self):
+        stats, output = self.preprocess(make_wav([(2, 1)], channels=2, rate=48000))
+
+        with wave.open(output) as wav:
+            self.assertEqual((wav.getnchannels(), wav.getsampwidth(), wav.getframerate()), (1, 2, 16000))
+            samples = np.frombuffer(wav.readframes(wav.getnframes()), dtype=np.int16)
+        self.assertEqual(len(samples), 32000)
+        self.assertEqual(stats['input_bytes'], 2 * 48000 * 2 * 2)
+        self.assertEqual(stats['output_bytes'], 32000 * 2)
+        # The tone survives at the same pitch and loudness
+        spectrum = np.abs(np.fft.rfft(samples))
+        self.assertEqual(np.argmax(spectrum) * 16000 / len(samples), 440)
+        self.assertAlmostEqual(np.abs(samples).max() / 10000, 1, delta=0.05)
+
+    def test_filters_frequencies_above_the_new_rate(self):
+        # A 12 kHz tone can't be represented at 16 kHz and must not alias into speech frequencies
+        stats, output = self.preprocess(make_wav([(1, 1)], rate=48000, frequency=12000))
+
+        with wave.open(output) as wav:
+            samples = np.frombuffer(wav.readframes(wav.getnframes()), dtype=np.int16)
+        self.assertLess(np.abs(samples[100:-100]).max(), 10000 * 0.05)
+
+    def test_compact_audio_is_left_alone(self):
+        self.assertIsNone(preprocess_audio(make_wav([(1, 1)], rate=16000), io.BytesIO()))
+        self.assertIsNone(preprocess_audio(io.BytesIO(b"ID3 not a wav file"), io.BytesIO()))
+
+class TestStitchTranscripts(unittest.TestCase):
+
+    def test_removes_words_repeated_by_overlap(self):
+        parts = ["The meeting started at nine.", "at nine. We discussed the budget", "budget, and then lunch."]
+        self.assertEqual(stitch_transcripts(parts), "The meeting started at nine. We discussed the budget and then lunch.")
+
+    def test_keeps_parts_without_overlap(self):
+        self.assertEqual(stitch_transcripts(["Hello there.", "", "General Kenobi."]), "Hello there. General Kenobi.")
+
+if __name__ == '__main__':
+    unittest.main()
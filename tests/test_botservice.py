@@ -1,6 +1,7 @@
 # tests/test_botservice.py
 
 import unittest
+import threading
 from unittest.mock import patch, MagicMock
 import sys
 import os
@@ -9,6 +10,7 @@ import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from src.botservice import BotService
+from src.openai_client import AdmissionDenied, StreamInterrupted, request_scope
 
 class TestBotService(unittest.TestCase):
 
@@ -43,6 +45,34 @@ class TestBotService(unittest.TestCase):
         # Assert that MattermostClient.post_message was called with the response
         mock_mm_client.post_message.assert_called_once_with('channel_id', 'Transcription result')
 
+    @patch('src.botservice.get_plugins')
+    @patch('src.botservice.CommandHandler')
+    @patch('src.botservice.MattermostClient')
+    def test_plugin_replies_with_files_go_through_the_outbox(self, mock_mm_client_cls, mock_command_handler_cls, mock_get_plugins):
+        """
+        Test that a (message, file_ids) reply is posted in order with the replies already queued for the channel.
+        """
+        mock_command_handler_cls.return_value.execute.return_value = ("Here's the image", ["file_id"])
+        mock_get_plugins.return_value = {}
+        mock_mm_client = MagicMock()
+        mock_mm_client_cls.return_value = mock_mm_client
+        posted = []
+        def post_message(channel_id, message, **options):
+            # The earlier reply is slow to go out
+            if message == "Earlier reply":
+                threading.Event().wait(0.1)
+            posted.append((message, options.get('file_ids')))
+            return {'id': 'post_id'}
+        mock_mm_client.post_message.side_effect = post_message
+
+        bot_service = BotService()
+        bot_service.outbox.start()
+        bot_service.outbox.post('channel_id', "Earlier reply")
+        bot_service.handle_command('channel_id', 'user_id', '/image cat', [])
+        bot_service.outbox.stop(timeout=5)
+
+        self.assertEqual(posted, [("Earlier reply", None), ("Here's the image", ["file_id"])])
+
     @patch('src.botservice.get_plugins')
     @patch('src.botservice.CommandHandler')
     @patch('src.botservice.MattermostClient')
@@ -104,6 +134,39 @@ class TestBotService(unittest.TestCase):
             mock_mm_client = mock_mm_client_cls.return_value
             mock_mm_client.post_message.assert_called_once_with('channel_id', 'Chat response')
 
+    @patch('src.botservice.get_plugins')
+    @patch('src.botservice.CommandHandler')
+    @patch('src.botservice.MattermostClient')
+    def test_handle_message_rate_limited(self, mock_mm_client_cls, mock_command_handler_cls, mock_get_plugins):
+        """
+        Test that a request refused by the rate limits is answered with a slow-down message,
+        and that the OpenAI calls of a message are attributed to its user and channel.
+        """
+        scopes = []
+        def execute(command, args, channel_id, user_id):
+            scopes.append(request_scope.get())
+            raise AdmissionDenied(12.5)
+        mock_command_handler = MagicMock()
+        mock_command_handler.execute.side_effect = execute
+        mock_command_handler_cls.return_value = mock_command_handler
+
+        mock_mm_client = MagicMock()
+        mock_mm_client.bot_id = 'bot_id'
+        mock_mm_client_cls.return_value = mock_mm_client
+        mock_get_plugins.return_value = {}
+
+        bot_service = BotService()
+        bot_service.handle_message({
+            'data': {
+                'post': '{"channel_id": "channel_id", "user_id": "user_id", "message": "/image a cat", "file_ids": []}'
+            }
+        })
+
+        self.assertEqual(scopes, [('user_id', 'channel_id')])
+        self.assertEqual(request_scope.get(), (None, None))
+        mock_mm_client.post_message.assert_called_once_with('channel_id', str(AdmissionDenied(12.5)))
+        self.assertIn("try again in 13 seconds", mock_mm_client.post_message.call_args[0][1])
+
     @patch('src.botservice.get_plugins')
     @patch('src.botservice.CommandHandler')
     @patch('src.botservice.MattermostClient')
@@ -148,11 +211,11 @@ class TestBotService(unittest.TestCase):
     @patch('src.botservice.MattermostClient')
     def test_handle_message_with_command_and_multiple_file_ids(self, mock_mm_client_cls, mock_command_handler_cls, mock_get_plugins):
         """
-        Test that handle_message appends only the first file_id when multiple file_ids are present.
+        Test that handle_message appends every file_id, in order, when multiple file_ids are present.
         """
         # Setup mocks
         mock_command_handler = MagicMock()
-        mock_command_handler.execute.return_value = "Command executed with first file_id"
+        mock_command_handler.execute.return_value = "Command executed with all file_ids"
         mock_command_handler_cls.return_value = mock_command_handler
 
         mock_mm_client = MagicMock()
@@ -176,11 +239,11 @@ class TestBotService(unittest.TestCase):
         # Execute handle_message
         bot_service.handle_message(event_data)
 
-        # Assert that CommandHandler.execute was called with only the first file_id
-        mock_command_handler.execute.assert_called_once_with('audio', ['file_id_1'], 'channel_id', 'user_id')
+        # Assert that CommandHandler.execute was called with all file_ids
+        mock_command_handler.execute.assert_called_once_with('audio', ['file_id_1', 'file_id_2'], 'channel_id', 'user_id')
 
         # Assert that post_message was called with the command response
-        mock_mm_client.post_message.assert_called_once_with('channel_id', 'Command executed with first file_id')
+        mock_mm_client.post_message.assert_called_once_with('channel_id', 'Command executed with all file_ids')
 
     @patch('src.botservice.get_plugins')
     def test_handle_message_with_chat_message(self, mock_get_plugins):
@@ -370,11 +433,21 @@ class TestBotService(unittest.TestCase):
             # Assert that MattermostClient.connect was called
             mock_mm_client.connect.assert_called_once()
 
-            # Assert that handle_message was added as a message listener
-            mock_mm_client.add_message_listener.assert_called_once_with(bot_service.handle_message)
-
-            # Stop the service
-            bot_service.stop()
+            # Assert that the dispatcher was added as a message listener
+            mock_mm_client.add_message_listener.assert_called_once_with(bot_service.dispatcher.dispatch)
+
+            # Stop the service, waiting a bounded time for the last events and replies
+            calls = []
+            mock_mm_client.disconnect.side_effect = lambda: calls.append('disconnect')
+            mock_mm_client.close.side_effect = lambda: calls.append('close')
+            stop_outbox = bot_service.outbox.stop
+            with patch.object(bot_service.dispatcher, 'stop', wraps=bot_service.dispatcher.stop) as dispatcher_stop, \
+                 patch.object(bot_service.outbox, 'stop', side_effect=lambda timeout: calls.append('outbox') or stop_outbox(timeout)) as outbox_stop:
+                bot_service.stop()
+            dispatcher_stop.assert_called_once_with(timeout=30)
+            outbox_stop.assert_called_once_with(timeout=30)
+            # Replies are delivered after the listener stops and before the client closes
+            self.assertEqual(calls, ['disconnect', 'outbox', 'close'])
 
             # Assert that MattermostClient.close was called
             mock_mm_client.close.assert_called_once()
@@ -383,5 +456,102 @@ class TestBotService(unittest.TestCase):
             for plugin in mock_plugins.values():
                 plugin.cleanup.assert_called_once()
 
+    @patch('src.botservice.get_plugins')
+    @patch('src.botservice.CommandHandler')
+    @patch('src.botservice.MattermostClient')
+    def test_get_event_key(self, mock_mm_client_cls, mock_command_handler_cls, mock_get_plugins):
+        """
+        Test that events are keyed by thread root when present, otherwise by channel.
+        """
+        mock_get_plugins.return_value = {}
+        bot_service = BotService()
+
+        channel_event = {'data': {'post': '{"channel_id": "channel_id", "root_id": ""}'}}
+        thread_event = {'data': {'post': '{"channel_id": "channel_id", "root_id": "root_id"}'}}
+
+        self.assertEqual(bot_service.get_event_key(channel_event), 'channel_id')
+        self.assertEqual(bot_service.get_event_key(thread_event), 'root_id')
+        self.assertIsNone(bot_service.get_event_key({'event': 'typing'}))
+
+    @patch('src.botservice.get_plugins')
+    @patch('src.botservice.CommandHandler')
+    @patch('src.botservice.MattermostClient')
+    def test_handle_chat_streaming(self, mock_mm_client_cls, mock_command_handler_cls, mock_get_plugins):
+        """
+        Test that streamed chat replies post a placeholder and then patch it with throttled updates.
+        """
+        mock_chat_plugin = MagicMock()
+        mock_chat_plugin.execute_stream.return_value = iter(["[openai] ", "Hello", ", ", "world", "!"])
+        mock_get_plugins.return_value = {'chat': mock_chat_plugin}
+
+        mock_mm_client = MagicMock()
+        mock_mm_client.post_message.return_value = {'id': 'post_id'}
+        mock_mm_client_cls.return_value = mock_mm_client
+
+        bot_service = BotService()
+
+        with patch('src.botservice.BOT_STREAM_RESPONSES', True), \
+             patch('src.botservice.BOT_STREAM_UPDATE_INTERVAL', 0), \
+             patch('src.botservice.BOT_STREAM_MIN_CHARS', 15):
+            bot_service.handle_chat('channel_id', 'user_id', 'Hello, bot!')
+
+        mock_chat_plugin.execute_stream.assert_called_once_with(['Hello, bot!'], 'channel_id', 'user_id')
+        mock_chat_plugin.execute.assert_not_called()
+        mock_mm_client.post_message.assert_called_once_with('channel_id', '...')
+        # One intermediate update once 15 characters arrived, then the final text
+        self.assertEqual(mock_mm_client.patch_post.call_args_list, [
+            unittest.mock.call('post_id', '[openai] Hello, '),
+            unittest.mock.call('post_id', '[openai] Hello, world!'),
+        ])
+
+    @patch('src.botservice.get_plugins')
+    @patch('src.botservice.CommandHandler')
+    @patch('src.botservice.MattermostClient')
+    def test_handle_chat_streaming_without_placeholder(self, mock_mm_client_cls, mock_command_handler_cls, mock_get_plugins):
+        """
+        Test that the full reply is posted once if the placeholder could not be posted.
+        """
+        mock_chat_plugin = MagicMock()
+        mock_chat_plugin.execute_stream.return_value = iter(["[openai] ", "Hello"])
+        mock_get_plugins.return_value = {'chat': mock_chat_plugin}
+
+        mock_mm_client = MagicMock()
+        mock_mm_client.post_message.return_value = None
+        mock_mm_client_cls.return_value = mock_mm_client
+
+        bot_service = BotService()
+
+        with patch('src.botservice.BOT_STREAM_RESPONSES', True):
+            bot_service.handle_chat('channel_id', 'user_id', 'Hello, bot!')
+
+        mock_mm_client.patch_post.assert_not_called()
+        mock_mm_client.post_message.assert_called_with('channel_id', '[openai] Hello')
+
+    @patch('src.botservice.get_plugins')
+    @patch('src.botservice.CommandHandler')
+    @patch('src.botservice.MattermostClient')
+    def test_handle_chat_streaming_interrupted(self, mock_mm_client_cls, mock_command_handler_cls, mock_get_plugins):
+        """
+        Test that a reply failing midway is replaced by the error message, not appended to.
+        """
+        def chunks():
+            yield "[openai] "
+            yield "Half of the answer"
+            raise StreamInterrupted()
+        mock_chat_plugin = MagicMock()
+        mock_chat_plugin.execute_stream.return_value = chunks()
+        mock_get_plugins.return_value = {'chat': mock_chat_plugin}
+
+        mock_mm_client = MagicMock()
+        mock_mm_client.post_message.return_value = {'id': 'post_id'}
+        mock_mm_client_cls.return_value = mock_mm_client
+
+        bot_service = BotService()
+
+        with patch('src.botservice.BOT_STREAM_RESPONSES', True):
+            bot_service.handle_chat('channel_id', 'user_id', 'Hello, bot!')
+
+        mock_mm_client.patch_post.assert_called_with('post_id', str(StreamInterrupted()))
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,141 @@
+import unittest
+import tempfile
+from unittest.mock import patch, MagicMock
+import sys
+import os
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import src.openai_client as openai_client_module
+from src.cache import TTLCache, DiskCache, TieredCache, ContentAddressedCache
+
+def completion(text):
+    response = MagicMock()
+    response.choices[0].message.content = text
+    return response
+
+class TestTTLCache(unittest.TestCase):
+
+    def test_evicts_least_recently_used(self):
+        cache = TTLCache(max_entries=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.stats(), {'entries': 2, 'hits': 2, 'misses': 1, 'evictions': 1})
+
+    def test_expired_entries_are_missing(self):
+        cache = TTLCache(ttl=10)
+        with patch('src.cache.time.monotonic', return_value=100):
+            cache.set("a", 1)
+        with patch('src.cache.time.monotonic', return_value=105):
+            self.assertEqual(cache.get("a"), 1)
+        with patch('src.cache.time.monotonic', return_value=111):
+            self.assertIsNone(cache.get("a"))
+        self.assertEqual(len(cache), 0)
+
+class TestDiskCache(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_entries_survive_restart(self):
+        cache = DiskCache(self.temp_dir.name)
+        cache.set("key", b"value")
+
+        cache = DiskCache(self.temp_dir.name)
+        self.assertEqual(cache.get("key"), b"value")
+        self.assertIsNone(cache.get("other"))
+        self.assertEqual(cache.stats()['entries'], 1)
+
+    def test_size_quota_evicts_least_recently_used(self):
+        cache = DiskCache(self.temp_dir.name, max_bytes=10)
+        cache.set("a", b"1234")
+        cache.set("b", b"1234")
+        cache.get("a")
+        cache.set("c", b"1234")
+
+        self.assertEqual(cache.get("a"), b"1234")
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.stats()['bytes'], 8)
+        self.assertEqual(len(os.listdir(self.temp_dir.name)), 2)
+
+    def test_tiered_cache_promotes_disk_hits(self):
+        disk = DiskCache(self.temp_dir.name)
+        disk.set("key", b"value")
+        cache = TieredCache(TTLCache(), disk)
+
+        self.assertEqual(cache.get("key"), b"value")
+        self.assertEqual(cache.memory.get("key"), b"value")
+
+    def test_content_addressed_cache_stores_identical_values_once(self):
+        cache = ContentAddressedCache(self.temp_dir.name, max_bytes=10)
+        cache.set("first", b"12345")
+        cache.set("second", b"12345")
+
+        self.assertEqual(cache.get("first"), b"12345")
+        self.assertEqual(cache.get("second"), b"12345")
+        self.assertEqual(cache.stats()['blobs']['bytes'], 5)
+
+        # Evicting the shared value turns both keys into misses
+        cache.set("third", b"abcdefgh")
+        self.assertIsNone(cache.get("first"))
+        self.assertEqual(cache.get("third"), b"abcdefgh")
+
+class TestResponseCache(unittest.TestCase):
+
+    def setUp(self):
+        patcher = patch.object(openai_client_module, 'response_cache', TTLCache())
+        self.cache = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @patch('src.openai_client.create_chat_completion')
+    def test_first_turn_question_is_cached(self, mock_completion):
+        mock_completion.return_value = completion("Answer")
+        first = [{"role": "system", "content": "Be helpful."}, {"role": "user", "content": "How do I reset my password?"}]
+        repeat = [{"role": "system", "content": "Be helpful."}, {"role": "user", "content": "  How do I reset\nmy password? "}]
+
+        self.assertEqual(openai_client_module.generate_chat_response(first), "Answer")
+        self.assertEqual(openai_client_module.generate_chat_response(repeat), "Answer")
+
+        mock_completion.assert_called_once()
+        self.assertEqual(self.cache.stats()['hits'], 1)
+
+    @patch('src.openai_client.create_chat_completion')
+    def test_follow_up_is_not_cached(self, mock_completion):
+        mock_completion.return_value = completion("Answer")
+        messages = [
+            {"role": "user", "content": "Hello"},
+            {"role": "assistant", "content": "Hi!"},
+            {"role": "user", "content": "And now?"}
+        ]
+
+        with patch.object(openai_client_module, 'OPENAI_TEMPERATURE', 0.7):
+            openai_client_module.generate_chat_response(messages)
+            openai_client_module.generate_chat_response(messages)
+        self.assertEqual(mock_completion.call_count, 2)
+
+        # Deterministic requests are cached whatever the context
+        with patch.object(openai_client_module, 'OPENAI_TEMPERATURE', 0):
+            openai_client_module.generate_chat_response(messages)
+            openai_client_module.generate_chat_response(messages)
+        self.assertEqual(mock_completion.call_count, 3)
+
+    @patch('src.openai_client.create_chat_completion')
+    def test_errors_are_not_cached(self, mock_completion):
+        mock_completion.side_effect = [Exception("API down"), completion("Answer")]
+        messages = [{"role": "user", "content": "Hello"}]
+
+        self.assertIn("I'm sorry", openai_client_module.generate_chat_response(messages))
+        self.assertEqual(openai_client_module.generate_chat_response(messages), "Answer")
+        self.assertEqual(len(self.cache), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,7 @@
 import unittest
-from unittest.mock import patch, MagicMock
+import asyncio
+import threading
+from unittest.mock import patch, MagicMock, AsyncMock
 import sys
 import os
 
@@ -7,6 +9,7 @@ import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from src.plugins.chat_plugin import ChatPlugin
+from src.openai_client import StreamInterrupted
 import src.plugins.chat_plugin as chat_plugin_module
 
 class TestChatPlugin(unittest.TestCase):
@@ -79,5 +82,188 @@ class TestChatPlugin(unittest.TestCase):
         # Assert that the appropriate error message is returned
         self.assertIn("Please specify a service name and a message", result)
 
+    def test_execute_stream_records_full_reply(self):
+        mock_stream_chat = MagicMock(return_value=iter(["AI ", "response "]))
+
+        with patch.object(chat_plugin_module, 'CHAT_SERVICE', 'openai'):
+            plugin = ChatPlugin()
+            plugin.stream_services["openai"] = mock_stream_chat
+            chunks = list(plugin.execute_stream(["Hello"], "channel_id", "user_id"))
+
+        self.assertEqual(chunks, ["[openai] ", "AI ", "response "])
+        context = [{"role": msg["role"], "content": msg["content"]} for msg in plugin.conversations.get("user_id")]
+        self.assertEqual(context, [
+            {"role": "user", "content": "Hello"},
+            {"role": "assistant", "content": "AI response"}
+        ])
+
+    def test_execute_stream_does_not_record_an_interrupted_reply(self):
+        def interrupted_stream(messages):
+            yield "Half of "
+            raise StreamInterrupted()
+
+        with patch.object(chat_plugin_module, 'CHAT_SERVICE', 'openai'):
+            plugin = ChatPlugin()
+            plugin.stream_services["openai"] = interrupted_stream
+            chunks = []
+            with self.assertRaises(StreamInterrupted):
+                for chunk in plugin.execute_stream(["Hello"], "channel_id", "user_id"):
+                    chunks.append(chunk)
+
+        self.assertEqual(chunks, ["[openai] ", "Half of "])
+        self.assertEqual(plugin.conversations.get("user_id"), [])
+
+    @patch('src.plugins.chat_plugin.openai_chat')
+    def test_execute_concurrent_turns_keep_context(self, mock_openai_chat):
+        mock_openai_chat.return_value = "AI response"
+
+        with patch.object(chat_plugin_module, 'CHAT_SERVICE', 'openai'):
+            plugin = ChatPlugin()
+
+            threads = [
+                threading.Thread(target=plugin.execute, args=([f"Hello {n}"], f"channel_{n}", "user_id"))
+                for n in range(4)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        # Every turn is kept, none overwritten by a concurrent update
+        context = plugin.conversations.get("user_id")
+        self.assertEqual(len(context), 8)
+        self.assertCountEqual(
+            [msg["content"] for msg in context if msg["role"] == "user"],
+            [f"Hello {n}" for n in range(4)]
+        )
+
+class TestChatPluginAsync(unittest.IsolatedAsyncioTestCase):
+
+    async def test_execute_async_default_service(self):
+        mock_async_chat = AsyncMock(return_value="AI response")
+
+        with patch.object(chat_plugin_module, 'CHAT_SERVICE', 'openai'), \
+             patch.object(chat_plugin_module, 'async_openai_chat', mock_async_chat):
+            plugin = ChatPlugin()
+            result = await plugin.execute_async(["Hello"], "channel_id", "user_id")
+
+        mock_async_chat.assert_awaited_once_with([
+            {"role": "system", "content": chat_plugin_module.BOT_INSTRUCTION},
+            {"role": "user", "content": "Hello"}
+        ])
+        self.assertEqual(result, "[openai] AI response")
+        self.assertEqual(len(plugin.conversations.get("user_id")), 2)
+
+    async def test_slow_history_load_does_not_block_the_event_loop(self):
+        release = threading.Event()
+        history = MagicMock()
+        def load(key, max_messages):
+            release.wait(5)
+            return None
+        history.load.side_effect = load
+        mock_async_chat = AsyncMock(return_value="AI response")
+
+        with patch.object(chat_plugin_module, 'CHAT_SERVICE', 'openai'), \
+             patch.object(chat_plugin_module, 'async_openai_chat', mock_async_chat):
+            plugin = ChatPlugin()
+            plugin.conversations.history = history
+            reply = asyncio.create_task(plugin.execute_async(["Hello"], "channel_id", "user_id"))
+            # The loop keeps running other work while the conversation loads
+            await asyncio.sleep(0.05)
+            self.assertFalse(reply.done())
+            release.set()
+            self.assertEqual(await reply, "[openai] AI response")
+
+        history.load.assert_called_with("user_id", plugin.conversations.max_messages)
+
+    async def test_execute_stream_async_records_full_reply(self):
+        async def stream_chat(messages):
+            for chunk in ["AI ", "response "]:
+                yield chunk
+
+        with patch.object(chat_plugin_module, 'CHAT_SERVICE', 'openai'):
+            plugin = ChatPlugin()
+            plugin.async_stream_services["openai"] = stream_chat
+            chunks = [chunk async for chunk in plugin.execute_stream_async(["Hello"], "channel_id", "user_id")]
+
+        self.assertEqual(chunks, ["[openai] ", "AI ", "response "])
+        context = [{"role": msg["role"], "content": msg["content"]} for msg in plugin.conversations.get("user_id")]
+        self.assertEqual(context, [
+            {"role": "user", "content": "Hello"},
+            {"role": "assistant", "content": "AI response"}
+        ])
+
+    @patch('src.plugins.chat_plugin.openai_chat')
+    def test_execute_fits_context_in_token_budget(self, mock_openai_chat):
+        mock_openai_chat.return_value = "AI response"
+
+        with patch.object(chat_plugin_module, 'CHAT_SERVICE', 'openai'), \
+             patch.object(chat_plugin_module, 'count_message_tokens', lambda message: len(message["content"])), \
+             patch.object(chat_plugin_module, 'get_prompt_budget', lambda: 100):
+            plugin = ChatPlugin()
+            plugin.conversations.append(
+                "user_id",
+                plugin.make_message("user", "x" * 60),
+                plugin.make_message("assistant", "old answer"),
+                plugin.make_message("user", "short question"),
+                plugin.make_message("assistant", "short answer"),
+            )
+            plugin.execute(["Hello"], "channel_id", "user_id")
+
+        # The 60-token message no longer fits next to the instruction and the newer turns
+        messages = mock_openai_chat.call_args[0][0]
+        self.assertEqual([msg["content"] for msg in messages[1:]], [
+            "old answer", "short question", "short answer", "Hello"
+        ])
+        # Token counts stay in the stored context and are not sent to the service
+        self.assertTrue(all(set(msg) == {"role", "content"} for msg in messages))
+        self.assertEqual(plugin.conversations.get("user_id")[-1]["tokens"], len("AI response"))
+
+    @patch('src.plugins.chat_plugin.summarize_conversation')
+    @patch('src.plugins.chat_plugin.openai_chat')
+    def test_long_conversation_is_summarized(self, mock_openai_chat, mock_summarize):
+        mock_openai_chat.return_value = "AI response"
+        mock_summarize.return_value = "They said hello three times."
+
+        with patch.object(chat_plugin_module, 'CHAT_SERVICE', 'openai'), \
+             patch.object(chat_plugin_module, 'BOT_SUMMARY_THRESHOLD', 4), \
+             patch.object(chat_plugin_module, 'BOT_SUMMARY_KEEP_MESSAGES', 2):
+            plugin = ChatPlugin()
+            # Run background summaries inline
+            plugin.summary_executor = MagicMock()
+            plugin.summary_executor.submit.side_effect = lambda fn, *args: fn(*args)
+
+            for n in range(3):
+                plugin.execute([f"Hello {n}"], "channel_id", "user_id")
+            plugin.execute(["What did I say?"], "channel_id", "user_id")
+
+        # After the third turn, the first four messages were folded into the summary
+        self.assertEqual(plugin.summary_executor.submit.call_count, 1)
+        folded = mock_summarize.call_args[0][1]
+        self.assertEqual([msg["content"] for msg in folded], ["Hello 0", "AI response", "Hello 1", "AI response"])
+
+        messages = mock_openai_chat.call_args[0][0]
+        self.assertEqual(messages[1], {
+            "role": "system",
+            "content": chat_plugin_module.SUMMARY_PREFIX + "They said hello three times."
+        })
+        self.assertEqual([msg["content"] for msg in messages[2:]], ["Hello 2", "AI response", "What did I say?"])
+
+    @patch('src.plugins.chat_plugin.summarize_conversation')
+    def test_failed_summary_is_logged_and_history_kept(self, mock_summarize):
+        mock_summarize.side_effect = RuntimeError("service unavailable")
+
+        with patch.object(chat_plugin_module, 'BOT_SUMMARY_KEEP_MESSAGES', 1):
+            plugin = ChatPlugin()
+            plugin.summary_executor = MagicMock()
+            for n in range(2):
+                plugin.record_turn("user_id", plugin.make_message("user", f"Hello {n}"), "AI response")
+            with self.assertLogs('src.plugins.chat_plugin', level='ERROR') as logs:
+                plugin.summarize("user_id")
+
+        self.assertIn("Failed to summarize conversation user_id: service unavailable", logs.output[0])
+        self.assertEqual(len(plugin.conversations.get("user_id")), 4)
+        self.assertNotIn("user_id", plugin.summarizing)
+
 if __name__ == '__main__':
     unittest.main()
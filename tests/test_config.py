@@ -1,5 +1,6 @@
 import sys
 import os
+import subprocess
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from src.config import (
@@ -22,5 +23,32 @@ def test_config():
     assert OPENAI_API_KEY is not None, "OPENAI_API_KEY is not set."
     print("All environment variables are loaded correctly.")
 
+def load_config(script="import src.config", **env):
+    base_env = {key: value for key, value in os.environ.items() if not key.startswith('BOT_')}
+    return subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=os.path.abspath(os.path.join(os.path.dirname(__file__), '..')),
+        env=dict(base_env, **env), capture_output=True, text=True
+    )
+
+def test_summary_threshold_must_be_below_context_size():
+    result = load_config(BOT_CONTEXT_MSG="20", BOT_SUMMARY_THRESHOLD="20")
+    assert result.returncode != 0
+    assert "BOT_SUMMARY_THRESHOLD must be lower than BOT_CONTEXT_MSG" in result.stderr
+    assert load_config(BOT_CONTEXT_MSG="20", BOT_SUMMARY_THRESHOLD="0").returncode == 0
+    assert load_config(BOT_CONTEXT_MSG="20", BOT_SUMMARY_THRESHOLD="19").returncode == 0
+
+def test_summaries_are_opt_in():
+    # A small context size, valid before summaries existed, still starts
+    result = load_config("import src.config as c; print(c.BOT_SUMMARY_THRESHOLD)", BOT_CONTEXT_MSG="10")
+    assert result.returncode == 0
+    assert result.stdout.strip() == "0"
+
+def test_summary_threshold_above_the_default_context_size_is_lowered():
+    result = load_config("import src.config as c; print(c.BOT_SUMMARY_THRESHOLD)", BOT_SUMMARY_THRESHOLD="80")
+    assert result.returncode == 0
+    assert result.stdout.strip() == "49"
+    assert "using 49" in result.stderr
+
 if __name__ == "__main__":
     test_config()
\ No newline at end of file
@@ -0,0 +1,88 @@
+import unittest
+import tempfile
+import sys
+import os
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.conversation_history import SQLiteConversationHistory
+from src.conversation_store import ConversationStore
+
+def message(content, role="user", seq=0):
+    return {"role": role, "content": content, "tokens": len(content), "seq": seq}
+
+def contents(messages):
+    return [msg["content"] for msg in messages]
+
+class TestSQLiteConversationHistory(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.temp_dir.name, 'history', 'conversations.db')
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_history_survives_restart(self):
+        history = SQLiteConversationHistory(self.db_path, flush_interval=0.01)
+        history.save("user_id", [message("Hello", seq=0), message("Hi!", role="assistant", seq=1)])
+        history.save("other_user", [message("Unrelated")])
+        history.close()
+
+        history = SQLiteConversationHistory(self.db_path, flush_interval=0.01)
+        try:
+            conversation = history.load("user_id", 10)
+            self.assertEqual(conversation.messages, [message("Hello", seq=0), message("Hi!", role="assistant", seq=1)])
+            self.assertEqual(conversation.next_seq, 2)
+            self.assertIsNone(conversation.summary)
+            self.assertIsNone(history.load("unknown", 10))
+        finally:
+            history.close()
+
+    def test_load_returns_latest_messages_in_order(self):
+        history = SQLiteConversationHistory(self.db_path, batch_size=3, flush_interval=0.01)
+        try:
+            history.save("user_id", [message(str(n), seq=n) for n in range(10)])
+            # Waits for the queued writes of this conversation to be committed
+            self.assertEqual(contents(history.load("user_id", 4).messages), ["6", "7", "8", "9"])
+        finally:
+            history.close()
+
+    def test_load_skips_summarized_messages(self):
+        history = SQLiteConversationHistory(self.db_path, flush_interval=0.01)
+        try:
+            history.save("user_id", [message(str(n), seq=n) for n in range(6)])
+            history.save_summary("user_id", {"role": "system", "content": "Summary", "tokens": 7}, 3)
+
+            conversation = history.load("user_id", 10)
+            self.assertEqual(conversation.summary["content"], "Summary")
+            self.assertEqual(conversation.summary_upto, 3)
+            self.assertEqual(contents(conversation.messages), ["4", "5"])
+            self.assertEqual(conversation.next_seq, 6)
+        finally:
+            history.close()
+
+    def test_store_loads_conversation_lazily(self):
+        history = SQLiteConversationHistory(self.db_path, flush_interval=0.01)
+        store = ConversationStore(history=history)
+        store.append("user_id", message("Hello"), message("Hi!", role="assistant"))
+        store.close()
+
+        history = SQLiteConversationHistory(self.db_path, flush_interval=0.01)
+        store = ConversationStore(history=history)
+        try:
+            self.assertEqual(len(store), 0)
+            self.assertEqual(contents(store.get("user_id")), ["Hello", "Hi!"])
+            self.assertIn("user_id", store)
+
+            store.append("user_id", message("Again"))
+            self.assertEqual(store.get("user_id")[-1]["seq"], 2)
+            store.remove("user_id")
+            # Evicted conversations come back from disk with the new turn
+            self.assertEqual(contents(store.get("user_id")), ["Hello", "Hi!", "Again"])
+        finally:
+            store.close()
+
+if __name__ == '__main__':
+    unittest.main()
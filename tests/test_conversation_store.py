@@ -0,0 +1,89 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.conversation_store import ConversationStore, message_size
+
+def message(content, role="user"):
+    return {"role": role, "content": content}
+
+class TestConversationStore(unittest.TestCase):
+
+    def test_get_returns_copy(self):
+        store = ConversationStore()
+        store.append("user_id", message("Hello"))
+
+        history = store.get("user_id")
+        history.append(message("not stored"))
+
+        self.assertEqual([msg["content"] for msg in store.get("user_id")], ["Hello"])
+        self.assertEqual(store.get("unknown"), [])
+
+    def test_trims_to_max_messages(self):
+        store = ConversationStore(max_messages=3)
+        for n in range(5):
+            store.append("user_id", message(str(n)))
+
+        self.assertEqual([msg["content"] for msg in store.get("user_id")], ["2", "3", "4"])
+        self.assertEqual(store.stats()['bytes'], 3 * message_size(message("0")))
+
+    def test_evicts_least_recently_used(self):
+        store = ConversationStore(max_conversations=2)
+        store.append("a", message("Hello"))
+        store.append("b", message("Hello"))
+        store.get("a")  # "b" is now the least recently used
+        store.append("c", message("Hello"))
+
+        self.assertIn("a", store)
+        self.assertNotIn("b", store)
+        self.assertEqual(store.stats()['evictions']['lru'], 1)
+
+    def test_evicts_over_byte_cap(self):
+        size = message_size(message("x" * 100))
+        store = ConversationStore(max_bytes=2 * size)
+        store.append("a", message("x" * 100))
+        store.append("b", message("x" * 100))
+        store.append("c", message("x" * 100))
+
+        self.assertEqual(len(store), 2)
+        self.assertNotIn("a", store)
+        stats = store.stats()
+        self.assertEqual(stats['bytes'], 2 * size)
+        self.assertEqual(stats['evictions']['bytes'], 1)
+
+    def test_evicts_idle_conversations(self):
+        store = ConversationStore(idle_ttl=60)
+        with patch('src.conversation_store.time.monotonic', return_value=1000):
+            store.append("a", message("Hello"))
+        with patch('src.conversation_store.time.monotonic', return_value=1030):
+            store.append("b", message("Hello"))
+        with patch('src.conversation_store.time.monotonic', return_value=1070):
+            self.assertEqual(store.get("a"), [])
+            self.assertEqual(len(store.get("b")), 1)
+
+        stats = store.stats()
+        self.assertEqual(stats['entries'], 1)
+        self.assertEqual(stats['evictions']['idle'], 1)
+
+    def test_compact_replaces_messages_with_summary(self):
+        store = ConversationStore()
+        for n in range(5):
+            store.append("user_id", message(str(n)))
+        summary = message("Summary", role="system")
+        store.compact("user_id", summary, 2)
+
+        summary_message, history = store.get_conversation("user_id")
+        self.assertIs(summary_message, summary)
+        self.assertEqual([(msg["seq"], msg["content"]) for msg in history], [(3, "3"), (4, "4")])
+        self.assertEqual(store.stats()['bytes'], message_size(summary) + 2 * message_size(message("0")))
+
+        # New messages keep counting from the last sequence number
+        store.append("user_id", message("5"))
+        self.assertEqual(store.get("user_id")[-1]["seq"], 5)
+
+if __name__ == '__main__':
+    unittest.main()
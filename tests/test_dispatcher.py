@@ -0,0 +1,129 @@
+import unittest
+import asyncio
+import threading
+import time
+import sys
+import os
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.dispatcher import EventDispatcher, AsyncEventDispatcher
+
+class TestEventDispatcher(unittest.TestCase):
+
+    def test_same_key_runs_in_order(self):
+        handled = []
+
+        def handler(event):
+            time.sleep(0.01)
+            handled.append(event['n'])
+
+        dispatcher = EventDispatcher(handler, lambda event: event['key'], num_workers=4)
+        dispatcher.start()
+        for n in range(10):
+            dispatcher.dispatch({'key': 'channel_id', 'n': n})
+        dispatcher.stop(timeout=5)
+
+        self.assertEqual(handled, list(range(10)))
+
+    def test_different_keys_run_in_parallel(self):
+        barrier = threading.Barrier(2, timeout=2)
+        results = []
+
+        def handler(event):
+            # Both events must be inside the handler at once to pass the barrier
+            barrier.wait()
+            results.append(event['key'])
+
+        dispatcher = EventDispatcher(handler, lambda event: event['key'], num_workers=2)
+        dispatcher.start()
+        dispatcher.dispatch({'key': 'channel_a'})
+        dispatcher.dispatch({'key': 'channel_b'})
+        dispatcher.stop(timeout=5)
+
+        self.assertCountEqual(results, ['channel_a', 'channel_b'])
+
+    def test_drops_events_when_queue_is_full(self):
+        release = threading.Event()
+        dispatcher = EventDispatcher(lambda event: release.wait(2), lambda event: 'key', num_workers=1, max_queue_size=2)
+        dispatcher.start()
+
+        self.assertTrue(dispatcher.dispatch({}))
+        self.assertTrue(dispatcher.dispatch({}))
+        self.assertFalse(dispatcher.dispatch({}))
+
+        release.set()
+        dispatcher.stop(timeout=5)
+        self.assertEqual(dispatcher.queue_size(), 0)
+
+    def test_handler_errors_do_not_stop_workers(self):
+        handled = []
+
+        def handler(event):
+            if event == 'bad':
+                raise RuntimeError("boom")
+            handled.append(event)
+
+        dispatcher = EventDispatcher(handler, lambda event: 'key', num_workers=1)
+        dispatcher.start()
+        dispatcher.dispatch('bad')
+        dispatcher.dispatch('good')
+        dispatcher.stop(timeout=5)
+
+        self.assertEqual(handled, ['good'])
+
+    def test_stop_is_bounded_by_the_timeout(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+        dispatcher = EventDispatcher(lambda event: release.wait(10), lambda event: event, num_workers=3)
+        dispatcher.start()
+        for key in ('a', 'b', 'c'):
+            dispatcher.dispatch(key)
+
+        started = time.monotonic()
+        dispatcher.stop(timeout=0.3)
+        # The drain and the joins of all the workers share the timeout
+        self.assertLess(time.monotonic() - started, 0.6)
+
+    def test_dispatch_before_start_is_dropped(self):
+        dispatcher = EventDispatcher(lambda event: None, lambda event: 'key')
+        self.assertFalse(dispatcher.dispatch({}))
+
+class TestAsyncEventDispatcher(unittest.IsolatedAsyncioTestCase):
+
+    async def test_same_key_runs_in_order(self):
+        handled = []
+
+        async def handler(event):
+            # Later events sleep less, so only the per-key chaining keeps them in order
+            await asyncio.sleep(0.01 * (5 - event['n']))
+            handled.append(event['n'])
+
+        dispatcher = AsyncEventDispatcher(handler, lambda event: event['key'])
+        for n in range(5):
+            dispatcher.dispatch({'key': 'channel_id', 'n': n})
+        await dispatcher.stop(timeout=5)
+
+        self.assertEqual(handled, list(range(5)))
+
+    async def test_different_keys_run_concurrently(self):
+        started = []
+        release = asyncio.Event()
+
+        async def handler(event):
+            started.append(event['key'])
+            await release.wait()
+
+        dispatcher = AsyncEventDispatcher(handler, lambda event: event['key'], max_concurrency=2)
+        dispatcher.dispatch({'key': 'channel_a'})
+        dispatcher.dispatch({'key': 'channel_b'})
+        await asyncio.sleep(0.01)
+
+        self.assertCountEqual(started, ['channel_a', 'channel_b'])
+        release.set()
+        await dispatcher.stop(timeout=5)
+        self.assertEqual(dispatcher.queue_size(), 0)
+
+if __name__ == '__main__':
+    unittest.main()
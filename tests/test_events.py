@@ -0,0 +1,88 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import sys
+import os
+import json
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import src.events as events_module
+from src.events import wanted_frame, event_post, Post
+from src.mattermost_client import MattermostClient
+
+def frame(event, post=None, separators=(',', ':'), **data):
+    """
+    Encodes an event the way the Mattermost server does: event type first,
+    the post as a nested JSON string.
+    """
+    if post is not None:
+        data['post'] = json.dumps(post, separators=separators)
+    return json.dumps({'event': event, 'data': data, 'broadcast': {}, 'seq': 1}, separators=separators)
+
+class TestWantedFrame(unittest.TestCase):
+
+    def test_uninteresting_events_are_dropped(self):
+        self.assertFalse(wanted_frame(frame('typing', user_id='user_1')))
+        self.assertFalse(wanted_frame(frame('status_change', status='online')))
+        self.assertFalse(wanted_frame(frame('reaction_added', reaction='{"emoji_name":"+1"}')))
+        self.assertTrue(wanted_frame(frame('hello')))
+        self.assertTrue(wanted_frame(frame('user_updated', user={'id': 'user_1'})))
+        # Replies to client actions have no event type
+        self.assertTrue(wanted_frame('{"status":"OK","seq_reply":1}'))
+
+    def test_posts_of_the_bot_are_dropped(self):
+        for separators in ((',', ':'), (', ', ': ')):
+            bot_post = frame('posted', {'id': 'p1', 'user_id': 'bot', 'message': 'Hi'}, separators)
+            user_post = frame('posted', {'id': 'p2', 'user_id': 'user_1', 'message': 'Hi'}, separators)
+            self.assertFalse(wanted_frame(bot_post, 'bot'))
+            self.assertTrue(wanted_frame(bot_post))
+            self.assertTrue(wanted_frame(user_post, 'bot'))
+
+    def test_text_quoting_the_bot_is_not_mistaken_for_its_post(self):
+        message = '{"event":"typing","user_id":"bot"}'
+        user_post = frame('posted', {'id': 'p1', 'message': message, 'user_id': 'user_1'})
+        self.assertTrue(wanted_frame(user_post, 'bot'))
+
+class TestEventPost(unittest.TestCase):
+
+    def test_post_is_decoded_once(self):
+        event_data = json.loads(frame('posted', {'id': 'p1', 'channel_id': 'c1', 'user_id': 'u1', 'message': 'Hi'}))
+        loads = MagicMock(wraps=json.loads)
+        with patch.object(events_module.json, 'loads', loads):
+            post = event_post(event_data)
+            self.assertIs(event_post(event_data), post)
+        self.assertEqual(loads.call_count, 1)
+        self.assertIsInstance(post, Post)
+        self.assertEqual((post.id, post.channel_id, post.user_id, post.message), ('p1', 'c1', 'u1', 'Hi'))
+        self.assertEqual(post.file_ids, [])
+        self.assertEqual(post.root_id, '')
+        self.assertFalse(hasattr(post, '__dict__'))
+
+    def test_events_without_a_valid_post(self):
+        self.assertIsNone(event_post({'event': 'typing'}))
+        self.assertIsNone(event_post({'event': 'posted', 'data': {'post': 'not json'}}))
+        self.assertIsNone(event_post({'event': 'posted', 'data': {'post': '[]'}}))
+
+class TestWebSocketPrefilter(unittest.TestCase):
+
+    def test_only_wanted_frames_reach_the_listeners(self):
+        client = MattermostClient()
+        client.bot_id = 'bot'
+        received = []
+        client.add_message_listener(received.append)
+        ws_client = client.ws_client
+        ws_client.add_message_listener(client.handle_websocket_event)
+
+        decode = MagicMock(wraps=json.loads)
+        with patch('src.mattermost_client.json.loads', decode):
+            ws_client.on_message(None, frame('typing', user_id='user_1'))
+            ws_client.on_message(None, frame('posted', {'id': 'p1', 'user_id': 'bot', 'message': 'Answer'}))
+            ws_client.on_message(None, frame('posted', {'id': 'p2', 'user_id': 'user_1', 'message': 'Question'}))
+
+        # The wanted frame and its post, once each
+        self.assertEqual(decode.call_count, 2)
+        self.assertEqual([event_post(event).id for event in received], ['p2'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import sys
+import os
+import email
+import socket
+import threading
+import requests
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import src.mattermost_client as mattermost_client_module
+from src.mattermost_client import MattermostClient, get_http_session, create_http_session
+from src.multipart import encode_form, PartsReader
+
+class TestHttpSession(unittest.TestCase):
+
+    def test_clients_share_one_session(self):
+        first = MattermostClient()
+        second = MattermostClient()
+        self.assertIs(first.session, second.session)
+        self.assertIs(first.session, get_http_session())
+
+    def test_session_pool_and_retries(self):
+        with patch.object(mattermost_client_module, 'MATTERMOST_POOL_SIZE', 7), \
+             patch.object(mattermost_client_module, 'MATTERMOST_MAX_RETRIES', 2):
+            session = create_http_session()
+
+        adapter = session.get_adapter('https://mattermost.example.com')
+        self.assertEqual(adapter._pool_maxsize, 7)
+        self.assertEqual(adapter.max_retries.total, 2)
+        # Posts are not idempotent and must not be replayed by the transport
+        self.assertNotIn('POST', adapter.max_retries.allowed_methods)
+
+    def test_requests_use_session_with_timeout(self):
+        client = MattermostClient()
+        client.session = MagicMock()
+        client.session.post.return_value.status_code = 201
+        client.session.post.return_value.json.return_value = {'id': 'post_id'}
+
+        result = client.post_message('channel_id', 'Hello')
+
+        self.assertEqual(result, {'id': 'post_id'})
+        _, kwargs = client.session.post.call_args
+        self.assertEqual(kwargs['timeout'], client.timeout)
+        pending_post_id = kwargs['json'].pop('pending_post_id')
+        self.assertTrue(pending_post_id)
+        self.assertEqual(kwargs['json'], {'channel_id': 'channel_id', 'message': 'Hello'})
+
+    def test_upload_streams_sends_streamed_multipart_body(self):
+        client = MattermostClient()
+        client.session = MagicMock()
+        sent = {}
+        def post(url, headers, data, timeout):
+            # Consume the body the way the transport would, one block at a time
+            sent['headers'] = headers
+            sent['length'] = len(data)
+            sent['pieces'] = list(iter(lambda: data.read(4), b''))
+            response = MagicMock(status_code=201)
+            response.json.return_value = {'file_infos': [{'id': 'file_1'}, {'id': 'file_2'}]}
+            return response
+        client.session.post.side_effect = post
+
+        file_ids = client.upload_streams('channel_id', [
+            ('first.png', iter([b'abc', b'def']), 'image/png', 6),
+            ('second.png', iter([b'xyz']), 'image/png', 3),
+        ])
+
+        self.assertEqual(file_ids, ['file_1', 'file_2'])
+        self.assertGreater(len(sent['pieces']), 1)
+        body = b''.join(sent['pieces'])
+        self.assertEqual(sent['length'], len(body))
+        message = email.message_from_bytes(
+            b'Content-Type: ' + sent['headers']['Content-Type'].encode() + b'\r\n\r\n' + body
+        )
+        parts = [(part.get_param('name', header='content-disposition'), part.get_filename(), part.get_payload(decode=True))
+                 for part in message.get_payload()]
+        self.assertEqual(parts, [
+            ('channel_id', None, b'channel_id'),
+            ('files', 'first.png', b'abcdef'),
+            ('files', 'second.png', b'xyz'),
+        ])
+
+    def test_upload_streams_request_on_the_wire(self):
+        """
+        A body of known length goes out with Content-Length only, and one of
+        unknown length with chunked transfer encoding only.
+        """
+        server = socket.socket()
+        server.bind(('127.0.0.1', 0))
+        server.listen(2)
+        self.addCleanup(server.close)
+        requests_seen = []
+
+        def serve():
+            for _ in range(2):
+                connection, _ = server.accept()
+                with connection:
+                    data = b''
+                    while b'\r\n\r\n' not in data:
+                        data += connection.recv(65536)
+                    head, body = data.split(b'\r\n\r\n', 1)
+                    headers = dict(line.split(b': ', 1) for line in head.split(b'\r\n')[1:])
+                    if b'Content-Length' in headers:
+                        while len(body) < int(headers[b'Content-Length']):
+                            body += connection.recv(65536)
+                    else:
+                        while not body.endswith(b'0\r\n\r\n'):
+                            body += connection.recv(65536)
+                    requests_seen.append((headers, body))
+                    reply = b'{"file_infos": [{"id": "file_1"}]}'
+                    connection.sendall(b'HTTP/1.1 201 Created\r\nContent-Type: application/json\r\n'
+                                       b'Connection: close\r\nContent-Length: ' + str(len(reply)).encode() + b'\r\n\r\n' + reply)
+
+        thread = threading.Thread(target=serve, daemon=True)
+        thread.start()
+        client = MattermostClient()
+        client.url = f"http://127.0.0.1:{server.getsockname()[1]}"
+        client.session = requests.Session()
+
+        self.assertEqual(client.upload_streams('channel_id', [('a.png', iter([b'abc', b'def']), 'image/png', 6)]), ['file_1'])
+        self.assertEqual(client.upload_streams('channel_id', [('a.png', iter([b'abc', b'def']), 'image/png', None)]), ['file_1'])
+        thread.join(5)
+
+        (sized_headers, sized_body), (chunked_headers, chunked_body) = requests_seen
+        self.assertNotIn(b'Transfer-Encoding', sized_headers)
+        self.assertEqual(int(sized_headers[b'Content-Length']), len(sized_body))
+        self.assertIn(b'\r\n\r\nabcdef\r\n', sized_body)
+        self.assertEqual(chunked_headers.get(b'Transfer-Encoding'), b'chunked')
+        self.assertNotIn(b'Content-Length', chunked_headers)
+
+    def test_parts_reader_sets_the_prepared_request_length(self):
+        content_type, parts, length = encode_form([('channel_id', 'c')], [('files', 'a', iter([b'ab', b'cd']), None, 4)])
+        request = requests.Request('POST', 'http://localhost/api/v4/files', data=PartsReader(parts, length)).prepare()
+        self.assertEqual(request.headers['Content-Length'], str(length))
+        self.assertNotIn('Transfer-Encoding', request.headers)
+        self.assertEqual(len(request.body.read()), length)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,5 @@
 import unittest
+import tempfile
 from unittest.mock import patch, MagicMock
 import sys
 import os
@@ -8,10 +9,19 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')
 
 from src.plugins.image_plugin import ImagePlugin
 import src.plugins.image_plugin as image_plugin_module
+from src.openai_client import join_image_batches
 
 class TestImagePlugin(unittest.TestCase):
 
-    @patch('src.plugins.image_plugin.dalle_generate_image')
+    def setUp(self):
+        # Keep the image cache of each test in its own directory
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        patcher = patch.object(image_plugin_module, 'TEMP_DIR', self.temp_dir.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @patch('src.plugins.image_plugin.dalle_generate_images')
     @patch('src.plugins.image_plugin.MattermostClient')
     def test_execute_default_service(self, mock_mm_client, mock_dalle):
         # Patch IMAGE_SERVICE before initializing the plugin
@@ -20,27 +30,22 @@ class TestImagePlugin(unittest.TestCase):
             plugin = ImagePlugin()
 
             # Use a simple valid Base64 string
-            mock_dalle.return_value = "aGVsbG8="  # Base64 for 'hello'
+            mock_dalle.return_value = ["aGVsbG8="]  # Base64 for 'hello'
             mock_mm_client_instance = mock_mm_client.return_value
-            mock_mm_client_instance.upload_file.return_value = "file_id"
-            mock_mm_client_instance.post_message.return_value = None  # Assuming post_message returns None
+            mock_mm_client_instance.upload_files.return_value = ["file_id"]
 
             # Call the execute method
             result = plugin.execute(["test image"], "channel_id", "user_id")
 
             # Assertions to check that the functions were called as expected
-            mock_dalle.assert_called_once_with("test image")
-            mock_mm_client_instance.upload_file.assert_called_once_with(
-                "channel_id",
-                b'hello',  # Decoded bytes
-                "generated_image_dalle.png"
-            )
-            mock_mm_client_instance.post_message.assert_called_once_with(
+            mock_dalle.assert_called_once_with("test image", 1, "1024x1024", "hd")
+            mock_mm_client_instance.upload_files.assert_called_once_with(
                 "channel_id",
-                "Here's the image generated by dalle based on: 'test image'",
-                file_ids=["file_id"]
+                [("generated_image_dalle.png", b'hello', 'image/png')]  # Decoded bytes
             )
-            self.assertIsNone(result)
+            # The reply is posted by the bot service, through its outbox
+            mock_mm_client_instance.post_message.assert_not_called()
+            self.assertEqual(result, ("Here's the image generated by dalle based on: 'test image'", ["file_id"]))
 
     def test_execute_unknown_service(self):
         plugin = ImagePlugin()
@@ -52,5 +57,132 @@ class TestImagePlugin(unittest.TestCase):
         result = plugin.execute([], "channel_id", "user_id")
         self.assertIn("Please provide a description for the image", result)
 
+    @patch('src.plugins.image_plugin.dalle_generate_images')
+    @patch('src.plugins.image_plugin.MattermostClient')
+    def test_repeat_prompt_uses_cached_image(self, mock_mm_client, mock_dalle):
+        mock_dalle.return_value = ["aGVsbG8="]  # Base64 for 'hello'
+        mock_mm_client.return_value.upload_files.return_value = ["file_id"]
+
+        plugin = ImagePlugin()
+        plugin.execute(["--service", "dalle", "test  image"], "channel_1", "user_id")
+        # A new plugin instance reads the cache back from disk
+        plugin = ImagePlugin()
+        result = plugin.execute(["--service", "dalle", "test image"], "channel_2", "user_id")
+
+        mock_dalle.assert_called_once()
+        mock_mm_client.return_value.upload_files.assert_called_with(
+            "channel_2", [("generated_image_dalle.png", b'hello', 'image/png')]
+        )
+        self.assertEqual(result[1], ["file_id"])
+
+    @patch('src.plugins.image_plugin.dalle_generate_images')
+    @patch('src.plugins.image_plugin.MattermostClient')
+    def test_failed_generation_is_not_cached(self, mock_mm_client, mock_dalle):
+        mock_dalle.side_effect = [[], ["aGVsbG8="]]
+        mock_mm_client.return_value.upload_files.return_value = ["file_id"]
+
+        plugin = ImagePlugin()
+        self.assertIn("Failed to generate the image", plugin.execute(["test image"], "channel_id", "user_id"))
+        self.assertEqual(plugin.execute(["test image"], "channel_id", "user_id")[1], ["file_id"])
+        self.assertEqual(mock_dalle.call_count, 2)
+
+    @patch('src.plugins.image_plugin.dalle_generate_images')
+    @patch('src.plugins.image_plugin.MattermostClient')
+    def test_variants_are_uploaded_and_posted_together(self, mock_mm_client, mock_dalle):
+        mock_dalle.side_effect = lambda prompt, n, size, quality: ["aGVsbG8="] * n  # Base64 for 'hello'
+        mock_mm_client_instance = mock_mm_client.return_value
+        mock_mm_client_instance.upload_files.return_value = ["file_1", "file_2", "file_3"]
+
+        plugin = ImagePlugin()
+        # The first variant is already cached from an earlier single image
+        plugin.cache_image("dalle", "test image", {'size': "1792x1024", 'quality': "standard"}, 0, b'cached')
+        result = plugin.execute(
+            ["--n", "3", "test", "--size", "1792x1024", "image", "--quality", "standard", "--service", "dalle"],
+            "channel_id", "user_id"
+        )
+
+        mock_dalle.assert_called_once_with("test image", 2, "1792x1024", "standard")
+        mock_mm_client_instance.upload_files.assert_called_once_with("channel_id", [
+            ("generated_image_dalle_1.png", b'cached', 'image/png'),
+            ("generated_image_dalle_2.png", b'hello', 'image/png'),
+            ("generated_image_dalle_3.png", b'hello', 'image/png'),
+        ])
+        self.assertEqual(result, (
+            "Here are 3 images generated by dalle based on: 'test image'", ["file_1", "file_2", "file_3"]
+        ))
+
+    @patch('src.plugins.image_plugin.dalle_generate_images')
+    @patch('src.plugins.image_plugin.MattermostClient')
+    def test_failed_variant_keeps_the_others_in_place(self, mock_mm_client, mock_dalle):
+        # The second of three variants failed
+        mock_dalle.return_value = ["Zmlyc3Q=", None, "dGhpcmQ="]  # Base64 for 'first' and 'third'
+        mock_mm_client.return_value.upload_files.return_value = ["file_1", "file_3"]
+        options = {'n': 3, 'size': "1024x1024", 'quality': "hd"}
+
+        plugin = ImagePlugin()
+        result = plugin.execute(["--n", "3", "test image"], "channel_id", "user_id")
+
+        self.assertEqual(result[1], ["file_1", "file_3"])
+        self.assertEqual(plugin.get_cached_images("dalle", "test image", options), [b'first', None, b'third'])
+        mock_mm_client.return_value.upload_files.assert_called_once_with("channel_id", [
+            ("generated_image_dalle_1.png", b'first', 'image/png'),
+            ("generated_image_dalle_2.png", b'third', 'image/png'),
+        ])
+
+    def test_failed_image_requests_keep_their_slots(self):
+        self.assertEqual(
+            join_image_batches([2, 2, 1], [["a", "b"], None, ["e"]]),
+            ["a", "b", None, None, "e"]
+        )
+        # A request that returned fewer images than asked
+        self.assertEqual(join_image_batches([2, 1], [["a"], ["c"]]), ["a", None, "c"])
+
+    @patch('src.plugins.image_plugin.dalle_generate_images')
+    @patch('src.plugins.image_plugin.MattermostClient')
+    def test_url_images_are_streamed_into_the_upload(self, mock_mm_client, mock_dalle):
+        mock_dalle.return_value = ["https://images.example.com/1.png"]
+        mock_mm_client_instance = mock_mm_client.return_value
+        download = mock_mm_client_instance.session.get.return_value.__enter__.return_value
+        download.headers = {'Content-Length': '5'}
+        download.iter_content.return_value = iter([b'he', b'llo'])
+        mock_mm_client_instance.upload_streams.return_value = ["file_id"]
+
+        with patch.object(image_plugin_module, 'IMAGE_RESPONSE_FORMAT', 'url'):
+            plugin = ImagePlugin()
+            result = plugin.execute(["test image"], "channel_id", "user_id")
+
+        mock_dalle.assert_called_once_with("test image", 1, "1024x1024", "hd", response_format="url")
+        mock_mm_client_instance.session.get.assert_called_once_with(
+            "https://images.example.com/1.png", stream=True, timeout=mock_mm_client_instance.timeout
+        )
+        # The download's chunks go straight into the upload, without being joined here
+        mock_mm_client_instance.upload_streams.assert_called_once_with(
+            "channel_id", [("generated_image_dalle.png", download.iter_content.return_value, 'image/png', 5)]
+        )
+        mock_mm_client_instance.upload_files.assert_not_called()
+        self.assertEqual(result, ("Here's the image generated by dalle based on: 'test image'", ["file_id"]))
+
+    @patch('src.plugins.image_plugin.dalle_generate_images')
+    @patch('src.plugins.image_plugin.MattermostClient')
+    def test_failed_download_is_logged(self, mock_mm_client, mock_dalle):
+        mock_dalle.return_value = ["https://images.example.com/1.png"]
+        mm_client = MagicMock()
+        mm_client.session.get.side_effect = ConnectionError("unreachable")
+
+        plugin = ImagePlugin()
+        with self.assertLogs('src.plugins.image_plugin', level='ERROR') as logs:
+            uploaded = plugin.upload_images(mm_client, "channel_id", "dalle", mock_dalle.return_value)
+
+        self.assertIsNone(uploaded)
+        self.assertIn("Failed to download the generated image: unreachable", logs.output[0])
+        mm_client.upload_streams.assert_not_called()
+
+    def test_invalid_options(self):
+        plugin = ImagePlugin()
+        self.assertIn("from 1 to", plugin.execute(["--n", "0", "test"], "channel_id", "user_id"))
+        self.assertIn("Unknown size: 10x10", plugin.execute(["--size", "10x10", "test"], "channel_id", "user_id"))
+        self.assertIn("Unknown quality: best", plugin.execute(["test", "--quality", "best"], "channel_id", "user_id"))
+        self.assertIn("Please specify a value after --n", plugin.execute(["test", "--n"], "channel_id", "user_id"))
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,121 @@
+import unittest
+from unittest.mock import patch, MagicMock, AsyncMock
+import sys
+import os
+import asyncio
+import json
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.metadata_cache import MetadataCache
+import src.mattermost_client as mattermost_client_module
+import src.async_mattermost_client as async_mattermost_client_module
+from src.mattermost_client import MattermostClient
+from src.async_mattermost_client import AsyncMattermostClient, RestResponse
+
+TTLS = {'me': 300, 'user': 300, 'direct_channel': 3600, 'file_info': 3600}
+
+class TestMetadataCache(unittest.TestCase):
+
+    def test_values_are_loaded_once_and_failures_are_not_cached(self):
+        cache = MetadataCache(TTLS)
+        load = MagicMock(side_effect=[None, {'id': 'user_1'}])
+
+        self.assertIsNone(cache.get_or_load('user', 'user_1', load))
+        self.assertEqual(cache.get_or_load('user', 'user_1', load), {'id': 'user_1'})
+        self.assertEqual(cache.get_or_load('user', 'user_1', load), {'id': 'user_1'})
+        self.assertEqual(load.call_count, 2)
+
+    def test_kinds_with_ttl_0_are_not_cached(self):
+        cache = MetadataCache(dict(TTLS, user=0))
+        load = MagicMock(return_value={'id': 'user_1'})
+        cache.get_or_load('user', 'user_1', load)
+        cache.get_or_load('user', 'user_1', load)
+        self.assertEqual(load.call_count, 2)
+        self.assertNotIn('user', cache.stats())
+
+    def test_events_invalidate_entries(self):
+        cache = MetadataCache(TTLS)
+        cache.get_or_load('me', 'token', lambda: {'id': 'bot'})
+        cache.get_or_load('user', 'user_1', lambda: {'id': 'user_1'})
+        cache.get_or_load('user', 'user_2', lambda: {'id': 'user_2'})
+        cache.get_or_load('direct_channel', 'user_1', lambda: 'channel_1')
+        cache.get_or_load('direct_channel', 'user_2', lambda: 'channel_2')
+        cache.get_or_load('file_info', 'file_1', lambda: {'id': 'file_1'})
+
+        cache.handle_event({'event': 'user_updated', 'data': {'user': {'id': 'user_1'}}})
+        cache.handle_event({'event': 'user_updated', 'data': {'user': {'id': 'bot'}}})
+        cache.handle_event({'event': 'channel_updated', 'data': {'channel': json.dumps({'id': 'channel_1'})}})
+        cache.handle_event({'event': 'post_deleted', 'data': {'post': json.dumps({'id': 'post', 'file_ids': ['file_1']})}})
+
+        stats = cache.stats()
+        self.assertEqual(stats['me']['entries'], 0)
+        self.assertEqual(stats['user']['entries'], 1)
+        self.assertEqual(stats['direct_channel']['entries'], 1)
+        self.assertEqual(stats['file_info']['entries'], 0)
+
+        cache.handle_event({'event': 'channel_deleted', 'data': {'channel_id': 'channel_2'}})
+        cache.handle_event({'event': 'hello', 'data': {}})
+        stats = cache.stats()
+        self.assertEqual(stats['direct_channel']['entries'], 0)
+        self.assertEqual(stats['user']['entries'], 0)
+
+    def test_malformed_events_are_ignored(self):
+        cache = MetadataCache(TTLS)
+        cache.handle_event({'event': 'channel_updated', 'data': {'channel': 'not json'}})
+        cache.handle_event({'event': 'post_deleted', 'data': None})
+
+class TestClientMetadataCache(unittest.TestCase):
+
+    def setUp(self):
+        for module in (mattermost_client_module, async_mattermost_client_module):
+            patcher = patch.object(module, 'metadata_cache', MetadataCache(TTLS))
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def response(self, status, body):
+        response = MagicMock(status_code=status, headers={})
+        response.json.return_value = body
+        return response
+
+    def test_lookups_hit_the_server_once(self):
+        client = MattermostClient()
+        client.session = MagicMock()
+        bodies = {
+            '/api/v4/users/me': {'id': 'me'},
+            '/api/v4/users/user_1': {'id': 'user_1'},
+            '/api/v4/files/file_1/info': {'id': 'file_1'},
+        }
+        client.session.get.side_effect = lambda url, **kwargs: self.response(200, bodies[url[len(client.url):]])
+        client.session.post.return_value = self.response(201, {'id': 'dm_channel'})
+
+        for _ in range(3):
+            self.assertEqual(client.get_me(), {'id': 'me'})
+            self.assertEqual(client.get_user('user_1'), {'id': 'user_1'})
+            self.assertEqual(client.get_file_info('file_1'), {'id': 'file_1'})
+            self.assertEqual(client.get_direct_channel_id('user_1'), 'dm_channel')
+
+        self.assertEqual(client.session.get.call_count, 3)
+        self.assertEqual(client.session.post.call_count, 1)
+
+        # An update from the WebSocket makes the next lookup go to the server
+        client.handle_websocket_event({'event': 'user_updated', 'data': {'user': {'id': 'user_1'}}})
+        client.get_user('user_1')
+        self.assertEqual(client.session.get.call_count, 4)
+
+    def test_async_lookups_hit_the_server_once(self):
+        client = AsyncMattermostClient()
+        client.request = AsyncMock(return_value=RestResponse(200, {}, {'id': 'user_1'}))
+
+        async def run():
+            for _ in range(3):
+                await client.get_user('user_1')
+            await client.handle_websocket_event({'event': 'hello', 'data': {}})
+            await client.get_user('user_1')
+
+        asyncio.run(run())
+        self.assertEqual(client.request.await_count, 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,155 @@
+import unittest
+from unittest.mock import patch, MagicMock, AsyncMock
+import sys
+import os
+import asyncio
+import json
+import tempfile
+import threading
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.outbox import Outbox, AsyncOutbox, outbound_post
+from src.resilience import Resilience, RequestRejected
+import src.mattermost_client as mattermost_client_module
+from src.mattermost_client import MattermostClient
+
+class TestOutbox(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.dead_letter_path = os.path.join(self.temp_dir.name, 'dead_letters.jsonl')
+        self.mm_client = MagicMock()
+
+    def create_outbox(self, cls=Outbox, **options):
+        options.setdefault('retry_delay', 0)
+        options.setdefault('posts_per_second', 0)
+        return cls(self.mm_client, dead_letter_path=self.dead_letter_path, **options)
+
+    def test_posts_are_delivered_in_order_per_channel(self):
+        delivered = []
+        lock = threading.Lock()
+        def post_message(channel_id, message, **kwargs):
+            with lock:
+                delivered.append((channel_id, message))
+            return {'id': message}
+        self.mm_client.post_message.side_effect = post_message
+
+        outbox = self.create_outbox(num_workers=4)
+        outbox.start()
+        for i in range(20):
+            self.assertTrue(outbox.post(f"channel_{i % 2}", str(i)))
+        outbox.stop()
+
+        for channel in ("channel_0", "channel_1"):
+            messages = [int(message) for channel_id, message in delivered if channel_id == channel]
+            self.assertEqual(messages, sorted(messages))
+            self.assertEqual(len(messages), 10)
+        self.assertEqual(outbox.stats()['delivered'], 20)
+
+    def test_failed_posts_are_retried_with_the_same_pending_post_id(self):
+        self.mm_client.post_message.side_effect = [None, ConnectionError("reset"), {'id': 'post_id'}]
+        outbox = self.create_outbox()
+        outbox.start()
+        outbox.post('channel_id', 'Hello', root_id='root_id')
+        outbox.stop()
+
+        calls = self.mm_client.post_message.call_args_list
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(len({call.kwargs['pending_post_id'] for call in calls}), 1)
+        self.assertEqual(calls[0].kwargs['root_id'], 'root_id')
+        self.assertEqual(outbox.stats(), {'queued': 0, 'delivered': 1, 'retried': 2, 'dead_lettered': 0})
+        self.assertFalse(os.path.exists(self.dead_letter_path))
+
+    def test_posts_that_keep_failing_are_dead_lettered(self):
+        self.mm_client.post_message.return_value = None
+        outbox = self.create_outbox(max_attempts=2)
+        outbox.start()
+        outbox.post('channel_id', 'Lost answer')
+        outbox.stop()
+
+        with open(self.dead_letter_path, encoding='utf-8') as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0]['channel_id'], 'channel_id')
+        self.assertEqual(records[0]['message'], 'Lost answer')
+        self.assertEqual(records[0]['attempts'], 2)
+        self.assertEqual(outbox.stats()['dead_lettered'], 1)
+
+    def test_refused_posts_are_dead_lettered_without_retrying(self):
+        self.mm_client.post_message.side_effect = RequestRejected("Mattermost", 403, "channel is archived")
+        outbox = self.create_outbox(retry_delay=60)
+        outbox.start()
+        outbox.post('channel_id', 'Too late')
+        outbox.stop()
+
+        self.mm_client.post_message.assert_called_once()
+        self.assertFalse(self.mm_client.post_message.call_args.kwargs['retry'])
+        self.assertEqual(outbox.stats()['retried'], 0)
+        with open(self.dead_letter_path, encoding='utf-8') as f:
+            record = json.loads(f.readline())
+        self.assertEqual(record['attempts'], 1)
+        self.assertIn('403', record['error'])
+
+    def test_retries_wait_as_long_as_mattermost_asks(self):
+        self.mm_client.post_message.side_effect = [RequestRejected("Mattermost", 429, "slow down", 7), {'id': 'post_id'}]
+        outbox = self.create_outbox(retry_delay=1)
+        with patch('src.outbox.time.sleep') as sleep:
+            self.assertEqual(outbox.deliver(outbound_post('channel_id', 'Hello')), {'id': 'post_id'})
+        sleep.assert_called_once_with(7)
+
+    def test_client_sends_each_outbox_attempt_once(self):
+        patcher = patch.object(mattermost_client_module, 'resilience', Resilience("Mattermost", max_attempts=3))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        client = MattermostClient()
+        client.session = MagicMock()
+        response = MagicMock(status_code=503, headers={'Retry-After': '3'}, text="unavailable")
+        client.session.post.return_value = response
+        with self.assertRaises(RequestRejected) as raised:
+            client.post_message('channel_id', 'Hello', retry=False, raise_errors=True)
+        self.assertEqual(client.session.post.call_count, 1)
+        self.assertEqual(raised.exception.status, 503)
+        self.assertEqual(raised.exception.retry_after, 3)
+        self.assertTrue(raised.exception.retryable)
+
+    def test_posts_are_sent_right_away_while_not_running(self):
+        outbox = self.create_outbox()
+        self.assertFalse(outbox.post('channel_id', 'Hello'))
+        self.mm_client.post_message.assert_called_once_with('channel_id', 'Hello')
+
+    def test_rate_shaping(self):
+        self.mm_client.post_message.return_value = {'id': 'post_id'}
+        outbox = self.create_outbox(posts_per_second=1000, burst=1)
+        reserve = MagicMock(wraps=outbox.bucket.reserve)
+        outbox.bucket.reserve = reserve
+        outbox.start()
+        for _ in range(3):
+            outbox.post('channel_id', 'Hello')
+        outbox.stop()
+
+        self.assertEqual(reserve.call_count, 3)
+        self.assertEqual(self.mm_client.post_message.call_count, 3)
+
+    def test_async_outbox_retries_and_dead_letters(self):
+        self.mm_client.post_message = AsyncMock(side_effect=[None, {'id': 'post_id'}, None, None])
+        outbox = self.create_outbox(AsyncOutbox, max_attempts=2)
+
+        async def run():
+            outbox.start()
+            self.assertTrue(await outbox.post('channel_id', 'First'))
+            self.assertTrue(await outbox.post('channel_id', 'Second'))
+            await outbox.stop()
+
+        asyncio.run(run())
+        messages = [call.args[1] for call in self.mm_client.post_message.await_args_list]
+        self.assertEqual(messages, ['First', 'First', 'Second', 'Second'])
+        self.assertEqual(outbox.stats()['delivered'], 1)
+        self.assertEqual(outbox.stats()['dead_lettered'], 1)
+        with open(self.dead_letter_path, encoding='utf-8') as f:
+            self.assertEqual(json.loads(f.readline())['message'], 'Second')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -51,5 +51,13 @@ class TestPluginSystem(unittest.TestCase):
         with self.assertRaises(TypeError):
             BasePlugin()
 
+class TestBasePluginAsync(unittest.IsolatedAsyncioTestCase):
+
+    async def test_execute_async_runs_sync_plugin(self):
+        # Sync-only plugins keep working in async mode through an executor
+        plugin = MockPlugin()
+        result = await plugin.execute_async(['arg1'], 'channel_id', 'user_id')
+        self.assertEqual(result, "Executed mock plugin with args: ['arg1']")
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,104 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.rate_limit import TokenBucket, per_minute_bucket
+import src.openai_client as openai_client_module
+from src.openai_client import AdmissionController, AdmissionDenied, request_context
+
+class TestTokenBucket(unittest.TestCase):
+
+    def test_refill_and_debt(self):
+        bucket = TokenBucket(rate=1.0, capacity=2)
+        self.assertEqual(bucket.delay(2, now=bucket.updated_at), 0.0)
+        bucket.take(2, now=bucket.updated_at)
+        start = bucket.updated_at
+
+        # Empty: one token takes a second, and taking it anyway leaves a debt
+        self.assertAlmostEqual(bucket.delay(1, now=start), 1.0)
+        bucket.take(1, now=start)
+        self.assertAlmostEqual(bucket.delay(1, now=start), 2.0)
+        # Refilled over time, but never above the capacity
+        self.assertAlmostEqual(bucket.delay(1, now=start + 1.5), 0.5)
+        self.assertEqual(bucket.delay(2, now=start + 100), 0.0)
+        # Amounts above the capacity wait for a full bucket only
+        self.assertEqual(bucket.delay(50, now=start + 100), 0.0)
+
+    def test_try_take(self):
+        bucket = TokenBucket(rate=1.0, capacity=1)
+        now = bucket.updated_at
+        self.assertTrue(bucket.try_take(now=now))
+        self.assertFalse(bucket.try_take(now=now))
+        self.assertTrue(bucket.try_take(now=now + 1))
+
+    def test_reserve_returns_the_wait_for_its_turn(self):
+        bucket = TokenBucket(rate=2.0, capacity=1)
+        now = bucket.updated_at
+        self.assertEqual(bucket.reserve(now=now), 0.0)
+        self.assertAlmostEqual(bucket.reserve(now=now), 0.5)
+        self.assertAlmostEqual(bucket.reserve(now=now), 1.0)
+
+    def test_per_minute_bucket(self):
+        self.assertIsNone(per_minute_bucket(0))
+        bucket = per_minute_bucket(120)
+        self.assertEqual((bucket.rate, bucket.capacity), (2.0, 120))
+
+class TestAdmissionController(unittest.TestCase):
+
+    def limits(self, **overrides):
+        limits = {'global': (0, 0), 'channel': (0, 0), 'user': (0, 0)}
+        limits.update(overrides)
+        return limits
+
+    def test_user_limit_refuses_only_that_user(self):
+        controller = AdmissionController(self.limits(user=(2, 0)), max_wait=0)
+
+        controller.reserve(user_id="alice", channel_id="town-square")
+        controller.reserve(user_id="alice", channel_id="town-square")
+        with self.assertRaises(AdmissionDenied) as denied:
+            controller.reserve(user_id="alice", channel_id="town-square")
+        self.assertIn("slow down", str(denied.exception))
+        self.assertEqual(controller.reserve(user_id="bob", channel_id="town-square"), 0.0)
+        self.assertEqual(controller.stats(), {'admitted': 3, 'queued': 0, 'denied': 1})
+
+    def test_tokens_are_limited_per_channel(self):
+        controller = AdmissionController(self.limits(channel=(0, 600)), max_wait=0)
+
+        controller.reserve(500, user_id="alice", channel_id="busy")
+        with self.assertRaises(AdmissionDenied):
+            controller.reserve(500, user_id="bob", channel_id="busy")
+        self.assertEqual(controller.reserve(500, user_id="bob", channel_id="quiet"), 0.0)
+
+    def test_requests_over_the_limit_are_queued_up_to_max_wait(self):
+        controller = AdmissionController(self.limits(**{'global': (60, 0)}), max_wait=5)
+        for _ in range(60):
+            controller.reserve()
+
+        # One request per second: the next ones wait their turn, then are refused
+        self.assertAlmostEqual(controller.reserve(), 1.0, places=1)
+        self.assertAlmostEqual(controller.reserve(), 2.0, places=1)
+        for _ in range(3):
+            controller.reserve()
+        with self.assertRaises(AdmissionDenied):
+            controller.reserve()
+        self.assertEqual(controller.stats()['queued'], 5)
+
+    def test_create_chat_completion_is_admitted_for_the_request_context(self):
+        controller = AdmissionController(self.limits(user=(1, 0)), max_wait=0)
+        with patch.object(openai_client_module, 'admission_controller', controller), \
+             patch.object(openai_client_module, 'client') as mock_client:
+            with request_context("alice", "town-square"):
+                openai_client_module.create_chat_completion([{"role": "user", "content": "Hello"}])
+                with self.assertRaises(AdmissionDenied):
+                    openai_client_module.generate_chat_response([{"role": "user", "content": "Hello again"}])
+            with request_context("bob", "town-square"):
+                openai_client_module.create_chat_completion([{"role": "user", "content": "Hello"}])
+
+        self.assertEqual(mock_client.chat.completions.create.call_count, 2)
+
+if __name__ == '__main__':
+    unittest.main()
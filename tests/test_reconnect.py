@@ -0,0 +1,220 @@
+import unittest
+from unittest.mock import patch, MagicMock, AsyncMock
+import sys
+import os
+import asyncio
+import json
+import threading
+import time
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.reconnect import ReconnectBackoff, EventTracker, missed_post_events
+import src.mattermost_client as mattermost_client_module
+from src.mattermost_client import MattermostClient
+from src.async_mattermost_client import AsyncMattermostClient
+
+def posted(post_id, seq=None, create_at=0):
+    event = {'event': 'posted', 'data': {'post': json.dumps({'id': post_id, 'create_at': create_at})}}
+    if seq is not None:
+        event['seq'] = seq
+    return event
+
+class TestReconnectBackoff(unittest.TestCase):
+
+    def test_delays_grow_up_to_the_cap_and_reset(self):
+        backoff = ReconnectBackoff(base_delay=1, max_delay=8)
+        for expected in (1, 2, 4, 8, 8):
+            delay = backoff.next_delay()
+            self.assertGreaterEqual(delay, expected / 2)
+            self.assertLessEqual(delay, expected)
+        backoff.reset()
+        self.assertLessEqual(backoff.next_delay(), 1)
+
+class TestEventTracker(unittest.TestCase):
+
+    def test_events_are_deduplicated_by_seq_per_connection(self):
+        tracker = EventTracker()
+        tracker.connection_opened()
+        self.assertFalse(tracker.is_duplicate({'event': 'hello', 'seq': 0}))
+        self.assertFalse(tracker.is_duplicate({'event': 'typing', 'seq': 1}))
+        self.assertTrue(tracker.is_duplicate({'event': 'typing', 'seq': 1}))
+        # A new connection numbers its events from 0 again
+        tracker.connection_opened()
+        self.assertFalse(tracker.is_duplicate({'event': 'hello', 'seq': 0}))
+
+    def test_posts_are_deduplicated_by_id(self):
+        tracker = EventTracker(max_posts=2)
+        self.assertFalse(tracker.is_duplicate(posted('post_1', seq=1)))
+        tracker.connection_opened()
+        self.assertTrue(tracker.is_duplicate(dict(posted('post_1'), catch_up=True)))
+        self.assertFalse(tracker.is_duplicate(posted('post_2')))
+        self.assertFalse(tracker.is_duplicate(posted('post_3')))
+        # The oldest post ID was forgotten
+        self.assertFalse(tracker.is_duplicate(posted('post_1')))
+        self.assertEqual(tracker.duplicates, 1)
+
+    def test_catch_up_starts_at_the_last_event(self):
+        tracker = EventTracker()
+        self.assertIsNone(tracker.catch_up_since(3600))
+        tracker.is_duplicate({'event': 'hello', 'seq': 0})
+        since = tracker.catch_up_since(3600)
+        self.assertAlmostEqual(since / 1000, time.time() - 5, delta=1)
+        self.assertIsNone(tracker.catch_up_since(0))
+        # Long outages only go back `max_age` seconds
+        now = time.time() + 7200
+        with patch('src.reconnect.time.time', return_value=now):
+            self.assertAlmostEqual(tracker.catch_up_since(3600) / 1000, now - 3600, delta=1)
+
+    def test_missed_post_events_keeps_new_posts_in_order(self):
+        posts = {'order': [], 'posts': {
+            'new_2': {'id': 'new_2', 'create_at': 300, 'type': ''},
+            'new_1': {'id': 'new_1', 'create_at': 200, 'type': ''},
+            'edited': {'id': 'edited', 'create_at': 50, 'update_at': 250, 'type': ''},
+            'deleted': {'id': 'deleted', 'create_at': 210, 'delete_at': 260, 'type': ''},
+            'joined': {'id': 'joined', 'create_at': 220, 'type': 'system_join_channel'},
+        }}
+        events = missed_post_events({'id': 'channel_id', 'type': 'D'}, posts, 100)
+        self.assertEqual([json.loads(event['data']['post'])['id'] for event in events], ['new_1', 'new_2'])
+        self.assertEqual(events[0]['data']['channel_type'], 'D')
+        self.assertEqual(events[0]['broadcast']['channel_id'], 'channel_id')
+
+class FakeWebSocketApp:
+    """
+    Plays a list of messages for every connection, then drops it.
+    """
+
+    connections = []
+
+    def __init__(self, url, header, on_open, on_message, on_error, on_close):
+        self.on_open = on_open
+        self.on_message = on_message
+        self.on_close = on_close
+        FakeWebSocketApp.connections.append(self)
+
+    def run_forever(self):
+        messages = FakeWebSocketApp.script[len(FakeWebSocketApp.connections) - 1]
+        self.on_open(self)
+        for message in messages:
+            self.on_message(self, json.dumps(message))
+        self.on_close(self, 1006, "dropped")
+
+    def close(self):
+        pass
+
+class TestWebSocketClient(unittest.TestCase):
+
+    def setUp(self):
+        FakeWebSocketApp.connections = []
+        patcher = patch.object(mattermost_client_module.websocket, 'WebSocketApp', FakeWebSocketApp)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = MattermostClient()
+        self.client.get_me = MagicMock(return_value={'id': 'bot'})
+        self.received = []
+        self.client.add_message_listener(self.received.append)
+        ws_client = self.client.ws_client
+        ws_client.backoff = ReconnectBackoff(base_delay=0.01, max_delay=0.01)
+        self.addCleanup(ws_client.close)
+
+    def test_reconnects_catches_up_and_delivers_each_post_once(self):
+        caught_up = threading.Event()
+        def get_missed_post_events(since):
+            caught_up.set()
+            return [dict(posted('post_1'), catch_up=True), dict(posted('post_2'), catch_up=True)]
+        self.client.get_missed_post_events = MagicMock(side_effect=get_missed_post_events)
+        FakeWebSocketApp.script = [
+            [{'event': 'hello', 'seq': 0}, posted('post_1', seq=1), posted('post_1', seq=1)],
+            [{'event': 'hello', 'seq': 0}],
+        ] + [[]] * 1000
+
+        self.client.connect()
+        self.assertTrue(caught_up.wait(5))
+        deadline = time.monotonic() + 5
+        while len(self.received) < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.client.ws_client.close()
+
+        self.assertGreaterEqual(len(FakeWebSocketApp.connections), 2)
+        post_ids = [json.loads(event['data']['post'])['id'] for event in self.received]
+        self.assertEqual(post_ids, ['post_1', 'post_2'])
+        self.assertFalse(self.client.ws_client.ready.is_set())
+
+    def test_connect_reports_a_connection_that_is_not_ready(self):
+        FakeWebSocketApp.script = [[]] * 100000
+        self.assertFalse(self.client.ws_client.connect(timeout=0.05))
+        self.client.ws_client.close()
+        self.assertIsNone(self.client.ws_client.ws_thread)
+
+class LateOpeningWebSocketApp:
+    """
+    Opens its socket only once `close` was called on the client, like a
+    connection set up just before the bot stopped. Closing it before then
+    has no effect, as with `websocket.WebSocketApp`.
+    """
+
+    instances = []
+
+    def __init__(self, url, header, on_open, on_message, on_error, on_close):
+        self.on_open = on_open
+        self.socket_open = False
+        LateOpeningWebSocketApp.instances.append(self)
+
+    def run_forever(self):
+        LateOpeningWebSocketApp.closing.wait(5)
+        self.socket_open = True
+        self.on_open(self)
+
+    def close(self):
+        self.socket_open = False
+
+class TestWebSocketClose(unittest.TestCase):
+
+    def test_connection_opened_while_closing_is_closed(self):
+        LateOpeningWebSocketApp.instances = []
+        LateOpeningWebSocketApp.closing = threading.Event()
+        client = MattermostClient()
+        client.get_me = MagicMock(return_value={'id': 'bot'})
+        ws_client = client.ws_client
+        with patch.object(mattermost_client_module.websocket, 'WebSocketApp', LateOpeningWebSocketApp):
+            self.assertFalse(ws_client.connect(timeout=0.01))
+            ws_thread = ws_client.ws_thread
+            closed = ws_client.closed
+            with patch.object(closed, 'set', side_effect=lambda: threading.Event.set(closed) or LateOpeningWebSocketApp.closing.set()):
+                ws_client.close(timeout=5)
+
+        self.assertFalse(ws_thread.is_alive())
+        self.assertEqual(len(LateOpeningWebSocketApp.instances), 1)
+        self.assertFalse(LateOpeningWebSocketApp.instances[0].socket_open)
+
+class TestAsyncCatchUp(unittest.TestCase):
+
+    def test_missed_posts_are_handled_once(self):
+        client = AsyncMattermostClient()
+        client.bot_id = 'bot'
+        channels = [
+            {'id': 'quiet', 'last_post_at': 10},
+            {'id': 'busy', 'last_post_at': 500, 'type': 'O'},
+        ]
+        posts = {'order': ['post_1', 'post_2'], 'posts': {
+            'post_1': {'id': 'post_1', 'create_at': 200},
+            'post_2': {'id': 'post_2', 'create_at': 300},
+        }}
+        client.get_json = AsyncMock(side_effect=[channels, posts])
+        received = []
+        client.add_message_listener(received.append)
+
+        async def run():
+            client.tracker.connection_opened()
+            await client.on_message(json.dumps(posted('post_1', seq=1)))
+            await client.catch_up(100)
+
+        asyncio.run(run())
+        self.assertEqual(client.get_json.await_count, 2)
+        self.assertIn('/api/v4/channels/busy/posts?since=100', client.get_json.await_args_list[1].args[0])
+        post_ids = [json.loads(event['data']['post'])['id'] for event in received]
+        self.assertEqual(post_ids, ['post_1', 'post_2'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,216 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import sys
+import os
+import asyncio
+import email.utils
+import time
+
+import openai
+import requests
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.resilience import (
+    Resilience, RetryBudget, CircuitBreaker, CircuitOpenError, Outcome, SUCCESS, parse_retry_after
+)
+import src.mattermost_client as mattermost_client_module
+from src.mattermost_client import MattermostClient
+from src.openai_client import classify_openai_error
+
+def fail_until(failures, result="ok", error=Exception("temporary")):
+    calls = []
+    def attempt():
+        calls.append(None)
+        if len(calls) <= failures:
+            raise error
+        return result
+    return attempt, calls
+
+RETRYABLE = lambda result, error: Outcome(True, True, None) if error else SUCCESS
+
+class TestResilience(unittest.TestCase):
+
+    def setUp(self):
+        patcher = patch('src.resilience.time.sleep')
+        self.sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_retries_with_growing_jittered_backoff(self):
+        resilience = Resilience("test", max_attempts=4, base_delay=1.0, max_delay=3.0)
+        attempt, calls = fail_until(3)
+
+        self.assertEqual(resilience.call("endpoint", attempt, RETRYABLE), "ok")
+        self.assertEqual(len(calls), 4)
+        delays = [call.args[0] for call in self.sleep.call_args_list]
+        for delay, ceiling in zip(delays, [1.0, 2.0, 3.0]):
+            self.assertTrue(0 <= delay <= ceiling)
+        self.assertEqual(resilience.stats()['retries'], 3)
+
+    def test_gives_up_after_max_attempts_and_raises_last_error(self):
+        resilience = Resilience("test", max_attempts=2)
+        attempt, calls = fail_until(5, error=ValueError("still down"))
+
+        with self.assertRaises(ValueError):
+            resilience.call("endpoint", attempt, RETRYABLE)
+        self.assertEqual(len(calls), 2)
+
+    def test_retry_after_is_honored_or_gives_up_when_too_long(self):
+        resilience = Resilience("test", max_attempts=3, max_delay=10)
+        responses = iter([Outcome(True, False, 4.0), SUCCESS])
+        self.assertEqual(resilience.call("endpoint", lambda: "ok", lambda result, error: next(responses)), "ok")
+        self.sleep.assert_called_once_with(4.0)
+
+        attempt, calls = fail_until(1)
+        with self.assertRaises(Exception):
+            resilience.call("endpoint", attempt, lambda result, error: Outcome(True, False, 60.0) if error else SUCCESS)
+        self.assertEqual(len(calls), 1)
+
+    def test_retry_budget_limits_retries(self):
+        resilience = Resilience("test", max_attempts=3, budget=RetryBudget(ratio=0.0, min_per_second=0.0001, capacity=2))
+        for _ in range(3):
+            attempt, calls = fail_until(5)
+            with self.assertRaises(Exception):
+                resilience.call("endpoint", attempt, RETRYABLE)
+
+        # Two retries were in the budget, the rest of the calls fail after one attempt
+        self.assertEqual(resilience.stats()['retries'], 2)
+        self.assertGreater(resilience.stats()['budget_exhausted'], 0)
+
+    def test_circuit_opens_fails_fast_and_recovers(self):
+        resilience = Resilience("test", max_attempts=1, failure_threshold=2, reset_timeout=30)
+        for _ in range(2):
+            attempt, _ = fail_until(1)
+            with self.assertRaises(Exception):
+                resilience.call("chat", attempt, RETRYABLE)
+
+        attempt, calls = fail_until(0)
+        with self.assertRaises(CircuitOpenError):
+            resilience.call("chat", attempt, RETRYABLE)
+        self.assertEqual(calls, [])
+        # Other endpoints have their own circuit
+        self.assertEqual(resilience.call("images", attempt, RETRYABLE), "ok")
+        self.assertEqual(resilience.stats()['open_circuits'], ["chat"])
+
+        # After the reset timeout one trial call goes through and closes the circuit
+        breaker = resilience.breaker("chat")
+        breaker.opened_at -= 31
+        self.assertEqual(resilience.call("chat", attempt, RETRYABLE), "ok")
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_half_open_allows_a_single_trial(self):
+        breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0)
+        breaker.record_failure()
+        breaker.before_call()
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+    def test_cancelled_probe_does_not_leave_the_circuit_stuck(self):
+        resilience = Resilience("test", failure_threshold=1, reset_timeout=0)
+        breaker = resilience.breaker("POST /posts")
+        breaker.record_failure()
+
+        async def hang():
+            await asyncio.sleep(10)
+
+        async def run():
+            probe = asyncio.create_task(resilience.async_call("POST /posts", hang, RETRYABLE))
+            await asyncio.sleep(0)
+            self.assertTrue(breaker.probing)
+            probe.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await probe
+
+            async def ok():
+                return "ok"
+            return await resilience.async_call("POST /posts", ok, RETRYABLE)
+
+        self.assertEqual(asyncio.run(run()), "ok")
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+        # Same for a sync probe interrupted by a BaseException
+        breaker.record_failure()
+        def interrupted():
+            raise KeyboardInterrupt()
+        with self.assertRaises(KeyboardInterrupt):
+            resilience.call("POST /posts", interrupted, RETRYABLE)
+        self.assertEqual(resilience.call("POST /posts", lambda: "ok", RETRYABLE), "ok")
+
+    def test_parse_retry_after(self):
+        self.assertEqual(parse_retry_after("7"), 7.0)
+        self.assertIsNone(parse_retry_after(None))
+        self.assertIsNone(parse_retry_after("soon"))
+        date = email.utils.formatdate(time.time() + 30, usegmt=True)
+        self.assertAlmostEqual(parse_retry_after(date), 30, delta=2)
+
+class TestClientResilience(unittest.TestCase):
+
+    def setUp(self):
+        patcher = patch('src.resilience.time.sleep')
+        self.sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch.object(mattermost_client_module, 'resilience', Resilience("Mattermost", max_attempts=3))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def response(self, status, headers=None):
+        response = MagicMock(status_code=status, headers=headers or {})
+        response.json.return_value = {'id': 'post_id'}
+        return response
+
+    def test_post_message_retries_rate_limited_and_unavailable_responses(self):
+        client = MattermostClient()
+        client.session = MagicMock()
+        client.session.post.side_effect = [
+            self.response(429, {'Retry-After': '2'}),
+            self.response(503),
+            self.response(201),
+        ]
+
+        self.assertEqual(client.post_message('channel_id', 'Hello'), {'id': 'post_id'})
+        self.assertEqual(client.session.post.call_count, 3)
+        self.assertEqual(self.sleep.call_args_list[0].args[0], 2.0)
+
+    def test_only_idempotent_requests_are_resent_after_errors(self):
+        client = MattermostClient()
+        client.session = MagicMock()
+        client.session.post.side_effect = requests.ReadTimeout("timed out")
+        client.session.put.side_effect = [requests.ReadTimeout("timed out"), self.response(200)]
+
+        self.assertIsNone(client.upload_files('channel_id', [('image.png', b'png', 'image/png')]))
+        self.assertEqual(client.session.post.call_count, 1)
+        self.assertEqual(client.patch_post('post_id', 'Hello'), {'id': 'post_id'})
+        self.assertEqual(client.session.put.call_count, 2)
+
+    def test_posts_are_resent_with_the_same_pending_post_id(self):
+        client = MattermostClient()
+        client.session = MagicMock()
+        client.session.post.side_effect = [requests.ReadTimeout("timed out"), self.response(201)]
+
+        self.assertEqual(client.post_message('channel_id', 'Hello'), {'id': 'post_id'})
+        payloads = [call.kwargs['json'] for call in client.session.post.call_args_list]
+        self.assertEqual(len(payloads), 2)
+        self.assertEqual(payloads[0]['pending_post_id'], payloads[1]['pending_post_id'])
+
+    def test_openai_errors_are_classified(self):
+        request = MagicMock()
+        def status_error(cls, status, headers=None, code=None):
+            response = MagicMock(status_code=status, headers=headers or {}, request=request)
+            body = {'code': code} if code else None
+            return cls("error", response=response, body=body)
+
+        self.assertEqual(classify_openai_error("reply", None), SUCCESS)
+        self.assertEqual(
+            classify_openai_error(None, status_error(openai.RateLimitError, 429, {'retry-after': '3'})),
+            Outcome(True, False, 3.0)
+        )
+        self.assertFalse(classify_openai_error(None, status_error(openai.RateLimitError, 429, code='insufficient_quota')).retryable)
+        self.assertEqual(classify_openai_error(None, status_error(openai.InternalServerError, 500)), Outcome(True, True, None))
+        self.assertFalse(classify_openai_error(None, status_error(openai.BadRequestError, 400)).retryable)
+        self.assertEqual(classify_openai_error(None, openai.APITimeoutError(request=request)), Outcome(True, True, None))
+
+if __name__ == '__main__':
+    unittest.main()
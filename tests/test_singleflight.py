@@ -0,0 +1,172 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import sys
+import os
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.singleflight import SingleFlight
+import src.openai_client as openai_client_module
+
+def wait_for_waiters(flights, key, count):
+    while key not in flights.in_flight() or flights.in_flight()[key]['waiters'] < count:
+        threading.Event().wait(0.01)
+
+class TestSingleFlight(unittest.TestCase):
+
+    def test_concurrent_calls_share_one_call(self):
+        flights = SingleFlight("test")
+        release = threading.Event()
+        calls = []
+
+        def call():
+            calls.append(None)
+            release.wait(5)
+            return "result"
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            futures = [executor.submit(flights.do, "key", call) for _ in range(4)]
+            wait_for_waiters(flights, "key", 3)
+            self.assertEqual(list(flights.in_flight()), ["key"])
+            release.set()
+            results = [future.result() for future in futures]
+
+        self.assertEqual(results, ["result"] * 4)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(flights.stats(), {'calls': 1, 'shared': 3, 'in_flight': {}})
+
+    def test_error_goes_to_its_caller_and_a_waiter_calls_again(self):
+        flights = SingleFlight("test")
+        release = threading.Event()
+        calls = []
+
+        def call():
+            calls.append(None)
+            release.wait(5)
+            if len(calls) == 1:
+                raise RuntimeError("refused")
+            return "result"
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            first = executor.submit(flights.do, "key", call)
+            wait_for_waiters(flights, "key", 0)
+            second = executor.submit(flights.do, "key", call)
+            wait_for_waiters(flights, "key", 1)
+            release.set()
+            with self.assertRaises(RuntimeError):
+                first.result()
+            self.assertEqual(second.result(), "result")
+        self.assertEqual(len(calls), 2)
+
+    def test_async_calls_share_one_call(self):
+        flights = SingleFlight("test")
+        calls = []
+
+        async def call():
+            calls.append(None)
+            await asyncio.sleep(0.01)
+            return "result"
+
+        async def run():
+            return await asyncio.gather(*(flights.do_async("key", call) for _ in range(3)))
+
+        self.assertEqual(asyncio.run(run()), ["result"] * 3)
+        self.assertEqual(len(calls), 1)
+        # A later call is made again
+        asyncio.run(flights.do_async("key", call))
+        self.assertEqual(len(calls), 2)
+
+class TestChatCoalescing(unittest.TestCase):
+
+    def setUp(self):
+        patcher = patch.object(openai_client_module, 'chat_flights', SingleFlight("chat"))
+        self.flights = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.release = threading.Event()
+
+    def completion(self, *args, **kwargs):
+        self.release.wait(5)
+        response = MagicMock()
+        response.choices[0].message.content = " Paris "
+        return response
+
+    def test_identical_first_turn_questions_share_one_completion(self):
+        messages = [{"role": "user", "content": "Capital of France?"}]
+        with patch.object(openai_client_module, 'create_chat_completion', side_effect=self.completion) as mock_create:
+            with ThreadPoolExecutor(max_workers=3) as executor:
+                futures = [executor.submit(openai_client_module.generate_chat_response, messages) for _ in range(2)]
+                key = openai_client_module.get_response_cache_key(messages)
+                wait_for_waiters(self.flights, key, 1)
+                # A streamed request joins too, and gets the reply in one chunk
+                stream = executor.submit(lambda: list(openai_client_module.stream_chat_response(messages)))
+                wait_for_waiters(self.flights, key, 2)
+                self.release.set()
+                self.assertEqual([future.result() for future in futures], ["Paris", "Paris"])
+                self.assertEqual(stream.result(), ["Paris"])
+
+        self.assertEqual(mock_create.call_count, 1)
+
+    def test_interrupted_stream_raises_and_is_not_shared(self):
+        messages = [{"role": "user", "content": "Capital of France?"}]
+        def chunk(content):
+            chunk = MagicMock()
+            chunk.choices[0].delta.content = content
+            return chunk
+        def stream():
+            yield chunk("Par")
+            raise ConnectionError("stream dropped")
+        received = []
+        with patch.object(openai_client_module, 'create_chat_completion', return_value=stream()):
+            with self.assertRaises(openai_client_module.StreamInterrupted):
+                for content in openai_client_module.stream_chat_response(messages):
+                    received.append(content)
+
+        self.assertEqual(received, ["Par"])
+        key = openai_client_module.get_response_cache_key(messages)
+        self.assertIsNone(openai_client_module.get_cached_response(key))
+        self.assertNotIn(key, self.flights.in_flight())
+
+    def test_interrupted_async_stream_raises_and_is_not_shared(self):
+        messages = [{"role": "user", "content": "Capital of France?"}]
+        def chunk(content):
+            chunk = MagicMock()
+            chunk.choices[0].delta.content = content
+            return chunk
+        async def stream():
+            yield chunk("Par")
+            raise ConnectionError("stream dropped")
+        async def completion(messages, stream=False):
+            return stream_chunks
+        received = []
+        async def run():
+            async for content in openai_client_module.async_stream_chat_response(messages):
+                received.append(content)
+        stream_chunks = stream()
+        with patch.object(openai_client_module, 'async_create_chat_completion', side_effect=completion):
+            with self.assertRaises(openai_client_module.StreamInterrupted):
+                asyncio.run(run())
+
+        self.assertEqual(received, ["Par"])
+        key = openai_client_module.get_response_cache_key(messages)
+        self.assertIsNone(openai_client_module.get_cached_response(key))
+        self.assertNotIn(key, self.flights.in_flight())
+
+    def test_follow_up_questions_are_not_coalesced(self):
+        self.release.set()
+        messages = [
+            {"role": "user", "content": "Hello"},
+            {"role": "assistant", "content": "Hi!"},
+            {"role": "user", "content": "Capital of France?"},
+        ]
+        with patch.object(openai_client_module, 'create_chat_completion', side_effect=self.completion) as mock_create:
+            openai_client_module.generate_chat_response(messages)
+
+        mock_create.assert_called_once()
+        self.assertEqual(self.flights.stats()['calls'], 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import src.tokenizer as tokenizer_module
+from src.tokenizer import count_tokens, count_message_tokens, get_context_window, get_prompt_budget
+
+class TestTokenizer(unittest.TestCase):
+
+    def test_context_window_matches_longest_prefix(self):
+        with patch.object(tokenizer_module, 'OPENAI_CONTEXT_WINDOW', 0):
+            self.assertEqual(get_context_window('gpt-4o-2024-08-06'), 128000)
+            self.assertEqual(get_context_window('gpt-4-32k-0613'), 32768)
+            self.assertEqual(get_context_window('gpt-4'), 8192)
+            self.assertEqual(get_context_window('unknown-model'), tokenizer_module.DEFAULT_CONTEXT_WINDOW)
+
+    def test_context_window_override(self):
+        with patch.object(tokenizer_module, 'OPENAI_CONTEXT_WINDOW', 4096):
+            self.assertEqual(get_context_window('gpt-4o'), 4096)
+
+    def test_prompt_budget_leaves_room_for_reply(self):
+        with patch.object(tokenizer_module, 'OPENAI_CONTEXT_WINDOW', 4096), \
+             patch.object(tokenizer_module, 'OPENAI_MAX_TOKENS', 1000):
+            self.assertEqual(get_prompt_budget(), 4096 - 1000 - tokenizer_module.TOKENS_PER_REPLY)
+
+    def test_estimates_without_tokenizer(self):
+        with patch.object(tokenizer_module, 'get_encoding', return_value=None):
+            self.assertEqual(count_tokens(''), 0)
+            self.assertEqual(count_tokens('x' * 40), 11)
+            self.assertEqual(
+                count_message_tokens({'role': 'user', 'content': 'x' * 40}),
+                11 + tokenizer_module.TOKENS_PER_MESSAGE
+            )
+
+if __name__ == '__main__':
+    unittest.main()
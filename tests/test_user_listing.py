@@ -0,0 +1,80 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import sys
+import os
+import threading
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import requests
+from src.metadata_cache import MetadataCache
+import src.mattermost_client as mattermost_client_module
+from src.mattermost_client import MattermostClient
+
+class TestUserListing(unittest.TestCase):
+
+    def setUp(self):
+        patcher = patch.object(mattermost_client_module, 'metadata_cache', MetadataCache({'user': 300}))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = MattermostClient()
+        self.client.session = MagicMock()
+        self.lock = threading.Lock()
+        self.pages = []
+
+    def serve_users(self, total):
+        def get(url, params=None, **kwargs):
+            with self.lock:
+                self.pages.append(params['page'])
+            start = params['page'] * params['per_page']
+            users = [{'id': f"user_{i}"} for i in range(start, min(start + params['per_page'], total))]
+            response = MagicMock(status_code=200, headers={})
+            response.json.return_value = users
+            return response
+        self.client.session.get.side_effect = get
+
+    def test_iter_users_pages_until_a_short_page(self):
+        self.serve_users(5)
+        users = list(self.client.iter_users(per_page=2))
+        self.assertEqual([user['id'] for user in users], [f"user_{i}" for i in range(5)])
+        self.assertEqual(self.pages, [0, 1, 2])
+
+    def test_iter_users_stops_on_an_empty_last_page(self):
+        self.serve_users(4)
+        self.assertEqual(len(list(self.client.iter_users(per_page=2))), 4)
+        self.assertEqual(self.pages, [0, 1, 2])
+
+    def test_concurrent_pages_are_yielded_in_order(self):
+        self.serve_users(23)
+        users = list(self.client.iter_users(per_page=3, concurrency=4))
+        self.assertEqual([user['id'] for user in users], [f"user_{i}" for i in range(23)])
+        # Pages past the end may have been requested, but not many
+        self.assertLessEqual(max(self.pages), 7 + 3)
+
+    def test_get_users_returns_none_on_failure(self):
+        response = MagicMock(status_code=403, headers={}, text="Forbidden")
+        response.raise_for_status.side_effect = requests.HTTPError("403")
+        self.client.session.get.return_value = response
+        self.assertIsNone(self.client.get_users())
+
+    def test_get_users_by_ids_batches_and_uses_the_cache(self):
+        def post(url, json=None, **kwargs):
+            response = MagicMock(status_code=200, headers={})
+            response.json.return_value = [{'id': user_id} for user_id in json if user_id != 'unknown']
+            return response
+        self.client.session.post.side_effect = post
+        mattermost_client_module.metadata_cache.set('user', 'cached', {'id': 'cached'})
+
+        with patch.object(mattermost_client_module, 'USERS_BY_IDS_BATCH_SIZE', 2):
+            users = self.client.get_users_by_ids(['a', 'cached', 'b', 'unknown', 'c', 'a'])
+
+        self.assertEqual([user['id'] for user in users], ['a', 'cached', 'b', 'c'])
+        self.assertEqual(self.client.session.post.call_count, 2)
+        self.assertTrue(self.client.session.post.call_args_list[0].args[0].endswith('/api/v4/users/ids'))
+
+        self.client.get_users_by_ids(['a', 'b', 'c'])
+        self.assertEqual(self.client.session.post.call_count, 2)
+
+if __name__ == '__main__':
+    unittest.main()